@@ -1 +1,3 @@
 """FastAPI application package."""
+# Antes que cualquier otro módulo de la app: carga .env una sola vez
+from . import settings  # noqa: F401
@@ -0,0 +1,216 @@
+"""Control de admisión por grupo de rutas: límite de peticiones en curso y cola acotada.
+
+Cuando un grupo está lleno (o la espera en cola supera su timeout) la petición
+se rechaza al instante con `503` y `Retry-After`, en lugar de acumularse hasta
+agotar el event loop o el threadpool. Las rutas baratas (health checks,
+métricas, estadísticas, estáticos, webhook de BFL) no pasan por ningún grupo:
+son el carril reservado.
+
+Configuración por grupo (`BFL`, `OPENAI`, `GEMINI`, `RUNWARE`, `IMAGES`):
+`ADMISSION_<G>_MAX_IN_FLIGHT`, `ADMISSION_<G>_MAX_QUEUE` y `ADMISSION_<G>_QUEUE_TIMEOUT`.
+"""
+import asyncio
+import json
+import math
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from anyio.to_thread import current_default_thread_limiter
+
+from .settings import env_bool, env_float, env_int
+
+ADMISSION_ENABLED = env_bool("ADMISSION_ENABLED", True)
+
+# Grupo -> (en curso, cola, timeout de cola en s). Los de OpenAI quedan por debajo
+# del threadpool (40 hilos por defecto) para que siempre haya hilos libres.
+DEFAULT_LIMITS: Dict[str, Tuple[int, int, float]] = {
+    "bfl": (64, 128, 10.0),
+    "openai": (24, 48, 10.0),
+    "gemini": (128, 256, 5.0),
+    "runware": (64, 128, 10.0),
+    "images": (48, 96, 10.0),
+}
+
+# (métodos o None para todos, prefijo de ruta, grupo). La primera regla que encaja decide;
+# grupo None = carril reservado, sin límite.
+RULES: List[Tuple[Optional[set], str, Optional[str]]] = [
+    (None, "/bfl/webhook", None),
+    ({"GET", "HEAD"}, "/bfl/jobs/", None),
+    (None, "/bfl/", "bfl"),
+    (None, "/image/", "openai"),
+    (None, "/gemini/cache/", None),
+    (None, "/gemini/", "gemini"),
+    (None, "/runware/", "runware"),
+    ({"POST"}, "/images/", "images"),
+]
+
+
+class Rejected(Exception):
+    def __init__(self, group: str, reason: str, retry_after: int):
+        self.group = group
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionGate:
+    """Semáforo FIFO con cola acotada y espera máxima."""
+
+    def __init__(self, name: str, max_in_flight: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        # Duración media (EWMA) de las peticiones admitidas, para el Retry-After
+        self._avg_duration: Optional[float] = None
+        # Métricas
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+        self.wait_max = 0.0
+
+    @classmethod
+    def from_env(cls, name: str) -> "AdmissionGate":
+        prefix = f"ADMISSION_{name.upper()}"
+        in_flight, queue, timeout = DEFAULT_LIMITS.get(name, (64, 128, 10.0))
+        return cls(
+            name,
+            max_in_flight=env_int(f"{prefix}_MAX_IN_FLIGHT", in_flight),
+            max_queue=env_int(f"{prefix}_MAX_QUEUE", queue),
+            queue_timeout=env_float(f"{prefix}_QUEUE_TIMEOUT", timeout),
+        )
+
+    def retry_after(self) -> int:
+        # Aproximación: lo que tardaría en vaciarse la cola actual
+        avg = self._avg_duration or 1.0
+        backlog = (len(self._waiters) + 1) / self.max_in_flight
+        return max(1, min(60, math.ceil(avg * backlog)))
+
+    async def acquire(self) -> None:
+        if self._in_flight < self.max_in_flight and not self._waiters:
+            self._in_flight += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_full += 1
+            raise Rejected(self.name, "cola llena", self.retry_after())
+
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if fut.done() and not fut.cancelled():
+                # El turno llegó justo al vencer el timeout: se aprovecha
+                pass
+            else:
+                fut.cancel()
+                self._discard(fut)
+                self.rejected_timeout += 1
+                raise Rejected(self.name, "tiempo de espera agotado", self.retry_after())
+        except asyncio.CancelledError:
+            # Cliente desconectado mientras esperaba: devolver el turno si ya se había cedido
+            if fut.done() and not fut.cancelled():
+                self.release()
+            else:
+                fut.cancel()
+                self._discard(fut)
+            raise
+        self.wait_max = max(self.wait_max, time.monotonic() - started)
+        self.admitted += 1
+
+    def _discard(self, fut: asyncio.Future) -> None:
+        try:
+            self._waiters.remove(fut)
+        except ValueError:
+            pass
+
+    def release(self, duration: Optional[float] = None) -> None:
+        if duration is not None:
+            self._avg_duration = duration if self._avg_duration is None else 0.2 * duration + 0.8 * self._avg_duration
+        # El hueco pasa directamente al siguiente en cola (FIFO) sin bajar el contador
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self._in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self._in_flight,
+            "queued": len(self._waiters),
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected_full": self.rejected_full,
+            "rejected_timeout": self.rejected_timeout,
+            "wait_max_ms": round(self.wait_max * 1000, 3),
+            "avg_duration_ms": round(self._avg_duration * 1000, 1) if self._avg_duration is not None else None,
+        }
+
+
+gates: Dict[str, AdmissionGate] = {name: AdmissionGate.from_env(name) for name in DEFAULT_LIMITS}
+
+
+def group_for(method: str, path: str) -> Optional[str]:
+    for methods, prefix, group in RULES:
+        if path.startswith(prefix) and (methods is None or method in methods):
+            return group
+    return None
+
+
+def configure_threadpool() -> None:
+    """`THREADPOOL_SIZE`: hilos del threadpool de anyio (por defecto 40)."""
+    size = env_int("THREADPOOL_SIZE", 0)
+    if size > 0:
+        current_default_thread_limiter().total_tokens = size
+
+
+class AdmissionMiddleware:
+    """Middleware ASGI: aplica el grupo de admisión de la ruta o responde 503."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ADMISSION_ENABLED:
+            return await self.app(scope, receive, send)
+        group = group_for(scope["method"], scope["path"])
+        gate = gates.get(group) if group else None
+        if gate is None:
+            return await self.app(scope, receive, send)
+
+        try:
+            await gate.acquire()
+        except Rejected as e:
+            body = json.dumps({"detail": f"Servicio saturado ({e.group}: {e.reason}); reintenta más tarde"}, ensure_ascii=False).encode("utf-8")
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(e.retry_after).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.release(time.monotonic() - started)
+
+
+def stats() -> Dict[str, Any]:
+    limiter = current_default_thread_limiter()
+    return {
+        "enabled": ADMISSION_ENABLED,
+        "threadpool": {"busy": limiter.borrowed_tokens, "capacity": limiter.total_tokens},
+        "groups": {name: g.stats() for name, g in gates.items()},
+    }
@@ -0,0 +1,352 @@
+"""Trabajos asíncronos de BFL: un único poller asyncio multiplexa todos los polling_url.
+
+Con webhook activado, los trabajos esperan el callback de BFL y solo se
+consultan por polling si no llega antes de `webhook_fallback` segundos.
+"""
+import asyncio
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from .http_clients import get_client
+from .metrics import bfl_polls, phase
+from .resilience import CircuitOpen, breakers, retry
+from .scheduler import INTERACTIVE, raise_for_rate_limit, schedule
+from .tracing import activate, capture, current_span, span
+
+# Estados locales del trabajo (distintos del 'status' que reporta BFL)
+PENDING = "pending"
+WAITING = "waiting"
+POLLING = "polling"
+SAVING = "saving"
+READY = "ready"
+FAILED = "failed"
+
+FINAL_STATES = {READY, FAILED}
+ACTIVE_STATES = {WAITING, POLLING}
+
+READY_STATUSES = {"Ready", "SUCCESS"}
+FAILED_STATUSES = {"Failed", "Error", "FAILED", "ERROR"}
+
+
+class Job:
+    def __init__(self, job_id: str, poll_headers: Dict[str, str], finalize: Callable[[str], Awaitable[Any]]):
+        self.id = job_id
+        self.status = PENDING
+        self.bfl_status: Optional[str] = None
+        self.progress: Optional[float] = None
+        self.request_id: Optional[str] = None
+        self.polling_url: Optional[str] = None
+        self.attempts = 0
+        self.result: Any = None
+        self.error: Optional[Dict[str, Any]] = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.poll_headers = poll_headers
+        self.finalize = finalize
+        # Planificación del polling (backoff adaptativo)
+        self.interval = 0.0
+        self.next_poll_at = 0.0
+        self.deadline = 0.0
+        self._done = asyncio.Event()
+        self._listeners: List[asyncio.Queue] = []
+        # Traza de la petición que creó el trabajo: el poller la retoma en cada consulta
+        self.trace = capture()
+
+    @property
+    def done(self) -> bool:
+        return self.status in FINAL_STATES
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "bfl_status": self.bfl_status,
+            "progress": self.progress,
+            "request_id": self.request_id,
+            "attempts": self.attempts,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+    def _notify(self) -> None:
+        self.updated_at = time.time()
+        snap = self.snapshot()
+        for q in list(self._listeners):
+            q.put_nowait(snap)
+        if self.done:
+            self._done.set()
+
+    def subscribe(self) -> asyncio.Queue:
+        q: asyncio.Queue = asyncio.Queue()
+        q.put_nowait(self.snapshot())
+        self._listeners.append(q)
+        return q
+
+    def unsubscribe(self, q: asyncio.Queue) -> None:
+        try:
+            self._listeners.remove(q)
+        except ValueError:
+            pass
+
+    async def wait(self) -> Any:
+        """Espera el final del trabajo; re-lanza el error como HTTPException."""
+        await self._done.wait()
+        if self.error is not None:
+            raise HTTPException(status_code=self.error["status_code"], detail=self.error["detail"])
+        return self.result
+
+
+class JobManager:
+    def __init__(
+        self,
+        min_interval: float = 1.0,
+        max_interval: float = 3.0,
+        backoff: float = 1.5,
+        timeout: float = 60.0,
+        retention: float = 3600.0,
+        webhook_fallback: float = 30.0,
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.timeout = timeout
+        self.retention = retention
+        self.webhook_fallback = webhook_fallback
+        self._jobs: Dict[str, Job] = {}
+        self._by_request: Dict[str, str] = {}
+        # Callbacks que llegan antes de que el submit devuelva el id
+        self._early: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._background: set = set()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def create(
+        self,
+        submit: Callable[[], Awaitable[Any]],
+        poll_headers: Dict[str, str],
+        finalize: Callable[[str], Awaitable[Any]],
+        webhook: bool = False,
+    ) -> Job:
+        """Registra un trabajo y lanza el submit en segundo plano.
+
+        `submit` devuelve `(polling_url, request_id)`; `finalize` recibe la URL
+        del resultado y devuelve la respuesta final (descarga + guardado).
+        """
+        self._ensure_poller()
+        job = Job(uuid.uuid4().hex, poll_headers, finalize)
+        self._jobs[job.id] = job
+        self._spawn(self._submit(job, submit, webhook))
+        return job
+
+    def handle_webhook(self, request_id: str, data: Dict[str, Any]) -> bool:
+        """Aplica un callback de BFL al trabajo correspondiente. Devuelve si hubo match."""
+        job = self._jobs.get(self._by_request.get(request_id, ""))
+        if job is None:
+            self._early[request_id] = {"data": data, "at": time.time()}
+            return False
+        self._apply(job, data)
+        return True
+
+    async def shutdown(self) -> None:
+        tasks = [t for t in [self._task, *self._background] if t is not None]
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._background.clear()
+
+    def _ensure_poller(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._wake = asyncio.Event()
+            self._task = loop.create_task(self._poller())
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.get_running_loop().create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    def _fail(self, job: Job, status_code: int, detail: Any) -> None:
+        job.status = FAILED
+        job.error = {"status_code": status_code, "detail": detail}
+        job._notify()
+
+    def _schedule(self, job: Job, changed: bool) -> None:
+        # Backoff adaptativo: si el estado avanza se vuelve a consultar pronto,
+        # si sigue igual el intervalo crece hasta max_interval
+        if changed:
+            job.interval = self.min_interval
+        else:
+            job.interval = min(self.max_interval, max(self.min_interval, job.interval * self.backoff))
+        job.next_poll_at = time.monotonic() + job.interval
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _submit(self, job: Job, submit: Callable[[], Awaitable[Any]], webhook: bool) -> None:
+        try:
+            job.polling_url, job.request_id = await submit()
+        except HTTPException as e:
+            self._fail(job, e.status_code, e.detail)
+            return
+        except Exception as e:
+            self._fail(job, 502, f"Error de red al llamar a BFL: {e}")
+            return
+        if job.request_id:
+            self._by_request[job.request_id] = job.id
+        if webhook:
+            # El polling queda solo como respaldo si el callback no llega a tiempo
+            job.status = WAITING
+            job.deadline = time.monotonic() + self.webhook_fallback + self.timeout
+            job.interval = self.min_interval
+            job.next_poll_at = time.monotonic() + self.webhook_fallback
+        else:
+            job.status = POLLING
+            job.deadline = time.monotonic() + self.timeout
+            self._schedule(job, changed=True)
+        job._notify()
+        early = self._early.pop(job.request_id or "", None)
+        if early is not None:
+            self._apply(job, early["data"])
+        elif self._wake is not None:
+            self._wake.set()
+
+    async def _poller(self) -> None:
+        while True:
+            now = time.monotonic()
+            due = [
+                j for j in self._jobs.values()
+                if j.status in ACTIVE_STATES and j.next_poll_at <= now
+            ]
+            # Cada consulta corre en su propia tarea para que una lenta no retrase al resto
+            for job in due:
+                job.next_poll_at = float("inf")
+                self._spawn(self._poll(job))
+            self._purge()
+
+            # Sin trabajos pendientes se despierta de vez en cuando para purgar
+            upcoming = [j.next_poll_at for j in self._jobs.values() if j.status in ACTIVE_STATES]
+            delay = max(0.0, min(upcoming) - time.monotonic()) if upcoming else 60.0
+            self._wake.clear()
+            # asyncio.wait y no wait_for: en 3.11 wait_for se traga el cancel de shutdown()
+            # si el evento se activa a la vez, y el poller seguiría vivo
+            waiter = asyncio.ensure_future(self._wake.wait())
+            try:
+                await asyncio.wait({waiter}, timeout=delay)
+            finally:
+                waiter.cancel()
+
+    async def _poll(self, job: Job) -> None:
+        with activate(job.trace), span("bfl.poll_iteration", job_id=job.id):
+            await self._poll_once(job)
+
+    async def _poll_once(self, job: Job) -> None:
+        if job.status not in ACTIVE_STATES:
+            return
+        if time.monotonic() >= job.deadline:
+            self._fail(job, 503, {"error": "El procesamiento está tardando demasiado.", "status": "Timeout", "request_id": job.request_id})
+            return
+
+        if job.status == WAITING:
+            job.status = POLLING
+            job._notify()
+        job.attempts += 1
+        current_span().set_attribute("attempt", job.attempts)
+
+        async def send():
+            bfl_polls.inc()
+            with phase("bfl", "poll") as p:
+                r = await get_client("bfl").get(job.polling_url, headers=job.poll_headers)
+                p.status = r.status_code
+            raise_for_rate_limit(r)
+            return r
+
+        # El poller no hereda la prioridad de ninguna petición: terminar trabajos ya aceptados va primero.
+        # Consultar el estado es idempotente: los fallos de red y 5xx se reintentan
+        try:
+            poll_response = await retry(lambda: schedule("bfl", lambda: breakers["bfl"].call(send), INTERACTIVE))
+        except CircuitOpen:
+            # BFL se da por caído: se vuelve a consultar más tarde y decide el deadline
+            self._schedule(job, changed=False)
+            return
+        except HTTPException as e:
+            self._fail(job, e.status_code, e.detail)
+            return
+        except Exception as e:
+            self._fail(job, 502, f"Error durante el polling: {e}")
+            return
+
+        if poll_response.status_code != 200:
+            try:
+                details = poll_response.json()
+            except Exception:
+                details = poll_response.text
+            self._fail(job, poll_response.status_code, {"error": "Error en polling", "details": details})
+            return
+
+        try:
+            poll_data = poll_response.json()
+        except Exception:
+            self._fail(job, 502, "Respuesta de polling inválida")
+            return
+
+        current_span().set_attribute("bfl.status", str(poll_data.get("status")))
+        self._apply(job, poll_data)
+
+    def _apply(self, job: Job, poll_data: Dict[str, Any]) -> None:
+        # Común a polling y webhook; el primero que llega gana
+        if job.status not in ACTIVE_STATES:
+            return
+        status = poll_data.get("status")
+        progress = poll_data.get("progress")
+        changed = status != job.bfl_status or progress != job.progress
+        job.bfl_status = status
+        job.progress = progress
+
+        if status in READY_STATUSES:
+            result = poll_data.get("result") or {}
+            image_result_url = result.get("sample")
+            if not image_result_url:
+                self._fail(job, 502, {"error": "Procesado pero sin URL de imagen.", "details": poll_data})
+                return
+            job.status = SAVING
+            job._notify()
+            self._spawn(self._finalize(job, image_result_url))
+        elif status in FAILED_STATUSES:
+            self._fail(job, 502, {"error": f"Falló el procesamiento en BFL (Status: {status}).", "details": poll_data.get("details") or poll_data})
+        elif job.status == POLLING:
+            self._schedule(job, changed)
+            if changed:
+                job._notify()
+        elif changed:
+            job._notify()
+
+    async def _finalize(self, job: Job, image_result_url: str) -> None:
+        with activate(job.trace), span("bfl.finalize", job_id=job.id) as span_:
+            try:
+                job.result = await job.finalize(image_result_url)
+            except HTTPException as e:
+                span_.record_exception(e)
+                self._fail(job, e.status_code, e.detail)
+                return
+            except Exception as e:
+                span_.record_exception(e)
+                self._fail(job, 500, f"Imagen generada pero no se pudo guardar localmente: {e}")
+                return
+        job.status = READY
+        job._notify()
+
+    def _purge(self) -> None:
+        cutoff = time.time() - self.retention
+        for job in [j for j in self._jobs.values() if j.done and j.updated_at < cutoff]:
+            self._jobs.pop(job.id, None)
+            self._by_request.pop(job.request_id or "", None)
+        for request_id in [k for k, v in self._early.items() if v["at"] < cutoff]:
+            self._early.pop(request_id, None)
@@ -0,0 +1,174 @@
+"""Descarga de imágenes resultado: streaming a fichero temporal y alta en el almacén por contenido."""
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Set, Tuple
+
+import httpx
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from .metrics import download_bytes, observe_phase, phase
+from .resilience import TRANSIENT_STATUS, TransientError, retry
+from .settings import env_bool, env_int
+from .storage import ImageMeta, StoredImage, store
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_IMAGE_TYPES = {"image/png", "image/jpeg", "image/jpg", "image/webp", "application/octet-stream"}
+DOWNLOAD_MAX_BYTES = env_int("DOWNLOAD_MAX_BYTES", 50 * 1024 * 1024)
+DOWNLOAD_IN_BACKGROUND = env_bool("DOWNLOAD_IN_BACKGROUND", False)
+
+# Se acumulan chunks hasta este tamaño antes de cada escritura en el threadpool
+_WRITE_BUFFER = 1024 * 1024
+
+_background: Set[asyncio.Task] = set()
+_stats: Dict[str, int] = {"completed": 0, "failed": 0, "bytes": 0}
+
+
+async def download_to_store(
+    client: httpx.AsyncClient,
+    url: str,
+    meta: ImageMeta,
+    generation_id: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+    timeout: float = 120,
+) -> StoredImage:
+    """Descarga `url` al almacén sin cargar la imagen entera en memoria.
+
+    El sha256 se calcula mientras se escribe; el fichero acaba en su ruta por
+    contenido (o se descarta si ya existía) y la generación queda en el índice.
+    Los errores de red y las respuestas 5xx se reintentan con backoff y jitter.
+    """
+    try:
+        stored = await retry(lambda: _download_once(client, url, meta, generation_id, max_bytes or DOWNLOAD_MAX_BYTES, timeout))
+    except HTTPException:
+        _stats["failed"] += 1
+        raise
+    _stats["completed"] += 1
+    _stats["bytes"] += stored.bytes
+    download_bytes.inc(stored.bytes, provider=meta.provider)
+    return stored
+
+
+async def _download_once(
+    client: httpx.AsyncClient, url: str, meta: ImageMeta, generation_id: Optional[int], max_bytes: int, timeout: float
+) -> StoredImage:
+    provider = meta.provider
+    tmp = await run_in_threadpool(store.temp_path)
+    try:
+        with phase(provider, "download") as p:
+            sha256, total, write_seconds = await _stream_to_file(client, url, tmp, max_bytes, timeout)
+            p.span.set_attribute("bytes", total)
+        started = time.perf_counter()
+        try:
+            stored = await run_in_threadpool(store.put_file, tmp, sha256, total, meta, generation_id)
+        except (OSError, sqlite3.Error) as e:
+            raise HTTPException(status_code=500, detail=f"Error al guardar la imagen: {e}")
+        observe_phase(provider, "save", write_seconds + time.perf_counter() - started)
+        return stored
+    finally:
+        if tmp.exists():
+            try:
+                tmp.unlink()
+            except OSError:
+                pass
+
+
+def _write(f, digest, data: bytes) -> None:
+    # En el threadpool: hashlib suelta el GIL con bloques grandes
+    digest.update(data)
+    f.write(data)
+
+
+async def _stream_to_file(client: httpx.AsyncClient, url: str, tmp: Path, max_bytes: int, timeout: float) -> Tuple[str, int, float]:
+    """Escribe la respuesta en `tmp`. Devuelve (sha256, bytes, segundos de escritura)."""
+    digest = hashlib.sha256()
+    total = 0
+    # Tiempo de disco, separado del de red, para la fase "save"
+    write_seconds = 0.0
+    f = None
+    try:
+        async with client.stream("GET", url, timeout=timeout) as resp:
+            if resp.status_code in TRANSIENT_STATUS:
+                raise TransientError(status_code=502, detail=f"No se pudo descargar la imagen: status {resp.status_code}")
+            if resp.status_code != 200:
+                raise HTTPException(status_code=502, detail=f"No se pudo descargar la imagen: status {resp.status_code}")
+
+            content_type = resp.headers.get("content-type", "").split(";", 1)[0].strip().lower()
+            if content_type and content_type not in ALLOWED_IMAGE_TYPES:
+                raise HTTPException(status_code=502, detail=f"Tipo de contenido inesperado al descargar la imagen: {content_type}")
+
+            declared = resp.headers.get("content-length")
+            if declared and declared.isdigit() and int(declared) > max_bytes:
+                raise HTTPException(status_code=502, detail=f"La imagen supera el tamaño máximo ({max_bytes} bytes)")
+
+            f = await run_in_threadpool(open, tmp, "wb")
+            buffer = bytearray()
+            async for chunk in resp.aiter_bytes():
+                total += len(chunk)
+                if total > max_bytes:
+                    raise HTTPException(status_code=502, detail=f"La imagen supera el tamaño máximo ({max_bytes} bytes)")
+                buffer += chunk
+                if len(buffer) >= _WRITE_BUFFER:
+                    started = time.perf_counter()
+                    with span("file.write", bytes=len(buffer)):
+                        await run_in_threadpool(_write, f, digest, bytes(buffer))
+                    write_seconds += time.perf_counter() - started
+                    buffer.clear()
+            started = time.perf_counter()
+            if buffer:
+                with span("file.write", bytes=len(buffer)):
+                    await run_in_threadpool(_write, f, digest, bytes(buffer))
+            await run_in_threadpool(f.close)
+            f = None
+            write_seconds += time.perf_counter() - started
+    except httpx.TransportError as e:
+        raise TransientError(status_code=502, detail=f"Error descargando la imagen: {e}")
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"Error descargando la imagen: {e}")
+    except OSError as e:
+        raise HTTPException(status_code=500, detail=f"Error al guardar la imagen: {e}")
+    finally:
+        if f is not None:
+            f.close()
+
+    return digest.hexdigest(), total, write_seconds
+
+
+async def download_in_background(client: httpx.AsyncClient, url: str, meta: ImageMeta) -> int:
+    """Registra la generación como pendiente y lanza la descarga sin esperarla. Devuelve su id.
+
+    Si falla, la generación queda como `failed` en el índice y el error en el log.
+    """
+    generation_id = await run_in_threadpool(store.reserve, meta)
+
+    async def run():
+        try:
+            await download_to_store(client, url, meta, generation_id)
+        except HTTPException as e:
+            logger.warning("Descarga en segundo plano fallida (generación %s): %s", generation_id, e.detail)
+            await run_in_threadpool(store.fail, generation_id, str(e.detail))
+
+    task = asyncio.get_running_loop().create_task(run())
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+    return generation_id
+
+
+async def shutdown(timeout: float = 10.0) -> None:
+    """Da un margen a las descargas pendientes y cancela las que sigan en curso."""
+    if not _background:
+        return
+    _, pending = await asyncio.wait(list(_background), timeout=timeout)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+
+def stats() -> Dict[str, Any]:
+    return {**_stats, "pending": len(_background)}
@@ -0,0 +1,236 @@
+"""Caché de contexto de Gemini (`cachedContents`) para system prompts largos y repetidos.
+
+Un `systemInstruction` de al menos `GEMINI_CONTEXT_CACHE_MIN_CHARS` caracteres
+que se ve `GEMINI_CONTEXT_CACHE_MIN_USES` veces se registra en segundo plano
+como contenido cacheado en el servidor (clave: sha256 de modelo + prompt). Las
+llamadas siguientes envían solo `cachedContent: <nombre>` en vez del prompt
+completo: menos bytes por petición y sin volver a procesar (ni facturar a
+precio completo) el prefijo.
+
+- Las entradas en uso se renuevan (PATCH del TTL) cuando les queda menos de un
+  cuarto de `GEMINI_CONTEXT_CACHE_TTL`; las que nadie usa caducan solas.
+- Como máximo `GEMINI_CONTEXT_CACHE_MAX_ENTRIES`: al pasarse se borra en el
+  servidor la usada hace más tiempo (el almacenamiento se factura por hora).
+- Si Gemini responde que el contexto ya no existe, el router repite la llamada
+  con el prompt completo (`invalidate` + `apply` sin nombre).
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set
+
+import httpx
+
+from .http_clients import get_client
+from .metrics import METRICS_ENABLED, gemini_context_cache, phase
+from .response_cache import cache_key
+from .settings import env_bool, env_int
+
+logger = logging.getLogger(__name__)
+
+GEMINI_CONTEXT_CACHE_ENABLED = env_bool("GEMINI_CONTEXT_CACHE_ENABLED", True)
+# Gemini rechaza contextos por debajo de un mínimo de tokens (1024-4096 según el modelo)
+GEMINI_CONTEXT_CACHE_MIN_CHARS = env_int("GEMINI_CONTEXT_CACHE_MIN_CHARS", 16000)
+GEMINI_CONTEXT_CACHE_MIN_USES = env_int("GEMINI_CONTEXT_CACHE_MIN_USES", 2)
+GEMINI_CONTEXT_CACHE_TTL = env_int("GEMINI_CONTEXT_CACHE_TTL", 3600)
+GEMINI_CONTEXT_CACHE_MAX_ENTRIES = env_int("GEMINI_CONTEXT_CACHE_MAX_ENTRIES", 100)
+
+# Con menos tiempo restante no se referencia: podría caducar con la petición en vuelo
+_MARGIN = 30.0
+# Tras un fallo al crear (p. ej. prompt por debajo del mínimo) no se reintenta hasta pasado este tiempo
+_FAILURE_BACKOFF = 300.0
+_SEEN_MAX = 1024
+# Respuestas con las que Gemini indica que el contexto referenciado no existe o caducó
+STALE_STATUS = {400, 403, 404}
+
+
+def _chars(instruction: Dict[str, Any]) -> int:
+    return sum(len(p.get("text") or "") for p in instruction.get("parts") or [])
+
+
+class ContextEntry:
+    __slots__ = ("name", "key", "size", "expires_at", "uses")
+
+    def __init__(self, name: str, key: str, size: int, expires_at: float):
+        self.name = name
+        self.key = key
+        self.size = size
+        self.expires_at = expires_at
+        self.uses = 0
+
+
+class ContextCache:
+    def __init__(self, endpoint: str):
+        # .../v1beta/models/<modelo>:generateContent -> base .../v1beta y models/<modelo>
+        base, _, rest = endpoint.partition("/models/")
+        self.base = base
+        self.model = "models/" + rest.split(":", 1)[0]
+        self._entries: "OrderedDict[str, ContextEntry]" = OrderedDict()
+        self._seen: "OrderedDict[str, int]" = OrderedDict()
+        self._failed: Dict[str, float] = {}
+        self._pending: Dict[str, asyncio.Task] = {}
+        self._background: Set[asyncio.Task] = set()
+        self._headers: Dict[str, str] = {}
+        self._stats: Dict[str, int] = {
+            "hits": 0, "misses": 0, "created": 0, "refreshed": 0, "stale": 0, "evicted": 0, "failed": 0, "bytes_saved": 0,
+        }
+
+    def _count(self, result: str) -> None:
+        if METRICS_ENABLED:
+            gemini_context_cache.inc(result=result)
+
+    # --- API para el router ---
+
+    def lookup(self, payload: Dict[str, Any], headers: Dict[str, str]) -> Optional[str]:
+        """Nombre del contexto cacheado para el `systemInstruction` de `payload`, o None (enviar en línea).
+
+        No espera a la red: la creación y la renovación van en segundo plano.
+        """
+        instruction = payload.get("systemInstruction")
+        if not GEMINI_CONTEXT_CACHE_ENABLED or not instruction:
+            return None
+        size = _chars(instruction)
+        if size < GEMINI_CONTEXT_CACHE_MIN_CHARS:
+            return None
+        self._headers = headers
+        key = cache_key(self.model, instruction)
+        now = time.monotonic()
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            remaining = entry.expires_at - now
+            if remaining > _MARGIN:
+                self._entries.move_to_end(key)
+                entry.uses += 1
+                self._stats["hits"] += 1
+                self._stats["bytes_saved"] += entry.size
+                self._count("hit")
+                if remaining < GEMINI_CONTEXT_CACHE_TTL / 4:
+                    self._spawn(key, self._refresh(entry))
+                return entry.name
+            # Sin uso durante todo el TTL: el servidor ya lo habrá borrado
+            del self._entries[key]
+
+        self._stats["misses"] += 1
+        self._count("miss")
+        if self._failed.get(key, 0.0) > now:
+            return None
+        seen = self._seen.pop(key, 0) + 1
+        self._seen[key] = seen
+        while len(self._seen) > _SEEN_MAX:
+            self._seen.popitem(last=False)
+        if seen >= GEMINI_CONTEXT_CACHE_MIN_USES:
+            self._spawn(key, self._create(key, instruction, size))
+        return None
+
+    @staticmethod
+    def apply(payload: Dict[str, Any], name: str) -> Dict[str, Any]:
+        """Copia de `payload` que referencia el contexto `name` en vez de llevar el system prompt."""
+        body = {k: v for k, v in payload.items() if k != "systemInstruction"}
+        body["cachedContent"] = name
+        return body
+
+    @staticmethod
+    def is_stale(r: httpx.Response) -> bool:
+        """True si `r` (ya leída) indica que el contexto referenciado no existe o caducó."""
+        return r.status_code in STALE_STATUS and "cachedcontent" in r.text.lower()
+
+    def invalidate(self, name: str) -> None:
+        for key, entry in list(self._entries.items()):
+            if entry.name == name:
+                del self._entries[key]
+                # Ya se sabe que se repite: la siguiente llamada lo vuelve a registrar
+                self._seen[key] = GEMINI_CONTEXT_CACHE_MIN_USES
+                self._stats["stale"] += 1
+                self._count("stale")
+
+    # --- Segundo plano ---
+
+    def _spawn(self, key: str, coro) -> None:
+        # Una sola operación en curso por clave (crear o renovar)
+        if key in self._pending:
+            coro.close()
+            return
+        task = asyncio.ensure_future(coro)
+        self._pending[key] = task
+        self._background.add(task)
+        task.add_done_callback(lambda t: (self._pending.pop(key, None), self._background.discard(t)))
+
+    async def _create(self, key: str, instruction: Dict[str, Any], size: int) -> None:
+        body = {
+            "model": self.model,
+            "systemInstruction": instruction,
+            "ttl": f"{GEMINI_CONTEXT_CACHE_TTL}s",
+            "displayName": key[:32],
+        }
+        try:
+            with phase("gemini", "context_create") as p:
+                r = await get_client("gemini").post(f"{self.base}/cachedContents", headers=self._headers, json=body)
+                p.status = r.status_code
+            r.raise_for_status()
+            name = r.json()["name"]
+        except Exception as e:
+            self._failed[key] = time.monotonic() + _FAILURE_BACKOFF
+            self._stats["failed"] += 1
+            self._count("failed")
+            logger.warning("No se pudo crear el contexto cacheado de Gemini: %s", e)
+            return
+
+        self._failed.pop(key, None)
+        self._seen.pop(key, None)
+        self._entries[key] = ContextEntry(name, key, size, time.monotonic() + GEMINI_CONTEXT_CACHE_TTL)
+        self._stats["created"] += 1
+        self._count("created")
+        while len(self._entries) > GEMINI_CONTEXT_CACHE_MAX_ENTRIES:
+            _, old = self._entries.popitem(last=False)
+            self._stats["evicted"] += 1
+            self._count("evicted")
+            self._spawn(old.key, self._delete(old.name))
+
+    async def _refresh(self, entry: ContextEntry) -> None:
+        try:
+            with phase("gemini", "context_refresh") as p:
+                r = await get_client("gemini").patch(
+                    f"{self.base}/{entry.name}",
+                    params={"updateMask": "ttl"},
+                    headers=self._headers,
+                    json={"ttl": f"{GEMINI_CONTEXT_CACHE_TTL}s"},
+                )
+                p.status = r.status_code
+        except Exception as e:
+            logger.warning("No se pudo renovar el contexto %s: %s", entry.name, e)
+            return
+        if r.status_code == 200:
+            entry.expires_at = time.monotonic() + GEMINI_CONTEXT_CACHE_TTL
+            self._stats["refreshed"] += 1
+            self._count("refreshed")
+        elif r.status_code == 404:
+            self.invalidate(entry.name)
+
+    async def _delete(self, name: str) -> None:
+        try:
+            await get_client("gemini").delete(f"{self.base}/{name}", headers=self._headers)
+        except Exception as e:
+            logger.warning("No se pudo borrar el contexto %s: %s", name, e)
+
+    async def shutdown(self, timeout: float = 5.0) -> None:
+        """Cancela lo pendiente y borra los contextos creados (se pierde el índice al reiniciar)."""
+        for task in list(self._background):
+            task.cancel()
+        await asyncio.gather(*self._background, return_exceptions=True)
+        entries = list(self._entries.values())
+        self._entries.clear()
+        if entries and self._headers:
+            await asyncio.wait([asyncio.ensure_future(self._delete(e.name)) for e in entries], timeout=timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": GEMINI_CONTEXT_CACHE_ENABLED,
+            "model": self.model,
+            "entries": len(self._entries),
+            "pending": len(self._pending),
+            "min_chars": GEMINI_CONTEXT_CACHE_MIN_CHARS,
+            "ttl": GEMINI_CONTEXT_CACHE_TTL,
+            **self._stats,
+        }
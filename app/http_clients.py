@@ -0,0 +1,71 @@
+"""Clientes HTTP asíncronos compartidos (uno por proveedor)."""
+import asyncio
+import importlib.util
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from .settings import env_bool, env_float, env_int
+from .tracing import TRACING_ENABLED, TracingTransport
+
+PROVIDERS = ("bfl", "runware", "gemini")
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def _build_client() -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=env_int("HTTP_MAX_CONNECTIONS", 100),
+        max_keepalive_connections=env_int("HTTP_MAX_KEEPALIVE", 20),
+        keepalive_expiry=env_float("HTTP_KEEPALIVE_EXPIRY", 30.0),
+    )
+    # HTTP/2 solo si se pide y el paquete 'h2' está instalado (httpx[http2])
+    http2 = env_bool("HTTP_HTTP2", False) and importlib.util.find_spec("h2") is not None
+    if TRACING_ENABLED:
+        # Un span por petición upstream; límites y HTTP/2 pasan al transporte envuelto
+        return httpx.AsyncClient(
+            timeout=env_float("HTTP_TIMEOUT", 60.0),
+            transport=TracingTransport(httpx.AsyncHTTPTransport(limits=limits, http2=http2)),
+        )
+    return httpx.AsyncClient(
+        timeout=env_float("HTTP_TIMEOUT", 60.0),
+        limits=limits,
+        http2=http2,
+    )
+
+
+def get_client(provider: str) -> httpx.AsyncClient:
+    """Devuelve el cliente compartido del proveedor (se crea bajo demanda)."""
+    client = _clients.get(provider)
+    if client is None or client.is_closed:
+        client = _build_client()
+        _clients[provider] = client
+    return client
+
+
+async def _prewarm(provider: str, url: str) -> None:
+    # Un HEAD al origen basta para dejar la conexión TCP+TLS abierta en el pool
+    parts = urlsplit(url)
+    origin = f"{parts.scheme}://{parts.netloc}/"
+    try:
+        await get_client(provider).head(origin, timeout=env_float("HTTP_PREWARM_TIMEOUT", 5.0))
+    except Exception:
+        pass
+
+
+async def startup(prewarm_urls: Optional[Dict[str, str]] = None) -> None:
+    for provider in PROVIDERS:
+        get_client(provider)
+    if prewarm_urls and env_bool("HTTP_PREWARM", True):
+        await asyncio.gather(*(_prewarm(p, u) for p, u in prewarm_urls.items()))
+
+
+async def shutdown() -> None:
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        try:
+            await client.aclose()
+        except Exception:
+            pass
@@ -1,7 +1,56 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
-from .routers import ping, openai_image, gemini, runware, bfl
+from fastapi.concurrency import run_in_threadpool
+from fastapi.staticfiles import StaticFiles
+from . import admission, downloads, http_clients, preprocess, storage, thumbnails, tracing
+from .metrics import MetricsMiddleware
+from .scheduler import PriorityMiddleware
+from .providers import bfl_provider, runware_provider
+from .routers import ping, openai_image, gemini, runware, bfl, images, generations, thumbnails as thumbnail_routes, stats, metrics
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    admission.configure_threadpool()
+    # Clientes HTTP compartidos: se abren (y precalientan) una sola vez
+    await http_clients.startup(
+        prewarm_urls={
+            "bfl": bfl_provider.BFL_API_URL,
+            "runware": runware_provider.RUNWARE_ENDPOINT,
+            "gemini": gemini.GEMINI_ENDPOINT,
+        }
+    )
+    await runware_provider.start_ws()
+    await preprocess.startup()
+    await thumbnails.startup()
+    try:
+        yield
+    finally:
+        await runware_provider.stop_ws()
+        # Antes de cerrar los clientes HTTP: borra los contextos cacheados en Gemini
+        await gemini.context_cache.shutdown()
+        await preprocess.shutdown()
+        await thumbnails.shutdown()
+        await bfl_provider.jobs.shutdown()
+        await downloads.shutdown()
+        await http_clients.shutdown()
+        await run_in_threadpool(tracing.exporter.shutdown)
+
 
-app = FastAPI(title="FastAPI REST")
+# request_id en todos los registros de logging
+tracing.configure_logging()
+
+app = FastAPI(title="FastAPI REST", lifespan=lifespan)
+
+# Prioridad de las llamadas upstream según la cabecera X-Priority
+app.add_middleware(PriorityMiddleware)
+# Control de admisión por grupo de rutas: 503 + Retry-After si el grupo está lleno
+app.add_middleware(admission.AdmissionMiddleware)
+# Métricas de Prometheus (/metrics); la más externa para medir la petición completa
+app.add_middleware(MetricsMiddleware)
+# X-Request-ID y span raíz de la traza; la más externa para que todo lo demás la vea
+app.add_middleware(tracing.TracingMiddleware)
 
 # Routers
 app.include_router(ping.router, tags=["health"])  # /ping
@@ -9,8 +58,20 @@ app.include_router(openai_image.router)  # /image/*
 app.include_router(gemini.router)  # /gemini/*
 app.include_router(runware.router)  # /runware/*
 app.include_router(bfl.router)  # /bfl/*
+app.include_router(images.router)  # /images/*
+app.include_router(generations.router)  # /generations
+app.include_router(thumbnail_routes.router)  # /generated/{id}/thumb (antes del montaje estático)
+app.include_router(stats.router)  # /stats/*
+app.include_router(metrics.router)  # /metrics
+
+# Imágenes generadas como ficheros estáticos (ETag, Last-Modified y Range)
+app.mount(
+    storage.GENERATED_URL_PREFIX,
+    StaticFiles(directory=str(storage.output_dir()), check_dir=False),
+    name="generated",
+)  # /generated/*
 
 
 @app.get("/", tags=["root"])
-def root():
+async def root():
     return {"message": "API is running"}
@@ -0,0 +1,309 @@
+"""Métricas en formato de exposición de Prometheus (texto 0.0.4), sin dependencias externas.
+
+- `MetricsMiddleware`: peticiones por ruta/método/status, duración y peticiones en curso.
+- `phase(provider, fase)`: context manager para los tramos calientes de cada
+  router (submit, poll, download, save, encode, preprocess). Registra la duración y, si
+  hay excepción, un error con su status. Cada fase es además un span de traza.
+  `observe_phase` registra tramos medidos a mano (p. ej. `first_partial` y
+  `stream` de /image/generate/stream).
+- Gauges calculados al hacer scrape: ocupación del threadpool y colas del planificador.
+"""
+import bisect
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from anyio.to_thread import current_default_thread_limiter
+
+from .scheduler import schedulers
+from .settings import env_bool
+from .tracing import NOOP, span
+
+METRICS_ENABLED = env_bool("METRICS_ENABLED", True)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric(ABC):
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._defaults = ("",) * len(self.labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        # Camino caliente: sin conversiones; las etiquetas ya llegan como str
+        return tuple(map(labels.get, self.labelnames, self._defaults))
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """Líneas de muestra en formato de exposición de Prometheus."""
+
+    def render(self) -> str:
+        head = f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.type}\n"
+        return head + "".join(line + "\n" for line in self.samples())
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in items]
+
+
+class Gauge(Metric):
+    """Gauge; con `collect` el valor se calcula en cada scrape."""
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        collect: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._collect = collect
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self) -> List[str]:
+        if self._collect is not None:
+            try:
+                items = list(self._collect().items())
+            except Exception:
+                items = []
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in items]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Por serie: conteos por bucket (no acumulados), suma y total
+        self._series: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][idx] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [(k, (list(s[0]), s[1], s[2])) for k, s in self._series.items()]
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = 'le="%s"' % _fmt(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_fmt(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "".join(m.render() for m in self._metrics)
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter("http_requests_total", "Peticiones HTTP atendidas", ("method", "route", "status")))
+http_duration = registry.register(Histogram("http_request_duration_seconds", "Duración de las peticiones HTTP", ("method", "route")))
+http_in_flight = registry.register(Gauge("http_requests_in_flight", "Peticiones HTTP en curso"))
+
+upstream_duration = registry.register(
+    Histogram("upstream_phase_duration_seconds", "Duración por proveedor y fase (submit, poll, download, save, encode, preprocess, first_partial, stream)", ("provider", "phase"))
+)
+upstream_errors = registry.register(Counter("upstream_errors_total", "Errores por proveedor, fase y status", ("provider", "phase", "status")))
+bfl_polls = registry.register(Counter("bfl_poll_attempts_total", "Consultas de estado enviadas a BFL"))
+download_bytes = registry.register(Counter("download_bytes_total", "Bytes de imágenes descargadas", ("provider",)))
+
+upload_images = registry.register(
+    Counter("upload_preprocess_total", "Imágenes subidas por ruta y resultado (passthrough, resized, reencoded, rejected)", ("route", "result"))
+)
+upload_bytes_in = registry.register(Counter("upload_bytes_in_total", "Bytes de imágenes subidas antes del preprocesado", ("route",)))
+upload_bytes_out = registry.register(Counter("upload_bytes_out_total", "Bytes de imágenes enviadas al proveedor tras el preprocesado", ("route",)))
+upload_bytes_saved = registry.register(Counter("upload_bytes_saved_total", "Bytes ahorrados por el preprocesado de subidas", ("route",)))
+
+thumbnail_requests = registry.register(
+    Counter("thumbnail_requests_total", "Peticiones de miniaturas por resultado (hit, miss, not_modified, fallback)", ("result",))
+)
+thumbnail_cache_bytes = registry.register(Gauge("thumbnail_cache_bytes", "Bytes de miniaturas en la caché de disco"))
+
+gemini_context_cache = registry.register(
+    Counter(
+        "gemini_context_cache_total",
+        "Caché de contexto de Gemini por resultado (hit, miss, created, refreshed, stale, evicted, failed)",
+        ("result",),
+    )
+)
+
+
+def _threadpool() -> Dict[Tuple[str, ...], float]:
+    limiter = current_default_thread_limiter()
+    return {("busy",): float(limiter.borrowed_tokens), ("capacity",): float(limiter.total_tokens)}
+
+
+def _scheduler(field: str) -> Callable[[], Dict[Tuple[str, ...], float]]:
+    def collect() -> Dict[Tuple[str, ...], float]:
+        return {(name,): float(s.stats()[field]) for name, s in schedulers.items()}
+
+    return collect
+
+
+registry.register(Gauge("threadpool_threads", "Hilos del threadpool de anyio ocupados y capacidad total", ("state",), collect=_threadpool))
+registry.register(Gauge("scheduler_queue_depth", "Llamadas upstream esperando turno", ("provider",), collect=_scheduler("queue_depth")))
+registry.register(Gauge("scheduler_in_flight", "Llamadas upstream en curso", ("provider",), collect=_scheduler("in_flight")))
+
+
+class Phase:
+    """Tramo en curso; `status` permite registrar como error una respuesta >= 400 sin excepción.
+
+    `span` es el span de traza del tramo, para añadirle atributos (bytes, intento...).
+    """
+
+    __slots__ = ("status", "span")
+
+    def __init__(self):
+        self.status: Optional[int] = None
+        self.span = NOOP
+
+
+@contextmanager
+def phase(provider: str, name: str) -> Iterator[Phase]:
+    """Mide un tramo (`submit`, `poll`, `download`, `save`, `encode`, `preprocess`) de un proveedor."""
+    current = Phase()
+    with span(f"{provider}.{name}", provider=provider, phase=name) as current.span:
+        started = time.perf_counter()
+        try:
+            yield current
+        except BaseException as e:
+            if METRICS_ENABLED:
+                status = getattr(e, "status_code", None) or type(e).__name__
+                upstream_errors.inc(provider=provider, phase=name, status=str(status))
+            raise
+        else:
+            if current.status is not None:
+                current.span.set_attribute("http.status_code", current.status)
+                if current.status >= 400 and METRICS_ENABLED:
+                    upstream_errors.inc(provider=provider, phase=name, status=str(current.status))
+        finally:
+            if METRICS_ENABLED:
+                upstream_duration.observe(time.perf_counter() - started, provider=provider, phase=name)
+
+
+def observe_phase(provider: str, name: str, seconds: float) -> None:
+    """Registra un tramo medido a mano (p. ej. la suma de escrituras de una descarga)."""
+    if METRICS_ENABLED:
+        upstream_duration.observe(seconds, provider=provider, phase=name)
+
+
+def _route_of(scope) -> str:
+    # Plantilla de la ruta (/bfl/jobs/{job_id}), no la URL: evita cardinalidad sin límite
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    if path:
+        return path
+    # Montajes (p. ej. /generated): Starlette solo deja el prefijo en root_path
+    root_path = scope.get("root_path", "")
+    app_root = scope.get("app_root_path", "")
+    if "endpoint" in scope and root_path != app_root and root_path.startswith(app_root):
+        return root_path[len(app_root):] + "/*"
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """Middleware ASGI: contador, histograma y gauge de peticiones por ruta."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        http_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_flight.dec()
+            # La ruta solo se conoce después del enrutado
+            route = _route_of(scope)
+            http_requests.inc(method=scope["method"], route=route, status=str(status["code"]))
+            http_duration.observe(time.perf_counter() - started, method=scope["method"], route=route)
@@ -0,0 +1,352 @@
+"""Preprocesado de imágenes subidas antes de enviarlas al proveedor.
+
+1. Se leen solo las cabeceras (PNG, JPEG, WebP) para conocer formato y
+   dimensiones sin decodificar la imagen, y se rechazan al instante las que no
+   se reconocen o se salen de los límites.
+2. Si la ruta está en modo `resize` y la imagen supera su lado máximo (o
+   conviene cambiarla de formato), se reescala y recodifica en un
+   `ProcessPoolExecutor` para no bloquear el event loop ni el GIL.
+
+Configuración por ruta (`BFL`, `OPENAI`): `PREPROCESS_<R>_MODE` (`off`,
+`validate`, `resize`), `PREPROCESS_<R>_MAX_EDGE` y `PREPROCESS_<R>_FORMAT`
+(`keep`, `png`, `jpeg`, `webp`). Reescalar requiere Pillow (opcional); sin
+él, `resize` se comporta como `validate`.
+"""
+import asyncio
+import base64
+import binascii
+import importlib.util
+import io
+import logging
+import multiprocessing
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, BinaryIO, Dict, NamedTuple, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from .metrics import METRICS_ENABLED, phase, upload_bytes_in, upload_bytes_out, upload_bytes_saved, upload_images
+from .settings import env_int, env_str
+
+logger = logging.getLogger(__name__)
+
+MODES = ("off", "validate", "resize")
+FORMATS = ("keep", "png", "jpeg", "webp")
+
+# Ruta -> (modo, lado máximo, formato). BFL Kontext trabaja en torno a 1 MP;
+# gpt-image-1 no pasa de 1536 px por lado.
+DEFAULT_ROUTES: Dict[str, Tuple[str, int, str]] = {
+    "bfl": ("off", 2048, "keep"),
+    "openai": ("off", 1536, "keep"),
+}
+
+# Límites de rechazo, comunes a todas las rutas con preprocesado activo
+MIN_EDGE = env_int("PREPROCESS_MIN_EDGE", 16)
+MAX_DIMENSION = env_int("PREPROCESS_MAX_DIMENSION", 8192)
+MAX_PIXELS = env_int("PREPROCESS_MAX_PIXELS", 40_000_000)
+JPEG_QUALITY = env_int("PREPROCESS_JPEG_QUALITY", 90)
+WORKERS = env_int("PREPROCESS_WORKERS", 2)
+
+MIME_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+EXTENSIONS = {"png": ".png", "jpeg": ".jpg", "webp": ".webp"}
+
+# Base64 suficiente para las cabeceras, incluido un EXIF grande antes del SOF de JPEG (múltiplo de 4)
+_B64_HEAD = 96 * 1024
+
+HAS_PILLOW = importlib.util.find_spec("PIL") is not None
+
+
+class ImageInfo(NamedTuple):
+    format: str
+    width: int
+    height: int
+
+
+class RouteConfig(NamedTuple):
+    mode: str
+    max_edge: int
+    format: str
+
+    @classmethod
+    def from_env(cls, route: str) -> "RouteConfig":
+        prefix = f"PREPROCESS_{route.upper()}"
+        mode, max_edge, fmt = DEFAULT_ROUTES.get(route, ("off", 2048, "keep"))
+        mode = env_str(f"{prefix}_MODE", mode).strip().lower()
+        fmt = env_str(f"{prefix}_FORMAT", fmt).strip().lower().replace("jpg", "jpeg")
+        return cls(
+            mode=mode if mode in MODES else "off",
+            max_edge=env_int(f"{prefix}_MAX_EDGE", max_edge),
+            format=fmt if fmt in FORMATS else "keep",
+        )
+
+
+routes: Dict[str, RouteConfig] = {name: RouteConfig.from_env(name) for name in DEFAULT_ROUTES}
+
+
+def enabled(route: str) -> bool:
+    return routes[route].mode != "off"
+
+
+# --- Cabeceras -----------------------------------------------------------------
+
+def _read_exact(f: BinaryIO, n: int) -> bytes:
+    data = f.read(n)
+    if len(data) != n:
+        raise EOFError
+    return data
+
+
+def _probe_jpeg(f: BinaryIO) -> Optional[Tuple[int, int]]:
+    # Recorre los segmentos hasta el SOFn, saltando APPn/EXIF sin leerlos
+    while True:
+        byte = _read_exact(f, 1)
+        if byte != b"\xff":
+            return None
+        marker = _read_exact(f, 1)[0]
+        while marker == 0xFF:
+            marker = _read_exact(f, 1)[0]
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            continue
+        if marker == 0xD9 or marker == 0xDA:
+            return None
+        length = struct.unpack(">H", _read_exact(f, 2))[0]
+        if length < 2:
+            return None
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            _precision, height, width = struct.unpack(">BHH", _read_exact(f, 5))
+            return width, height
+        f.seek(length - 2, io.SEEK_CUR)
+
+
+def _probe_webp(head: bytes) -> Optional[Tuple[int, int]]:
+    chunk = head[12:16]
+    if chunk == b"VP8 " and head[23:26] == b"\x9d\x01\x2a":
+        width, height = struct.unpack("<HH", head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L" and head[20:21] == b"\x2f":
+        bits = struct.unpack("<I", head[21:25])[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X":
+        return int.from_bytes(head[24:27], "little") + 1, int.from_bytes(head[27:30], "little") + 1
+    return None
+
+
+def probe(f: BinaryIO) -> Optional[ImageInfo]:
+    """Formato y dimensiones leyendo solo las cabeceras. Deja el fichero al principio."""
+    f.seek(0)
+    try:
+        head = f.read(30)
+        size: Optional[Tuple[int, int]] = None
+        fmt = ""
+        if head.startswith(b"\x89PNG\r\n\x1a\n") and head[12:16] == b"IHDR":
+            fmt, size = "png", struct.unpack(">II", head[16:24])
+        elif head.startswith(b"\xff\xd8"):
+            f.seek(2)
+            fmt, size = "jpeg", _probe_jpeg(f)
+        elif head[:4] == b"RIFF" and head[8:12] == b"WEBP" and len(head) >= 30:
+            fmt, size = "webp", _probe_webp(head)
+    except (EOFError, struct.error, OSError):
+        size = None
+    finally:
+        f.seek(0)
+    return ImageInfo(fmt, *size) if size else None
+
+
+def probe_bytes(data: bytes) -> Optional[ImageInfo]:
+    return probe(io.BytesIO(data))
+
+
+def check(route: str, info: Optional[ImageInfo]) -> ImageInfo:
+    """Rechaza formatos desconocidos y dimensiones fuera de límites antes de decodificar."""
+    if info is None:
+        _count(route, "rejected")
+        raise HTTPException(status_code=400, detail="Imagen no reconocida: se admiten PNG, JPEG y WebP")
+    if min(info.width, info.height) < MIN_EDGE:
+        _count(route, "rejected")
+        raise HTTPException(status_code=400, detail=f"Imagen demasiado pequeña ({info.width}x{info.height}); mínimo {MIN_EDGE} px por lado")
+    if max(info.width, info.height) > MAX_DIMENSION or info.width * info.height > MAX_PIXELS:
+        _count(route, "rejected")
+        raise HTTPException(
+            status_code=413,
+            detail=f"Imagen demasiado grande ({info.width}x{info.height}); máximo {MAX_DIMENSION} px por lado y {MAX_PIXELS} píxeles",
+        )
+    return info
+
+
+def _target_format(cfg: RouteConfig, info: ImageInfo) -> Optional[str]:
+    """Formato al que recodificar, o None si la imagen puede ir tal cual."""
+    if cfg.mode != "resize" or not HAS_PILLOW:
+        return None
+    fmt = info.format if cfg.format == "keep" else cfg.format
+    if max(info.width, info.height) > cfg.max_edge or fmt != info.format:
+        return fmt
+    return None
+
+
+# --- Recodificación en procesos ------------------------------------------------
+
+def _transcode(data: bytes, max_edge: int, fmt: str, quality: int) -> Tuple[bytes, str]:
+    # Se ejecuta en un proceso del pool: Pillow solo se importa allí
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as original:
+        im = ImageOps.exif_transpose(original)
+        if max(im.size) > max_edge:
+            im.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        has_alpha = im.mode in ("RGBA", "LA", "PA") or "transparency" in im.info
+        if fmt == "jpeg":
+            if has_alpha:
+                # JPEG no tiene transparencia: se conserva en PNG
+                fmt = "png"
+            elif im.mode != "RGB":
+                im = im.convert("RGB")
+        if fmt == "webp" and im.mode not in ("RGB", "RGBA"):
+            im = im.convert("RGBA" if has_alpha else "RGB")
+        out = io.BytesIO()
+        if fmt == "png":
+            im.save(out, format="PNG")
+        else:
+            im.save(out, format=fmt.upper(), quality=quality)
+    return out.getvalue(), fmt
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _executor() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: no hereda hilos ni sockets del servidor
+        _pool = ProcessPoolExecutor(max_workers=max(1, WORKERS), mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def _noop() -> None:
+    return None
+
+
+async def startup() -> None:
+    """Arranca los procesos del pool si alguna ruta reescala (la primera subida no paga el arranque)."""
+    if HAS_PILLOW and any(cfg.mode == "resize" for cfg in routes.values()):
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(_executor(), _noop) for _ in range(max(1, WORKERS))))
+    elif any(cfg.mode == "resize" for cfg in routes.values()):
+        logger.warning("PREPROCESS_*_MODE=resize sin Pillow instalado: solo se validan las cabeceras")
+
+
+async def shutdown() -> None:
+    global _pool
+    if _pool is not None:
+        pool, _pool = _pool, None
+        # wait=True en un hilo: se esperan los procesos (y se liberan sus semáforos) sin bloquear el loop
+        await run_in_threadpool(lambda: pool.shutdown(wait=True, cancel_futures=True))
+
+
+def _count(route: str, result: str, size_in: int = 0, size_out: int = 0) -> None:
+    if not METRICS_ENABLED:
+        return
+    upload_images.inc(route=route, result=result)
+    if size_in:
+        upload_bytes_in.inc(size_in, route=route)
+        upload_bytes_out.inc(size_out, route=route)
+        if size_in > size_out:
+            upload_bytes_saved.inc(size_in - size_out, route=route)
+
+
+async def process_bytes(route: str, data: bytes, info: Optional[ImageInfo] = None) -> Tuple[bytes, ImageInfo]:
+    """Valida y, si procede, reescala/recodifica `data`. Devuelve los bytes a enviar y su formato."""
+    cfg = routes[route]
+    info = check(route, info or probe_bytes(data))
+    fmt = _target_format(cfg, info)
+    if fmt is None:
+        _count(route, "passthrough", len(data), len(data))
+        return data, info
+
+    with phase(route, "preprocess") as p:
+        loop = asyncio.get_running_loop()
+        try:
+            out, fmt = await loop.run_in_executor(_executor(), _transcode, data, cfg.max_edge, fmt, JPEG_QUALITY)
+        except Exception as e:
+            logger.warning("No se pudo recodificar la imagen subida (%s): se envía la original", e)
+            _count(route, "passthrough", len(data), len(data))
+            return data, info
+        p.span.set_attribute("bytes_in", len(data))
+        p.span.set_attribute("bytes_out", len(out))
+
+    resized = max(info.width, info.height) > cfg.max_edge
+    if not resized and len(out) >= len(data):
+        # Solo cambiaba el formato y no ahorra nada: se envía la original
+        _count(route, "passthrough", len(data), len(data))
+        return data, info
+    new_info = probe_bytes(out) or ImageInfo(fmt, info.width, info.height)
+    _count(route, "resized" if resized else "reencoded", len(data), len(out))
+    return out, new_info
+
+
+def _probe_upload(f: BinaryIO) -> Tuple[Optional[ImageInfo], int]:
+    info = probe(f)
+    size = f.seek(0, io.SEEK_END)
+    f.seek(0)
+    return info, size
+
+
+def _read_upload(f: BinaryIO) -> bytes:
+    f.seek(0)
+    data = f.read()
+    f.seek(0)
+    return data
+
+
+async def process_upload(route: str, f: BinaryIO) -> Optional[Tuple[bytes, ImageInfo]]:
+    """Como `process_bytes` para un fichero subido; solo lo lee entero si hay que recodificarlo.
+
+    Devuelve None si puede enviarse tal cual (con el fichero al principio). El
+    fichero puede estar volcado a disco: las lecturas van al threadpool.
+    """
+    info, size = await run_in_threadpool(_probe_upload, f)
+    info = check(route, info)
+    if _target_format(routes[route], info) is None:
+        _count(route, "passthrough", size, size)
+        return None
+    data = await run_in_threadpool(_read_upload, f)
+    return await process_bytes(route, data, info)
+
+
+def _b64decode(value: str) -> bytes:
+    try:
+        return base64.b64decode(value)
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="image_base64 no es base64 válido")
+
+
+async def process_b64(route: str, image_b64: str) -> str:
+    """Preprocesa una imagen en base64 (sin prefijo data:). Solo la decodifica entera si hace falta."""
+    cfg = routes[route]
+    info = None
+    try:
+        info = probe_bytes(base64.b64decode(image_b64[:_B64_HEAD]))
+    except (binascii.Error, ValueError):
+        pass
+    data: Optional[bytes] = None
+    if info is None:
+        # Cabeceras más allá del prefijo (EXIF enorme) o base64 con saltos de línea
+        data = _b64decode(image_b64)
+        info = probe_bytes(data)
+    info = check(route, info)
+    if _target_format(cfg, info) is None:
+        size = len(image_b64) * 3 // 4 - image_b64[-2:].count("=")
+        _count(route, "passthrough", size, size)
+        return image_b64
+    if data is None:
+        data = _b64decode(image_b64)
+    out, _ = await process_bytes(route, data, info)
+    return image_b64 if out is data else base64.b64encode(out).decode("ascii")
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "pillow": HAS_PILLOW,
+        "workers": WORKERS if _pool is not None else 0,
+        "routes": {name: cfg._asdict() for name, cfg in routes.items()},
+    }
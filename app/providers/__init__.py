@@ -0,0 +1,15 @@
+"""Proveedores de imagen detrás de una interfaz común (`ImageProvider`)."""
+from typing import Dict
+
+from .base import ImageProvider, ImageResult
+from .bfl_provider import provider as bfl_image_provider
+from .openai_provider import provider as openai_image_provider
+from .routing import ProviderRouter
+from .runware_provider import provider as runware_image_provider
+
+registry: Dict[str, ImageProvider] = {
+    p.name: p for p in (openai_image_provider, runware_image_provider, bfl_image_provider)
+}
+image_router = ProviderRouter(registry)
+
+__all__ = ["ImageProvider", "ImageResult", "ProviderRouter", "image_router", "registry"]
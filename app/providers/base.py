@@ -0,0 +1,133 @@
+"""Interfaz común de los proveedores de imagen."""
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException
+
+from ..settings import env_float, settings
+
+EWMA_ALPHA = env_float("IMAGES_EWMA_ALPHA", 0.3)
+
+
+class ImageResult:
+    """Imagen generada: dónde quedó guardada y lo que el proveedor haya devuelto (URL remota o bytes).
+
+    Con `save_pending` la ruta aún no se conoce (depende del contenido): `generation_id`
+    permite consultarla después en `/generations/{id}`.
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        saved_path: Optional[Path],
+        remote_url: Optional[str] = None,
+        image_bytes: Optional[bytes] = None,
+        b64: Optional[str] = None,
+        content_type: str = "image/png",
+        save_pending: bool = False,
+        generation_id: Optional[int] = None,
+    ):
+        self.provider = provider
+        self.saved_path = saved_path
+        self.generation_id = generation_id
+        self.remote_url = remote_url
+        self.image_bytes = image_bytes
+        self.b64 = b64
+        self.content_type = content_type
+        self.save_pending = save_pending
+
+
+class ProviderStats:
+    """Media móvil exponencial (EWMA) de latencia y tasa de error de `generate`."""
+
+    def __init__(self, alpha: float = EWMA_ALPHA):
+        self.alpha = alpha
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.successes = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def samples(self) -> int:
+        return self.successes + self.failures
+
+    def success(self, seconds: float) -> None:
+        self.successes += 1
+        self.latency = seconds if self.latency is None else self.alpha * seconds + (1 - self.alpha) * self.latency
+        self.error_rate = (1 - self.alpha) * self.error_rate
+
+    def failure(self, error: str) -> None:
+        self.failures += 1
+        self.last_error = error
+        self.error_rate = self.alpha + (1 - self.alpha) * self.error_rate
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "ewma_latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "error_rate": round(self.error_rate, 4),
+            "successes": self.successes,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+
+def is_provider_failure(e: HTTPException) -> bool:
+    """Fallos atribuibles al proveedor (5xx, 429, circuito abierto); los 4xx son del cliente."""
+    return e.status_code >= 500 or e.status_code == 429
+
+
+class ImageProvider(ABC):
+    """Un backend de generación de imágenes.
+
+    Las subclases implementan `_generate`; `generate` mide cada llamada y
+    alimenta las estadísticas que usa el enrutado de /images/generate.
+    """
+
+    name = "provider"
+    api_key_env = ""
+
+    def __init__(self):
+        self.stats = ProviderStats()
+
+    def api_key(self) -> Optional[str]:
+        return settings.api_key(self.api_key_env)
+
+    def configured(self) -> bool:
+        return bool(self.api_key())
+
+    async def generate(
+        self,
+        prompt: str,
+        width: int,
+        height: int,
+        quality: str = "low",
+        model: Optional[str] = None,
+        background_save: bool = False,
+    ) -> ImageResult:
+        started = time.perf_counter()
+        try:
+            result = await self._generate(prompt, width, height, quality, model, background_save)
+        except HTTPException as e:
+            if is_provider_failure(e):
+                self.stats.failure(str(e.detail))
+            raise
+        except Exception as e:
+            self.stats.failure(str(e))
+            raise
+        self.stats.success(time.perf_counter() - started)
+        return result
+
+    @abstractmethod
+    async def _generate(
+        self,
+        prompt: str,
+        width: int,
+        height: int,
+        quality: str,
+        model: Optional[str],
+        background_save: bool,
+    ) -> ImageResult:
+        """Genera y guarda la imagen; los errores se lanzan como HTTPException."""
@@ -0,0 +1,160 @@
+"""BFL Flux-Kontext: trabajos asíncronos (submit + polling o webhook) y guardado del resultado."""
+import logging
+from math import gcd
+from typing import Optional
+
+from fastapi import HTTPException
+
+from ..bfl_jobs import Job, JobManager
+from ..downloads import download_in_background, download_to_store
+from ..http_clients import get_client
+from ..metrics import phase
+from ..resilience import breakers
+from ..scheduler import raise_for_rate_limit, schedule
+from ..settings import env_float, env_str, settings
+from ..storage import ImageMeta
+from .base import ImageProvider, ImageResult
+
+logger = logging.getLogger(__name__)
+
+BFL_API_URL = settings.bfl_api_url
+POLLING_INTERVAL_SECONDS = 3
+MAX_POLLING_ATTEMPTS = 20
+
+# Modo webhook (opcional): BFL llama a BFL_WEBHOOK_URL cuando termina y el
+# polling solo se usa si el callback no llega en BFL_WEBHOOK_FALLBACK_SECONDS.
+# El secreto tiene que ser el mismo en todos los workers y sobrevivir a reinicios:
+# el callback puede llegar a otro proceso que el que hizo el submit.
+BFL_WEBHOOK_URL = env_str("BFL_WEBHOOK_URL")
+BFL_WEBHOOK_SECRET = env_str("BFL_WEBHOOK_SECRET")
+if BFL_WEBHOOK_URL and not BFL_WEBHOOK_SECRET:
+    logger.warning("BFL_WEBHOOK_URL sin BFL_WEBHOOK_SECRET: modo webhook desactivado, se usa solo polling")
+    BFL_WEBHOOK_URL = None
+
+# Un único poller en segundo plano para todos los trabajos de Flux-Kontext.
+# El intervalo empieza en BFL_POLL_MIN_INTERVAL y crece hasta POLLING_INTERVAL_SECONDS.
+jobs = JobManager(
+    min_interval=env_float("BFL_POLL_MIN_INTERVAL", 1.0),
+    max_interval=POLLING_INTERVAL_SECONDS,
+    timeout=MAX_POLLING_ATTEMPTS * POLLING_INTERVAL_SECONDS,
+    webhook_fallback=env_float("BFL_WEBHOOK_FALLBACK_SECONDS", 30.0),
+)
+
+
+async def _submit(payload: dict, headers: dict):
+    async def send():
+        with phase("bfl", "submit") as p:
+            r = await get_client("bfl").post(BFL_API_URL, json=payload, headers=headers)
+            p.status = r.status_code
+        raise_for_rate_limit(r)
+        return r
+
+    try:
+        initial_response = await schedule("bfl", lambda: breakers["bfl"].call(send))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Error de red al llamar a BFL: {e}")
+
+    if initial_response.status_code != 200:
+        try:
+            details = initial_response.json()
+        except Exception:
+            details = initial_response.text
+        raise HTTPException(status_code=initial_response.status_code, detail={"error": "API error inicial", "details": details})
+
+    try:
+        initial_data = initial_response.json()
+        polling_url = initial_data.get("polling_url")
+        request_id = initial_data.get("id")
+    except Exception:
+        polling_url = None
+        request_id = None
+
+    if not polling_url:
+        raise HTTPException(status_code=502, detail={"error": "API error: polling URL no recibido.", "details": initial_response.text})
+
+    return polling_url, request_id
+
+
+async def _save_result(
+    image_result_url: str,
+    meta: ImageMeta,
+    background_save: bool = False,
+) -> ImageResult:
+    # Guardar imagen localmente
+    if background_save:
+        generation_id = await download_in_background(get_client("bfl"), image_result_url, meta)
+        return ImageResult("bfl", None, remote_url=image_result_url, save_pending=True, generation_id=generation_id)
+    stored = await download_to_store(get_client("bfl"), image_result_url, meta)
+    return ImageResult("bfl", stored.path, remote_url=image_result_url, generation_id=stored.id)
+
+
+def _aspect_ratio(width: int, height: int) -> str:
+    d = gcd(width, height)
+    return f"{width // d}:{height // d}"
+
+
+class BFLProvider(ImageProvider):
+    name = "bfl"
+    api_key_env = "BFL_API_KEY"
+
+    def create_job(
+        self,
+        prompt: str,
+        image_b64: Optional[str] = None,
+        creature_name: Optional[str] = "UnknownCreature",
+        prompt_label: Optional[str] = "image",
+        background_save: bool = False,
+        aspect_ratio: Optional[str] = None,
+    ) -> Job:
+        """Lanza un trabajo Flux-Kontext; sin `image_b64` es texto a imagen."""
+        api_key = self.api_key()
+        if not api_key:
+            raise HTTPException(status_code=500, detail="Falta BFL_API_KEY en variables de entorno")
+
+        payload = {
+            "prompt": prompt,
+            "safety_tolerance": 2,
+            "output_format": "png",
+            "prompt_upsampling": False,
+        }
+        if image_b64:
+            payload["input_image"] = image_b64
+        if aspect_ratio:
+            payload["aspect_ratio"] = aspect_ratio
+        if BFL_WEBHOOK_URL:
+            payload["webhook_url"] = BFL_WEBHOOK_URL
+            payload["webhook_secret"] = BFL_WEBHOOK_SECRET
+
+        headers = {
+            "accept": "application/json",
+            "x-key": api_key,
+            "Content-Type": "application/json",
+        }
+
+        async def submit():
+            return await _submit(payload, headers)
+
+        meta = ImageMeta(self.name, prompt, size=aspect_ratio, creature=creature_name, label=prompt_label)
+
+        async def finalize(image_result_url: str) -> ImageResult:
+            return await _save_result(image_result_url, meta._replace(remote_url=image_result_url), background_save)
+
+        poll_headers = {"accept": "application/json", "x-key": api_key}
+        return jobs.create(submit=submit, poll_headers=poll_headers, finalize=finalize, webhook=bool(BFL_WEBHOOK_URL))
+
+    async def _generate(
+        self,
+        prompt: str,
+        width: int,
+        height: int,
+        quality: str,
+        model: Optional[str],
+        background_save: bool,
+    ) -> ImageResult:
+        job = self.create_job(prompt, background_save=background_save, aspect_ratio=_aspect_ratio(width, height))
+        return await job.wait()
+
+
+provider = BFLProvider()
@@ -0,0 +1,190 @@
+"""OpenAI gpt-image-1: generación y edición con el SDK oficial (síncrono, en el threadpool).
+
+El SDK tarda ~0.5 s en importarse: se carga en la primera llamada, no al arrancar.
+"""
+import base64
+import sqlite3
+import time
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, AsyncIterator, List, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from starlette.concurrency import iterate_in_threadpool
+
+from ..metrics import observe_phase, phase
+from ..resilience import TransientError, breakers
+from ..scheduler import RateLimited, parse_retry_after, schedule
+from ..settings import settings
+from ..storage import ImageMeta, StoredImage, store
+from .base import ImageProvider, ImageResult
+
+if TYPE_CHECKING:
+    from openai import OpenAI, Stream
+
+MODEL = "gpt-image-1"
+
+
+@lru_cache(maxsize=8)
+def _client_for(api_key: str, base_url: Optional[str], timeout: float) -> "OpenAI":
+    # Un cliente (y su pool de conexiones) por API key, reutilizado entre peticiones
+    from openai import OpenAI
+
+    return OpenAI(api_key=api_key, base_url=base_url, timeout=timeout)
+
+
+def _openai_call(fn, **kwargs):
+    """Llamada síncrona al SDK; el 429 final se entrega al planificador como RateLimited."""
+    from openai import APIConnectionError, InternalServerError, RateLimitError
+
+    try:
+        with phase("openai", "submit"):
+            return fn(**kwargs)
+    except RateLimitError as e:
+        raise RateLimited(parse_retry_after(e.response.headers.get("retry-after")), str(e))
+    except (APIConnectionError, InternalServerError) as e:
+        # Red, timeout o 5xx (tras los reintentos del propio SDK): cuentan para el circuit breaker
+        raise TransientError(status_code=502, detail=f"OpenAI error: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"OpenAI error: {e}")
+
+
+def _save_png(img: Any, meta: ImageMeta, missing: str) -> Tuple[str, bytes, StoredImage]:
+    try:
+        b64_png = img.data[0].b64_json
+    except Exception:
+        raise HTTPException(status_code=500, detail=missing)
+    return _save_b64(b64_png, meta)
+
+
+def _save_b64(b64_png: str, meta: ImageMeta) -> Tuple[str, bytes, StoredImage]:
+    # Decodificar y guardar localmente
+    try:
+        with phase("openai", "encode"):
+            image_bytes = base64.b64decode(b64_png)
+    except Exception:
+        raise HTTPException(status_code=500, detail="Error al decodificar la imagen base64")
+
+    try:
+        with phase("openai", "save") as p:
+            p.span.set_attribute("bytes", len(image_bytes))
+            stored = store.put_bytes(image_bytes, meta)
+    except (OSError, sqlite3.Error) as e:
+        raise HTTPException(status_code=500, detail=f"Error al guardar la imagen: {e}")
+
+    return b64_png, image_bytes, stored
+
+
+class OpenAIProvider(ImageProvider):
+    name = "openai"
+    api_key_env = "OPENAI_API_KEY"
+
+    def _client(self) -> "OpenAI":
+        api_key = self.api_key()
+        if not api_key:
+            raise HTTPException(status_code=500, detail="Falta OPENAI_API_KEY en variables de entorno")
+        return _client_for(api_key, settings.openai_base_url, settings.openai_timeout)
+
+    async def _call(self, fn) -> Any:
+        return await schedule("openai", lambda: breakers["openai"].call(lambda: run_in_threadpool(fn)))
+
+    async def _generate(
+        self,
+        prompt: str,
+        width: int,
+        height: int,
+        quality: str,
+        model: Optional[str],
+        background_save: bool,
+    ) -> ImageResult:
+        client = self._client()
+
+        def call():
+            return _openai_call(
+                client.images.generate,
+                model=MODEL,
+                prompt=prompt,
+                background="transparent",
+                n=1,
+                quality=quality,
+                size=f"{width}x{height}",
+                moderation="auto",
+                output_format="png",
+            )
+
+        img = await self._call(call)
+        meta = ImageMeta(self.name, prompt, size=f"{width}x{height}", label="image")
+        b64_png, image_bytes, stored = await run_in_threadpool(_save_png, img, meta, "No se pudo obtener la imagen generada")
+        return ImageResult(self.name, stored.path, image_bytes=image_bytes, b64=b64_png, generation_id=stored.id)
+
+    async def open_stream(self, prompt: str, width: int, height: int, quality: str, partial_images: int) -> "Stream[Any]":
+        """Abre la generación en modo streaming (vuelve al recibir las cabeceras, no la imagen)."""
+        client = self._client()
+
+        def call():
+            return _openai_call(
+                client.images.generate,
+                model=MODEL,
+                prompt=prompt,
+                background="transparent",
+                n=1,
+                quality=quality,
+                size=f"{width}x{height}",
+                moderation="auto",
+                output_format="png",
+                stream=True,
+                partial_images=partial_images,
+            )
+
+        # El planificador y el breaker solo cubren la apertura; los eventos fluyen sin ocupar turno
+        return await self._call(call)
+
+    async def stream_events(self, stream: "Stream[Any]", meta: ImageMeta) -> AsyncIterator[Tuple[str, Any]]:
+        """Eventos de `open_stream`: ("partial", evento del SDK) por cada imagen parcial y
+        ("done", ImageResult) al final. Solo se guarda la imagen final."""
+        started = time.perf_counter()
+        first = True
+        try:
+            # El SDK es síncrono: cada evento se espera en el threadpool
+            async for event in iterate_in_threadpool(iter(stream)):
+                if event.type == "image_generation.partial_image":
+                    if first:
+                        # Tiempo hasta el primer píxel que ve el usuario
+                        observe_phase("openai", "first_partial", time.perf_counter() - started)
+                        first = False
+                    yield "partial", event
+                elif event.type == "image_generation.completed":
+                    observe_phase("openai", "stream", time.perf_counter() - started)
+                    b64_png, image_bytes, stored = await run_in_threadpool(_save_b64, event.b64_json, meta)
+                    yield "done", ImageResult(self.name, stored.path, image_bytes=image_bytes, b64=b64_png, generation_id=stored.id)
+                    return
+            raise HTTPException(status_code=502, detail="OpenAI cerró el stream sin enviar la imagen final")
+        finally:
+            # Si el cliente se desconecta, cerrar la respuesta cancela la generación upstream
+            await run_in_threadpool(stream.close)
+
+    async def edit(self, prompt: str, size: str, quality: str, ref_files: List[tuple]) -> ImageResult:
+        """Edita/genera a partir de imágenes de referencia `(nombre, fichero, MIME)`."""
+        client = self._client()
+
+        def call():
+            # Un reintento tras 429 vuelve a leer los ficheros desde el principio
+            for _, f, _ in ref_files:
+                f.seek(0)
+            return _openai_call(
+                client.images.edit,
+                model=MODEL,
+                image=ref_files,
+                prompt=prompt,
+                n=1,
+                quality=quality,
+                size=size,
+            )
+
+        img = await self._call(call)
+        meta = ImageMeta(self.name, prompt, size=size, label="edit")
+        b64_png, image_bytes, stored = await run_in_threadpool(_save_png, img, meta, "No se pudo obtener la imagen editada")
+        return ImageResult(self.name, stored.path, image_bytes=image_bytes, b64=b64_png, generation_id=stored.id)
+
+
+provider = OpenAIProvider()
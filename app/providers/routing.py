@@ -0,0 +1,71 @@
+"""Enrutado de /images/generate: elige proveedor por latencia y errores recientes y hace failover."""
+import random
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from ..resilience import breakers
+from ..settings import env_float
+from .base import ImageProvider, ImageResult, is_provider_failure
+
+# Probabilidad de probar primero un proveedor al azar para que sus estadísticas no se queden viejas
+IMAGES_EXPLORE_RATE = env_float("IMAGES_EXPLORE_RATE", 0.05)
+# Cuánto penaliza la tasa de error: score = latencia * (1 + penalización * tasa_error)
+IMAGES_ERROR_PENALTY = env_float("IMAGES_ERROR_PENALTY", 4.0)
+
+
+class ProviderRouter:
+    def __init__(self, providers: Dict[str, ImageProvider]):
+        self.providers = providers
+
+    def score(self, provider: ImageProvider) -> float:
+        # Sin muestras: 0, así se prueba antes que los ya medidos
+        if provider.stats.latency is None:
+            return 0.0
+        return provider.stats.latency * (1 + IMAGES_ERROR_PENALTY * provider.stats.error_rate)
+
+    def candidates(self, allowed: Optional[List[str]] = None) -> List[ImageProvider]:
+        eligible = [
+            p for name, p in self.providers.items()
+            if (allowed is None or name in allowed) and p.configured() and breakers[name].available
+        ]
+        ordered = sorted(eligible, key=self.score)
+        if len(ordered) > 1 and random.random() < IMAGES_EXPLORE_RATE:
+            ordered.insert(0, ordered.pop(random.randrange(1, len(ordered))))
+        return ordered
+
+    async def generate(
+        self,
+        prompt: str,
+        width: int,
+        height: int,
+        quality: str = "low",
+        allowed: Optional[List[str]] = None,
+        background_save: bool = False,
+    ) -> Tuple[ImageResult, List[Dict[str, Any]]]:
+        """Prueba los candidatos en orden; devuelve el resultado y los intentos fallidos."""
+        attempts: List[Dict[str, Any]] = []
+        for provider in self.candidates(allowed):
+            try:
+                result = await provider.generate(prompt, width, height, quality, background_save=background_save)
+            except HTTPException as e:
+                # Un error del cliente (4xx) fallaría igual en otro proveedor
+                if not is_provider_failure(e):
+                    raise
+                attempts.append({"provider": provider.name, "status_code": e.status_code, "error": str(e.detail)})
+                continue
+            return result, attempts
+        if not attempts:
+            raise HTTPException(status_code=503, detail="No hay proveedores de imagen disponibles (sin API key o con el circuito abierto)")
+        raise HTTPException(status_code=502, detail={"error": "Ningún proveedor pudo generar la imagen", "attempts": attempts})
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            name: {
+                "configured": p.configured(),
+                "breaker": breakers[name].state,
+                "score": round(self.score(p), 4),
+                **p.stats.snapshot(),
+            }
+            for name, p in self.providers.items()
+        }
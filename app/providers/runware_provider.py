@@ -0,0 +1,151 @@
+"""Runware: inferencia por REST o, si está activado, por el WebSocket persistente."""
+import uuid
+from typing import List, Optional
+
+from fastapi import HTTPException
+
+from ..downloads import download_in_background, download_to_store
+from ..http_clients import get_client
+from ..metrics import phase
+from ..resilience import breakers
+from ..runware_ws import RUNWARE_WS_URL, RunwareWSError, RunwareWSPool, RunwareWSTasksLost
+from ..scheduler import raise_for_rate_limit, schedule
+from ..settings import env_bool, env_float, env_int, env_str, settings
+from ..storage import ImageMeta
+from .base import ImageProvider, ImageResult
+
+RUNWARE_ENDPOINT = settings.runware_endpoint
+DEFAULT_MODEL = "rundiffusion:130@100"
+
+# Transporte WebSocket opcional; si no está listo se usa la API REST
+RUNWARE_WS_ENABLED = env_bool("RUNWARE_WS_ENABLED", False)
+ws_pool: Optional[RunwareWSPool] = None
+
+
+async def start_ws() -> None:
+    global ws_pool
+    api_key = settings.runware_api_key
+    if not RUNWARE_WS_ENABLED or not api_key or ws_pool is not None:
+        return
+    ws_pool = RunwareWSPool(
+        env_str("RUNWARE_WS_URL", RUNWARE_WS_URL),
+        api_key,
+        size=env_int("RUNWARE_WS_POOL_SIZE", 1),
+        heartbeat=env_float("RUNWARE_WS_HEARTBEAT", 30.0),
+        timeout=env_float("RUNWARE_WS_TIMEOUT", 60.0),
+    )
+    await ws_pool.start()
+
+
+async def stop_ws() -> None:
+    global ws_pool
+    if ws_pool is not None:
+        await ws_pool.stop()
+        ws_pool = None
+
+
+def _headers(api_key: str) -> dict:
+    return {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+    }
+
+
+def task(task_uuid: str, prompt: str, model: Optional[str], width: int = 768, height: int = 768) -> dict:
+    return {
+        "taskType": "imageInference",
+        "taskUUID": task_uuid,
+        "positivePrompt": prompt,
+        "model": model or DEFAULT_MODEL,
+        "outputType": "URL",
+        "outputFormat": "PNG",
+        "outputQuality": 95,
+        "numberResults": 1,
+        "includeCost": False,
+        "width": width,
+        "height": height,
+    }
+
+
+async def post_tasks(api_key: str, payload: List[dict], priority: Optional[int] = None) -> dict:
+    return await schedule("runware", lambda: _send_tasks(api_key, payload), priority)
+
+
+async def _send_tasks(api_key: str, payload: List[dict]) -> dict:
+    if ws_pool is not None and ws_pool.ready:
+        try:
+            with phase("runware", "submit"):
+                return await ws_pool.submit(payload)
+        except RunwareWSError:
+            # El frame no llegó a enviarse: se puede usar REST sin duplicar la generación
+            pass
+        except RunwareWSTasksLost as e:
+            # Runware pudo aceptar las tareas: reenviarlas las ejecutaría (y cobraría) dos veces
+            raise HTTPException(status_code=502, detail=f"Se perdió la conexión con Runware con la generación en curso: {e}")
+
+    async def send():
+        with phase("runware", "submit") as p:
+            r = await get_client("runware").post(RUNWARE_ENDPOINT, headers=_headers(api_key), json=payload)
+            p.status = r.status_code
+        return r
+
+    # Generar no es idempotente: sin reintentos, solo el circuit breaker
+    try:
+        r = await breakers["runware"].call(send)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Error de red al llamar a Runware: {e}")
+    raise_for_rate_limit(r)
+
+    try:
+        out = r.json()
+    except Exception:
+        out = None
+
+    # Con tareas mezcladas Runware puede responder error pero con 'data' parcial
+    if r.status_code != 200 and not (isinstance(out, dict) and out.get("data")):
+        raise HTTPException(status_code=502, detail={"status": r.status_code, "error": out if out is not None else r.text})
+
+    return out if isinstance(out, dict) else {}
+
+
+class RunwareProvider(ImageProvider):
+    name = "runware"
+    api_key_env = "RUNWARE_API_KEY"
+
+    async def _generate(
+        self,
+        prompt: str,
+        width: int,
+        height: int,
+        quality: str,
+        model: Optional[str],
+        background_save: bool,
+    ) -> ImageResult:
+        api_key = self.api_key()
+        if not api_key:
+            raise HTTPException(status_code=500, detail="Falta RUNWARE_API_KEY en variables de entorno")
+
+        out = await post_tasks(api_key, [task(str(uuid.uuid4()), prompt, model, width, height)])
+
+        try:
+            data_list = out.get("data") or []
+            first = data_list[0] if isinstance(data_list, list) and data_list else None
+            image_url = first.get("imageURL") if isinstance(first, dict) else None
+        except Exception:
+            image_url = None
+
+        if not image_url:
+            raise HTTPException(status_code=502, detail="La respuesta de Runware.ai no contiene 'imageURL'.")
+
+        # Descargar y guardar localmente
+        meta = ImageMeta(self.name, prompt, size=f"{width}x{height}", label=model or DEFAULT_MODEL, remote_url=image_url)
+        if background_save:
+            generation_id = await download_in_background(get_client("runware"), image_url, meta)
+            return ImageResult(self.name, None, remote_url=image_url, save_pending=True, generation_id=generation_id)
+        stored = await download_to_store(get_client("runware"), image_url, meta)
+        return ImageResult(self.name, stored.path, remote_url=image_url, generation_id=stored.id)
+
+
+provider = RunwareProvider()
@@ -0,0 +1,248 @@
+"""Resiliencia frente a proveedores: reintentos con jitter, peticiones hedged y circuit breaker.
+
+- `retry`: solo para pasos idempotentes (polling, descargas). Reintenta errores
+  de red y respuestas 5xx con backoff exponencial y jitter completo.
+- `hedged`: si la primera llamada tarda más que el percentil configurado de
+  las latencias recientes, lanza una segunda y se queda con la primera que
+  responda.
+- `CircuitBreaker`: tras N fallos transitorios seguidos el proveedor se da por
+  caído y las llamadas fallan al instante con 503 hasta que una prueba
+  (half-open) vuelva a salir bien.
+"""
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Any, AsyncContextManager, Awaitable, Callable, Deque, Dict, Optional
+
+import httpx
+from fastapi import HTTPException
+
+from .settings import env_float, env_int
+from .tracing import add_event
+
+PROVIDERS = ("openai", "gemini", "runware", "bfl")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+RETRY_ATTEMPTS = env_int("RETRY_ATTEMPTS", 3)
+RETRY_BASE_DELAY = env_float("RETRY_BASE_DELAY", 0.2)
+RETRY_MAX_DELAY = env_float("RETRY_MAX_DELAY", 5.0)
+
+TRANSIENT_STATUS = {500, 502, 503, 504}
+
+_stats: Dict[str, int] = {"retries": 0, "hedges": 0, "hedge_wins": 0}
+
+
+class CircuitOpen(HTTPException):
+    """El breaker del proveedor está abierto: no se llega a llamar upstream."""
+
+
+class TransientError(HTTPException):
+    """Fallo de red o 5xx del upstream ya convertido en HTTPException; se puede reintentar."""
+
+
+def is_transient(outcome: Any) -> bool:
+    """Errores de red, timeouts y respuestas 5xx. El resto (4xx, 429...) indica que el proveedor responde."""
+    if isinstance(outcome, BaseException):
+        return isinstance(outcome, (TransientError, httpx.TransportError, asyncio.TimeoutError))
+    status = getattr(outcome, "status_code", None)
+    return isinstance(status, int) and status in TRANSIENT_STATUS
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self.rejected = 0
+        self._probing = False
+
+    @classmethod
+    def from_env(cls, name: str) -> "CircuitBreaker":
+        prefix = name.upper()
+        return cls(
+            name,
+            failure_threshold=env_int(f"{prefix}_BREAKER_THRESHOLD", 5),
+            reset_timeout=env_float(f"{prefix}_BREAKER_RESET", 30.0),
+        )
+
+    @property
+    def available(self) -> bool:
+        """False mientras el circuito está abierto y no ha pasado `reset_timeout`."""
+        return self.state != OPEN or time.monotonic() >= self.opened_at + self.reset_timeout
+
+    async def call(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self._before()
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            self._probing = False
+            raise
+        except Exception as e:
+            self._record(is_transient(e))
+            raise
+        self._record(is_transient(result))
+        return result
+
+    def _before(self) -> None:
+        if self.state == OPEN:
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                self._reject(remaining)
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            # Solo una llamada de prueba a la vez
+            if self._probing:
+                self._reject(1)
+            self._probing = True
+
+    def _reject(self, retry_after: float) -> None:
+        self.rejected += 1
+        raise CircuitOpen(
+            status_code=503,
+            detail=f"Proveedor {self.name} no disponible temporalmente (circuito abierto)",
+            headers={"Retry-After": str(max(1, int(retry_after + 0.999)))},
+        )
+
+    def _record(self, failed: bool) -> None:
+        self._probing = False
+        if not failed:
+            self.state = CLOSED
+            self.failures = 0
+            return
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.trips += 1
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        retry_in = self.opened_at + self.reset_timeout - time.monotonic() if self.state == OPEN else 0.0
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "retry_in": round(max(0.0, retry_in), 3),
+            "trips": self.trips,
+            "rejected": self.rejected,
+        }
+
+
+breakers: Dict[str, CircuitBreaker] = {name: CircuitBreaker.from_env(name) for name in PROVIDERS}
+
+
+async def retry(
+    fn: Callable[[], Awaitable[Any]],
+    attempts: Optional[int] = None,
+    base_delay: Optional[float] = None,
+    max_delay: Optional[float] = None,
+) -> Any:
+    """Reintenta `fn` ante fallos transitorios. El último intento devuelve o lanza tal cual."""
+    attempts = max(1, attempts if attempts is not None else RETRY_ATTEMPTS)
+    base_delay = RETRY_BASE_DELAY if base_delay is None else base_delay
+    max_delay = RETRY_MAX_DELAY if max_delay is None else max_delay
+    for attempt in range(attempts):
+        last = attempt == attempts - 1
+        try:
+            result = await fn()
+        except Exception as e:
+            if last or not is_transient(e):
+                raise
+        else:
+            if last or not is_transient(result):
+                return result
+        _stats["retries"] += 1
+        # Full jitter: evita que todos los clientes reintenten a la vez
+        delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+        add_event("retry", attempt=attempt + 2, delay=round(delay, 3))
+        await asyncio.sleep(delay)
+
+
+class LatencyTracker:
+    """Ventana de latencias recientes de llamadas correctas."""
+
+    def __init__(self, window: int = 200):
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def observe(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        idx = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))
+        return ordered[idx]
+
+
+async def hedged(
+    fn: Callable[[], Awaitable[Any]],
+    delay: Optional[float],
+    tracker: Optional[LatencyTracker] = None,
+    hedge_slot: Optional[Callable[[], AsyncContextManager[Any]]] = None,
+) -> Any:
+    """Lanza una segunda llamada si la primera no ha respondido en `delay` segundos.
+
+    Gana la primera que termine bien; la otra se cancela. Una respuesta
+    transitoria (5xx) no gana: se sigue esperando a la otra copia y solo se
+    devuelve (o se lanza el error) si fallan todas. `hedge_slot` da a la copia
+    su propio turno del planificador. Con `delay=None` es una llamada normal.
+    """
+
+    async def timed():
+        started = time.perf_counter()
+        result = await fn()
+        if tracker is not None and not is_transient(result):
+            tracker.observe(time.perf_counter() - started)
+        return result
+
+    async def hedge():
+        if hedge_slot is None:
+            return await timed()
+        async with hedge_slot():
+            return await timed()
+
+    tasks = [asyncio.ensure_future(timed())]
+    try:
+        if delay is not None:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                _stats["hedges"] += 1
+                tasks.append(asyncio.ensure_future(hedge()))
+        pending = set(tasks)
+        error: Optional[BaseException] = None
+        failed_result: Any = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
+                elif is_transient(task.result()):
+                    failed_result = task.result()
+                else:
+                    if task is not tasks[0]:
+                        _stats["hedge_wins"] += 1
+                    return task.result()
+        # Fallaron todas: mejor la respuesta del proveedor (con su status) que la excepción
+        if failed_result is not None:
+            return failed_result
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def stats() -> Dict[str, Any]:
+    return {**_stats, "breakers": {name: b.stats() for name, b in breakers.items()}}
@@ -0,0 +1,173 @@
+"""Caché de respuestas direccionada por contenido (memoria LRU + disco sqlite opcional)."""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+
+def cache_key(*parts: Any) -> str:
+    """sha256 de la representación JSON canónica de `parts`."""
+    raw = json.dumps(parts, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class CacheTier(ABC):
+    """Interfaz de un nivel de caché; los valores son bytes."""
+
+    name = "tier"
+    blocking = False
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        """Valor vigente de `key`, o None si no está o caducó."""
+
+    @abstractmethod
+    def set(self, key: str, value: bytes) -> None:
+        """Guarda `value` con el TTL del nivel."""
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class MemoryTier(CacheTier):
+    """LRU en memoria limitado por bytes totales, con TTL por entrada."""
+
+    name = "memory"
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                self._pop(key)
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._bytes += len(value)
+            while self._bytes > self.max_bytes:
+                self._pop(next(iter(self._data)))
+
+    def _pop(self, key: str) -> None:
+        _, value = self._data.pop(key)
+        self._bytes -= len(value)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._data), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+
+class SqliteTier(CacheTier):
+    """Nivel persistente en un fichero sqlite; sobrevive a reinicios.
+
+    Las entradas caducadas se borran como mucho cada `purge_interval` segundos
+    (al escribir), no en cada `set`: `get` ya las ignora.
+    """
+
+    name = "sqlite"
+    blocking = True
+
+    def __init__(self, path: str, ttl: float, purge_interval: float = 60.0):
+        self.path = path
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self.purged = 0
+        self._next_purge = 0.0
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+            )
+            # La purga borra por rango de expires_at sin recorrer toda la tabla
+            self._conn.execute("CREATE INDEX IF NOT EXISTS cache_expires_at ON cache(expires_at)")
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM cache WHERE key = ? AND expires_at >= ?", (key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: bytes) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, now + self.ttl),
+            )
+            if now >= self._next_purge:
+                self._next_purge = now + self.purge_interval
+                self.purged += self._conn.execute("DELETE FROM cache WHERE expires_at < ?", (now,)).rowcount
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+        return {"entries": entries, "path": self.path, "purged": self.purged}
+
+
+class ResponseCache:
+    """Cadena de niveles: se consulta en orden y los aciertos suben a los niveles previos."""
+
+    def __init__(self, tiers: List[CacheTier]):
+        self.tiers = tiers
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.tier_hits: Dict[str, int] = {t.name: 0 for t in tiers}
+
+    async def get(self, key: str) -> Optional[bytes]:
+        for idx, tier in enumerate(self.tiers):
+            value = await run_in_threadpool(tier.get, key) if tier.blocking else tier.get(key)
+            if value is not None:
+                self.hits += 1
+                self.tier_hits[tier.name] += 1
+                for upper in self.tiers[:idx]:
+                    if upper.blocking:
+                        await run_in_threadpool(upper.set, key, value)
+                    else:
+                        upper.set(key, value)
+                return value
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: bytes) -> None:
+        for tier in self.tiers:
+            if tier.blocking:
+                await run_in_threadpool(tier.set, key, value)
+            else:
+                tier.set(key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypasses": self.bypasses,
+            "tiers": {t.name: {**t.stats(), "hits": self.tier_hits[t.name]} for t in self.tiers},
+        }
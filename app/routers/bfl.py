@@ -1,23 +1,24 @@
-import os
-import re
-import time
 import base64
-from pathlib import Path
-from typing import Optional
-
-import httpx
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
+import asyncio
+import hashlib
+import hmac
+import json
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request, UploadFile, File, Form
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from dotenv import load_dotenv
 
-load_dotenv()
+from .. import preprocess
+from ..bfl_jobs import Job
+from ..downloads import DOWNLOAD_IN_BACKGROUND
+from ..metrics import phase
+from ..providers import bfl_provider
+from ..providers.base import ImageResult
+from ..providers.bfl_provider import jobs, provider
 
 router = APIRouter(prefix="/bfl", tags=["bfl"])
 
-BFL_API_URL = "https://api.bfl.ai/v1/flux-kontext-pro"
-POLLING_INTERVAL_SECONDS = 3
-MAX_POLLING_ATTEMPTS = 20
-
 
 class BFLKontextRequest(BaseModel):
     prompt: str = Field(..., min_length=1, description="Texto que describe la edición a realizar")
@@ -29,12 +30,25 @@ class BFLKontextRequest(BaseModel):
 class BFLKontextResponse(BaseModel):
     result_image_url: str
     saved_path: str
+    save_pending: bool = Field(False, description="True si la imagen aún se está guardando en segundo plano")
+    generation_id: Optional[int] = Field(None, description="Id en /generations (también cuando el guardado está pendiente)")
 
 
-@router.post("/flux-kontext", response_model=BFLKontextResponse)
-def flux_kontext(body: BFLKontextRequest):
-    api_key = os.getenv("BFL_API_KEY")
-    if not api_key:
+class BFLJobStatus(BaseModel):
+    job_id: str
+    status: str = Field(..., description="pending | waiting | polling | saving | ready | failed")
+    bfl_status: Optional[str] = None
+    progress: Optional[float] = None
+    request_id: Optional[str] = None
+    attempts: int = 0
+    result: Optional[BFLKontextResponse] = None
+    error: Optional[Any] = None
+    created_at: float
+    updated_at: float
+
+
+async def _create_job(body: BFLKontextRequest, background_save: bool = False, prepared: bool = False) -> Job:
+    if not provider.configured():
         raise HTTPException(status_code=500, detail="Falta BFL_API_KEY en variables de entorno")
 
     prompt = body.prompt.strip()
@@ -48,138 +62,146 @@ def flux_kontext(body: BFLKontextRequest):
         parts = image_b64.split(",", 1)
         image_b64 = parts[1] if len(parts) == 2 else image_b64
 
-    payload = {
-        "prompt": prompt,
-        "input_image": image_b64,
-        "safety_tolerance": 2,
-        "output_format": "png",
-        "prompt_upsampling": False,
-    }
+    # Validación de cabeceras y reescalado opcional (PREPROCESS_BFL_*); `prepared` si ya se hizo
+    if not prepared and preprocess.enabled("bfl"):
+        image_b64 = await preprocess.process_b64("bfl", image_b64)
 
-    headers = {
-        "accept": "application/json",
-        "x-key": api_key,
-        "Content-Type": "application/json",
-    }
+    return provider.create_job(prompt, image_b64, body.creature_name, body.prompt_label, background_save)
 
-    try:
-        with httpx.Client(timeout=60) as client:
-            initial_response = client.post(BFL_API_URL, json=payload, headers=headers)
-    except Exception as e:
-        raise HTTPException(status_code=502, detail=f"Error de red al llamar a BFL: {e}")
 
-    if initial_response.status_code != 200:
-        try:
-            details = initial_response.json()
-        except Exception:
-            details = initial_response.text
-        raise HTTPException(status_code=initial_response.status_code, detail={"error": "API error inicial", "details": details})
+def _kontext_response(result: ImageResult) -> BFLKontextResponse:
+    return BFLKontextResponse(
+        result_image_url=result.remote_url,
+        saved_path=str(result.saved_path or ""),
+        save_pending=result.save_pending,
+        generation_id=result.generation_id,
+    )
 
-    try:
-        initial_data = initial_response.json()
-        polling_url = initial_data.get("polling_url")
-        request_id = initial_data.get("id")
-    except Exception:
-        polling_url = None
-        request_id = None
 
-    if not polling_url:
-        raise HTTPException(status_code=502, detail={"error": "API error: polling URL no recibido.", "details": initial_response.text})
+def _job_status(snap: Dict[str, Any]) -> BFLJobStatus:
+    result = snap["result"]
+    return BFLJobStatus(**{**snap, "result": _kontext_response(result) if result is not None else None})
 
-    # Polling
-    poll_headers = {"accept": "application/json", "x-key": api_key}
-    poll_client = httpx.Client(timeout=60)
-    try:
-        for _ in range(MAX_POLLING_ATTEMPTS):
-            try:
-                poll_response = poll_client.get(polling_url, headers=poll_headers)
-            except Exception as e:
-                raise HTTPException(status_code=502, detail=f"Error durante el polling: {e}")
 
-            if poll_response.status_code != 200:
-                try:
-                    details = poll_response.json()
-                except Exception:
-                    details = poll_response.text
-                raise HTTPException(status_code=poll_response.status_code, detail={"error": "Error en polling", "details": details})
-
-            try:
-                poll_data = poll_response.json()
-            except Exception:
-                raise HTTPException(status_code=502, detail="Respuesta de polling inválida")
-
-            status = poll_data.get("status")
-            if status == "Ready":
-                result = poll_data.get("result") or {}
-                image_result_url = result.get("sample")
-                if not image_result_url:
-                    raise HTTPException(status_code=502, detail={"error": "Procesado pero sin URL de imagen.", "details": poll_data})
-
-                # Guardar imagen localmente
-                safe_creature = re.sub(r"[^\w\-_ ]", "", body.creature_name or "UnknownCreature").replace(" ", "_")
-                safe_label = re.sub(r"[^\w\-_ ]", "", body.prompt_label or "image").replace(" ", "_")
-                output_dir = Path(os.getenv("IMAGE_OUTPUT_DIR", "generated")) / "bfl" / safe_creature
-                try:
-                    output_dir.mkdir(parents=True, exist_ok=True)
-                except Exception as e:
-                    raise HTTPException(status_code=500, detail=f"No se pudo crear el directorio de salida: {e}")
+def _verify_webhook(request: Request, raw: bytes) -> bool:
+    # Acepta firma HMAC-SHA256 del cuerpo o el secreto compartido en cabecera
+    if not bfl_provider.BFL_WEBHOOK_SECRET:
+        return False
+    signature = request.headers.get("x-webhook-signature", "")
+    if signature:
+        expected = hmac.new(bfl_provider.BFL_WEBHOOK_SECRET.encode(), raw, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(signature.removeprefix("sha256="), expected)
+    secret = request.headers.get("x-webhook-secret", "")
+    return bool(secret) and hmac.compare_digest(secret, bfl_provider.BFL_WEBHOOK_SECRET)
 
-                base_url = (image_result_url or "").split("?", 1)[0]
-                ext = os.path.splitext(base_url)[1].lower()
-                if ext not in {".png", ".jpg", ".jpeg", ".webp"}:
-                    ext = ".png"
 
-                filename = f"{safe_label}_{int(time.time())}{ext}"
-                file_path = output_dir / filename
+def _get_job(job_id: str) -> Job:
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return job
 
-                try:
-                    with httpx.Client(timeout=120) as dl_client:
-                        img_resp = dl_client.get(image_result_url)
-                    if img_resp.status_code != 200:
-                        raise HTTPException(status_code=502, detail=f"No se pudo descargar la imagen: status {img_resp.status_code}")
-                    with open(file_path, "wb") as f:
-                        f.write(img_resp.content)
-                except HTTPException:
-                    raise
-                except Exception as e:
-                    raise HTTPException(status_code=500, detail=f"Imagen generada pero no se pudo guardar localmente: {e}")
 
-                return BFLKontextResponse(result_image_url=image_result_url, saved_path=str(file_path))
+@router.post("/flux-kontext", response_model=BFLKontextResponse)
+async def flux_kontext(
+    body: BFLKontextRequest,
+    background_save: bool = Query(DOWNLOAD_IN_BACKGROUND, description="Si true, responde sin esperar a guardar la imagen"),
+):
+    # Envoltorio síncrono sobre el subsistema de trabajos
+    job = await _create_job(body, background_save)
+    return _kontext_response(await job.wait())
+
+
+@router.post("/jobs", response_model=BFLJobStatus, status_code=202)
+async def create_job(
+    body: BFLKontextRequest,
+    background_save: bool = Query(DOWNLOAD_IN_BACKGROUND, description="Si true, el trabajo termina sin esperar a guardar la imagen"),
+):
+    """Encola una edición Flux-Kontext y devuelve el id del trabajo inmediatamente."""
+    job = await _create_job(body, background_save)
+    return _job_status(job.snapshot())
+
 
-            elif status in ("Failed", "Error"):
-                raise HTTPException(status_code=502, detail={"error": f"Falló el procesamiento en BFL (Status: {status}).", "details": poll_data.get("details") or poll_data})
+@router.get("/jobs/{job_id}", response_model=BFLJobStatus)
+async def get_job(job_id: str):
+    return _job_status(_get_job(job_id).snapshot())
 
-            time.sleep(POLLING_INTERVAL_SECONDS)
-    finally:
-        poll_client.close()
 
-    raise HTTPException(status_code=503, detail={"error": "El procesamiento está tardando demasiado.", "status": "Timeout", "request_id": request_id})
+@router.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    """Server-Sent Events con cada cambio de estado; termina con el estado final."""
+    job = _get_job(job_id)
+
+    async def stream():
+        queue = job.subscribe()
+        try:
+            while True:
+                try:
+                    snap = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    # Comentario SSE para mantener viva la conexión
+                    yield ": keep-alive\n\n"
+                    continue
+                data = _job_status(snap).model_dump_json()
+                yield f"event: {snap['status']}\ndata: {data}\n\n"
+                if snap["status"] in ("ready", "failed"):
+                    break
+        finally:
+            job.unsubscribe(queue)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@router.post("/webhook")
+async def webhook(request: Request):
+    """Callback de BFL: completa el trabajo en cuanto llega el resultado."""
+    raw = await request.body()
+    if not _verify_webhook(request, raw):
+        raise HTTPException(status_code=401, detail="Firma de webhook inválida")
+
+    try:
+        data = json.loads(raw)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cuerpo de webhook inválido")
+
+    request_id = (data.get("id") or data.get("task_id")) if isinstance(data, dict) else None
+    if not request_id:
+        raise HTTPException(status_code=400, detail="El webhook no incluye 'id'")
+
+    return {"received": True, "matched": jobs.handle_webhook(str(request_id), data)}
 
 
 @router.post("/flux-kontext-file", response_model=BFLKontextResponse)
-def flux_kontext_file(
+async def flux_kontext_file(
     prompt: str = Form(..., min_length=1, description="Texto que describe la edición a realizar"),
     image_file: UploadFile = File(..., description="Imagen a subir (png, jpg, jpeg, webp)"),
     creature_name: Optional[str] = Form("UnknownCreature", description="Nombre de la criatura para organizar las imágenes"),
     prompt_label: Optional[str] = Form("image", description="Etiqueta base del archivo de salida"),
+    background_save: bool = Query(DOWNLOAD_IN_BACKGROUND, description="Si true, responde sin esperar a guardar la imagen"),
 ):
     try:
-        # Lectura síncrona del archivo
-        content = image_file.file.read()
+        content = await image_file.read()
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"No se pudo leer la imagen: {e}")
 
     if not content:
         raise HTTPException(status_code=400, detail="Archivo de imagen vacío")
 
+    if preprocess.enabled("bfl"):
+        content, _ = await preprocess.process_bytes("bfl", content)
+
     # Convertir a base64 sin prefijo data:
-    image_b64 = base64.b64encode(content).decode("utf-8")
+    with phase("bfl", "encode"):
+        image_b64 = base64.b64encode(content).decode("utf-8")
 
-    # Reutilizar la lógica del endpoint JSON
+    # Reutilizar la lógica del endpoint JSON (la imagen ya está preprocesada)
     body = BFLKontextRequest(
         prompt=prompt,
         image_base64=image_b64,
         creature_name=creature_name,
         prompt_label=prompt_label,
     )
-    return flux_kontext(body)
+    job = await _create_job(body, background_save, prepared=True)
+    return _kontext_response(await job.wait())
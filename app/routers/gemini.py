@@ -1,16 +1,64 @@
-import os
-from typing import Optional
+import json
+import asyncio
+import time
+from typing import List, Optional, Tuple
 
-import httpx
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from dotenv import load_dotenv
 
-load_dotenv()
+from ..gemini_context import STALE_STATUS, ContextCache
+from ..http_clients import get_client
+from ..metrics import phase
+from ..resilience import LatencyTracker, breakers, hedged
+from ..response_cache import MemoryTier, ResponseCache, SqliteTier, cache_key
+from ..scheduler import BATCH, current_priority, raise_for_rate_limit, schedule, schedulers
+from ..settings import env_bool, env_float, env_int, env_str, settings
+from ..singleflight import singleflight
 
 router = APIRouter(prefix="/gemini", tags=["gemini"])
 
-GEMINI_ENDPOINT = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
+GEMINI_ENDPOINT = settings.gemini_endpoint
+GEMINI_STREAM_ENDPOINT = GEMINI_ENDPOINT.replace(":generateContent", ":streamGenerateContent") + "?alt=sse"
+
+# Caché de respuestas: LRU en memoria y, opcionalmente, sqlite en disco
+GEMINI_CACHE_ENABLED = env_bool("GEMINI_CACHE_ENABLED", True)
+GEMINI_CACHE_TTL = env_float("GEMINI_CACHE_TTL", 3600.0)
+
+
+def _build_cache() -> ResponseCache:
+    tiers = [MemoryTier(max_bytes=env_int("GEMINI_CACHE_MAX_BYTES", 64 * 1024 * 1024), ttl=GEMINI_CACHE_TTL)]
+    sqlite_path = env_str("GEMINI_CACHE_SQLITE")
+    if sqlite_path:
+        tiers.append(SqliteTier(sqlite_path, ttl=GEMINI_CACHE_TTL))
+    return ResponseCache(tiers)
+
+
+cache = _build_cache()
+
+# System prompts largos y repetidos como contenido cacheado en el servidor (cachedContents)
+context_cache = ContextCache(GEMINI_ENDPOINT)
+
+# Hedging: si la llamada supera el percentil de latencia reciente se lanza otra igual
+GEMINI_HEDGE_ENABLED = env_bool("GEMINI_HEDGE_ENABLED", False)
+GEMINI_HEDGE_PERCENTILE = env_float("GEMINI_HEDGE_PERCENTILE", 95.0)
+GEMINI_HEDGE_MIN_SAMPLES = env_int("GEMINI_HEDGE_MIN_SAMPLES", 20)
+GEMINI_HEDGE_DELAY = env_float("GEMINI_HEDGE_DELAY", 2.0)
+
+latency = LatencyTracker()
+
+GEMINI_BATCH_MAX_ITEMS = env_int("GEMINI_BATCH_MAX_ITEMS", 1000)
+GEMINI_BATCH_CONCURRENCY = env_int("GEMINI_BATCH_CONCURRENCY", 16)
+
+
+def _hedge_delay() -> Optional[float]:
+    if not GEMINI_HEDGE_ENABLED:
+        return None
+    # Hasta tener muestras suficientes se usa el retardo fijo
+    if len(latency) < GEMINI_HEDGE_MIN_SAMPLES:
+        return GEMINI_HEDGE_DELAY
+    return latency.percentile(GEMINI_HEDGE_PERCENTILE)
 
 
 class GeminiRequest(BaseModel):
@@ -22,7 +70,18 @@ class GeminiResponse(BaseModel):
     output_text: str
 
 
-def _extract_text(resp_json: dict) -> str:
+class GeminiBatchItem(BaseModel):
+    id: Optional[str] = Field(None, description="Identificador del cliente; se devuelve tal cual en su resultado")
+    system_prompt: Optional[str] = Field(None, min_length=1, description="Si falta, se usa el system_prompt del lote")
+    user_prompt: str = Field(..., min_length=1, description="Mensaje del usuario")
+
+
+class GeminiBatchRequest(BaseModel):
+    system_prompt: Optional[str] = Field(None, min_length=1, description="Instrucciones compartidas por los items que no traen las suyas")
+    items: List[GeminiBatchItem] = Field(..., min_length=1, max_length=GEMINI_BATCH_MAX_ITEMS)
+
+
+def _extract_text(resp_json: dict, strip: bool = True) -> str:
     try:
         candidates = resp_json.get("candidates") or []
         if not candidates:
@@ -33,18 +92,15 @@ def _extract_text(resp_json: dict) -> str:
             t = p.get("text")
             if isinstance(t, str):
                 parts.append(t)
-        return "\n".join(parts).strip()
+        text = "\n".join(parts)
+        # En streaming cada chunk es un delta: no se recortan espacios
+        return text.strip() if strip else text
     except Exception:
         return ""
 
 
-@router.post("/generate", response_model=GeminiResponse)
-def generate(body: GeminiRequest):
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise HTTPException(status_code=500, detail="Falta GEMINI_API_KEY en variables de entorno")
-
-    payload = {
+def _build_payload(body: GeminiRequest) -> dict:
+    return {
         "contents": [
             {
                 "role": "user",
@@ -57,14 +113,80 @@ def generate(body: GeminiRequest):
         },
     }
 
-    headers = {
+
+def _headers() -> dict:
+    api_key = settings.gemini_api_key
+    if not api_key:
+        raise HTTPException(status_code=500, detail="Falta GEMINI_API_KEY en variables de entorno")
+    return {
         "Content-Type": "application/json",
         "X-Goog-Api-Key": api_key,
     }
 
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/generate", response_model=GeminiResponse)
+async def generate(body: GeminiRequest, request: Request, response: Response):
+    headers = _headers()
+    result, cache_status = await _generate(headers, _build_payload(body), request.headers.get("cache-control", "").lower())
+    if cache_status:
+        response.headers["X-Cache"] = cache_status
+    return result
+
+
+async def _generate(headers: dict, payload: dict, cache_control: str) -> Tuple[GeminiResponse, Optional[str]]:
+    """Caché de respuestas + single-flight + llamada a Gemini. Devuelve (respuesta, HIT | MISS | BYPASS | None)."""
+    # Clave: modelo (endpoint) + payload completo (incluye parámetros de generación)
+    key = cache_key(GEMINI_ENDPOINT, payload)
+    cache_status = None
+    if GEMINI_CACHE_ENABLED:
+        if "no-cache" in cache_control:
+            cache.bypasses += 1
+            cache_status = "BYPASS"
+        else:
+            cached = await cache.get(key)
+            if cached is not None:
+                return GeminiResponse.model_validate_json(cached), "HIT"
+            cache_status = "MISS"
+
+    # Peticiones idénticas en vuelo comparten una sola llamada a Gemini
+    result = await singleflight.do("gemini", key, lambda: _call_gemini(headers, payload))
+    if GEMINI_CACHE_ENABLED and "no-store" not in cache_control:
+        await cache.set(key, result.model_dump_json().encode("utf-8"))
+    return result, cache_status
+
+
+async def _call_gemini(headers: dict, payload: dict) -> GeminiResponse:
+    context = context_cache.lookup(payload, headers)
+
+    async def post(name: Optional[str]):
+        with phase("gemini", "submit") as p:
+            r = await get_client("gemini").post(
+                GEMINI_ENDPOINT, headers=headers, json=context_cache.apply(payload, name) if name else payload
+            )
+            p.status = r.status_code
+        return r
+
+    async def send():
+        r = await post(context)
+        if context and context_cache.is_stale(r):
+            # El contexto caducó o se borró en el servidor: se repite con el prompt en línea
+            context_cache.invalidate(context)
+            r = await post(None)
+        raise_for_rate_limit(r)
+        return r
+
+    # La original va por `schedule` (reintentos por 429); la copia hedged pide su propio turno
+    def call():
+        return hedged(lambda: breakers["gemini"].call(send), _hedge_delay(), latency, hedge_slot=schedulers["gemini"].slot)
+
     try:
-        with httpx.Client(timeout=60) as client:
-            r = client.post(GEMINI_ENDPOINT, headers=headers, json=payload)
+        r = await schedule("gemini", call)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Error de red al llamar a Gemini: {e}")
 
@@ -79,3 +201,144 @@ def generate(body: GeminiRequest):
     data = r.json()
     text = _extract_text(data)
     return GeminiResponse(output_text=text)
+
+
+@router.post("/stream")
+async def stream(body: GeminiRequest, request: Request):
+    """Proxy de streamGenerateContent: reenvía cada delta de texto como Server-Sent Events."""
+    headers = _headers()
+    payload = _build_payload(body)
+
+    client = get_client("gemini")
+    context = context_cache.lookup(payload, headers)
+
+    async def open_stream(name: Optional[str]):
+        # Solo hasta recibir las cabeceras; el cuerpo se mide en la duración HTTP de /gemini/stream
+        with phase("gemini", "submit") as p:
+            upstream = await client.send(
+                client.build_request(
+                    "POST", GEMINI_STREAM_ENDPOINT, headers=headers, json=context_cache.apply(payload, name) if name else payload
+                ),
+                stream=True,
+            )
+            p.status = upstream.status_code
+        return upstream
+
+    async def send():
+        upstream = await open_stream(context)
+        if context and upstream.status_code in STALE_STATUS:
+            await upstream.aread()
+            if context_cache.is_stale(upstream):
+                await upstream.aclose()
+                context_cache.invalidate(context)
+                upstream = await open_stream(None)
+        if upstream.status_code == 429:
+            await upstream.aread()
+            await upstream.aclose()
+            raise_for_rate_limit(upstream)
+        return upstream
+
+    # El planificador regula la apertura del stream; el resto fluye sin ocupar turno
+    try:
+        upstream = await schedule("gemini", lambda: breakers["gemini"].call(send))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Error de red al llamar a Gemini: {e}")
+
+    if upstream.status_code != 200:
+        await upstream.aread()
+        await upstream.aclose()
+        try:
+            detail = upstream.json()
+        except Exception:
+            detail = upstream.text
+        raise HTTPException(status_code=502, detail={"status": upstream.status_code, "error": detail})
+
+    async def events():
+        chunks = []
+        try:
+            async for line in upstream.aiter_lines():
+                if await request.is_disconnected():
+                    break
+                if not line.startswith("data:"):
+                    continue
+                try:
+                    chunk = json.loads(line[5:])
+                except ValueError:
+                    continue
+                delta = _extract_text(chunk, strip=False)
+                if delta:
+                    chunks.append(delta)
+                    yield _sse("delta", {"text": delta})
+            else:
+                yield _sse("done", {"output_text": "".join(chunks).strip()})
+        except Exception as e:
+            yield _sse("error", {"error": f"Error durante el streaming de Gemini: {e}"})
+        finally:
+            # Si el cliente se desconecta, cerrar la respuesta cancela la petición upstream
+            await upstream.aclose()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@router.post("/batch")
+async def batch(body: GeminiBatchRequest, request: Request):
+    """Lanza todos los items contra Gemini (como mucho GEMINI_BATCH_CONCURRENCY a la vez) y devuelve
+    NDJSON: una línea por item en orden de finalización, con `output_text` o `error`."""
+    headers = _headers()
+    prepared = []
+    for index, item in enumerate(body.items):
+        system_prompt = item.system_prompt or body.system_prompt
+        if not system_prompt:
+            raise HTTPException(status_code=422, detail=f"El item {index} no tiene system_prompt y el lote tampoco")
+        prepared.append(GeminiRequest(system_prompt=system_prompt, user_prompt=item.user_prompt))
+    cache_control = request.headers.get("cache-control", "").lower()
+    semaphore = asyncio.Semaphore(max(1, GEMINI_BATCH_CONCURRENCY))
+
+    async def run(index: int, item: GeminiBatchItem, req: GeminiRequest) -> str:
+        line = {"index": index, "id": item.id, "output_text": None, "error": None, "status": 200, "cache": None}
+        started = time.perf_counter()
+        try:
+            async with semaphore:
+                result, line["cache"] = await _generate(headers, _build_payload(req), cache_control)
+            line["output_text"] = result.output_text
+        except HTTPException as e:
+            line["error"], line["status"] = e.detail, e.status_code
+        except Exception as e:
+            line["error"], line["status"] = f"Error al llamar a Gemini: {e}", 502
+        line["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return json.dumps(line, ensure_ascii=False) + "\n"
+
+    async def lines():
+        # Los lotes ceden el turno del planificador a las peticiones interactivas
+        current_priority.set(BATCH)
+        tasks = [asyncio.ensure_future(run(i, it, req)) for i, (it, req) in enumerate(zip(body.items, prepared))]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Si el cliente se desconecta no se siguen lanzando llamadas
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+# Async como /stats/*: contadores en memoria, sin pasar por el threadpool
+
+@router.get("/cache/stats")
+async def cache_stats():
+    """Contadores de aciertos/fallos de la caché de /gemini/generate."""
+    # El nivel sqlite (GEMINI_CACHE_SQLITE) cuenta filas en disco: solo entonces va al threadpool
+    if any(t.blocking for t in cache.tiers):
+        stats = await run_in_threadpool(cache.stats)
+    else:
+        stats = cache.stats()
+    return {"enabled": GEMINI_CACHE_ENABLED, **stats}
+
+
+@router.get("/cache/context")
+async def context_cache_stats():
+    """Contextos cacheados en Gemini (system prompts largos), aciertos y bytes ahorrados por petición."""
+    return context_cache.stats()
@@ -0,0 +1,57 @@
+from typing import List, Literal, Optional
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+
+from ..storage import store
+
+router = APIRouter(prefix="/generations", tags=["generations"])
+
+GENERATIONS_MAX_LIMIT = 200
+
+
+class Generation(BaseModel):
+    id: int
+    provider: str
+    prompt: Optional[str] = None
+    size: Optional[str] = Field(None, description="Tamaño pedido (WxH) o relación de aspecto")
+    creature: Optional[str] = None
+    label: Optional[str] = None
+    status: str = Field(..., description="pending | ready | failed")
+    error: Optional[str] = None
+    sha256: Optional[str] = None
+    bytes: Optional[int] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    path: Optional[str] = None
+    url: Optional[str] = None
+    remote_url: Optional[str] = None
+    created_at: float
+    completed_at: Optional[float] = None
+
+
+class GenerationPage(BaseModel):
+    items: List[Generation]
+    next_cursor: Optional[int] = Field(None, description="Pasar como 'cursor' para la página siguiente; null si no hay más")
+
+
+@router.get("", response_model=GenerationPage)
+async def list_generations(
+    provider: Optional[str] = Query(None, description="Filtra por proveedor (openai, runware, bfl)"),
+    creature: Optional[str] = Query(None, description="Filtra por creature_name"),
+    status: Optional[Literal["pending", "ready", "failed"]] = Query(None),
+    cursor: Optional[int] = Query(None, ge=1, description="next_cursor de la página anterior"),
+    limit: int = Query(50, ge=1, le=GENERATIONS_MAX_LIMIT),
+):
+    """Generaciones guardadas, de la más reciente a la más antigua (consulta indexada, sin recorrer directorios)."""
+    items, next_cursor = await run_in_threadpool(store.list, provider, creature, status, cursor, limit)
+    return GenerationPage(items=[Generation(**item) for item in items], next_cursor=next_cursor)
+
+
+@router.get("/{generation_id}", response_model=Generation)
+async def get_generation(generation_id: int):
+    item = await run_in_threadpool(store.get, generation_id)
+    if item is None:
+        raise HTTPException(status_code=404, detail="Generación no encontrada")
+    return Generation(**item)
@@ -0,0 +1,65 @@
+from typing import List, Literal, Optional
+
+from fastapi import APIRouter, Query, Response
+from pydantic import BaseModel, Field
+
+from ..downloads import DOWNLOAD_IN_BACKGROUND
+from ..providers import image_router
+from ..storage import public_url
+
+router = APIRouter(prefix="/images", tags=["images"])
+
+ProviderName = Literal["openai", "runware", "bfl"]
+
+
+class ImagesGenerateRequest(BaseModel):
+    prompt: str = Field(..., min_length=1, description="Texto que describe la imagen a generar")
+    # Tamaños que admiten los tres proveedores
+    size: Literal["1024x1024", "1536x1024", "1024x1536"] = Field("1024x1024", description="Tamaño de la imagen")
+    quality: Literal["low", "high"] = Field("low", description="Calidad (solo la usa OpenAI)")
+    providers: Optional[List[ProviderName]] = Field(None, description="Limita los proveedores candidatos (por defecto todos)")
+
+
+class ProviderAttempt(BaseModel):
+    provider: str
+    status_code: int
+    error: str
+
+
+class ImagesGenerateResponse(BaseModel):
+    provider: str
+    saved_path: str
+    url: Optional[str] = None
+    remote_url: Optional[str] = None
+    save_pending: bool = False
+    generation_id: Optional[int] = None
+    failed_attempts: List[ProviderAttempt] = []
+
+
+@router.post("/generate", response_model=ImagesGenerateResponse)
+async def generate(
+    body: ImagesGenerateRequest,
+    response: Response,
+    background_save: bool = Query(DOWNLOAD_IN_BACKGROUND, description="Si true, responde sin esperar a guardar la imagen"),
+):
+    """Genera con el proveedor más rápido ahora mismo y pasa al siguiente si falla."""
+    width, height = (int(v) for v in body.size.split("x"))
+    result, attempts = await image_router.generate(
+        body.prompt, width, height, body.quality, allowed=body.providers, background_save=background_save
+    )
+    response.headers["X-Image-Provider"] = result.provider
+    return ImagesGenerateResponse(
+        provider=result.provider,
+        saved_path=str(result.saved_path or ""),
+        url=public_url(result.saved_path),
+        remote_url=result.remote_url,
+        save_pending=result.save_pending,
+        generation_id=result.generation_id,
+        failed_attempts=[ProviderAttempt(**a) for a in attempts],
+    )
+
+
+@router.get("/providers")
+async def providers():
+    """Latencia (EWMA), tasa de error y estado de cada proveedor, tal como los ve el enrutado."""
+    return image_router.stats()
@@ -0,0 +1,11 @@
+from fastapi import APIRouter, Response
+
+from ..metrics import CONTENT_TYPE, registry
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Exposición en formato de texto de Prometheus."""
+    return Response(registry.render(), media_type=CONTENT_TYPE)
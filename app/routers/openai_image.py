@@ -1,20 +1,22 @@
+import io
+import json
 import os
-import base64
 import re
-import time
-from pathlib import Path
-from typing import Literal, List
+from typing import Literal, List, Optional, Union
 
-from fastapi import APIRouter, HTTPException, Query, UploadFile, File, Form
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, Query, Request, UploadFile, File, Form
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
-from dotenv import load_dotenv
-from openai import OpenAI
 
-# Carga variables de entorno desde .env
-load_dotenv()
+from .. import preprocess
+from ..providers.base import ImageResult
+from ..providers.openai_provider import MODEL, provider
+from ..response_cache import cache_key
+from ..singleflight import singleflight
+from ..storage import ImageMeta, download_name, public_url, store
 
-# El cliente se inicializa dentro del endpoint para validar la API key
+# El cliente del SDK lo crea (una vez por API key) el proveedor en la primera llamada
 
 router = APIRouter(prefix="/image", tags=["image"])
 
@@ -25,19 +27,65 @@ class ImageRequest(BaseModel):
     quality: Literal["low", "high"] = Field(..., description="Calidad de la imagen")
 
 
+class ImageStreamRequest(ImageRequest):
+    partial_images: int = Field(2, ge=0, le=3, description="Imágenes parciales a recibir antes de la final (0-3)")
+
+
 class ImageResponse(BaseModel):
     image_b64: str
     content_type: str = "image/png"
     saved_path: str
+    generation_id: Optional[int] = None
+
+
+class ImageURLResponse(BaseModel):
+    url: Optional[str]
+    content_type: str = "image/png"
+    saved_path: str
+    generation_id: Optional[int] = None
+
+
+ResponseMode = Literal["b64", "url", "binary"]
+RESPONSE_MODE_DESCRIPTION = "Formato: b64 (JSON con base64, por defecto), url (solo ruta) o binary (PNG). 'Accept: image/*' equivale a binary"
 
 
-@router.post("/edit", response_model=ImageResponse)
-def edit_image(
+async def _image_reply(request: Request, mode: Optional[str], download: bool, result: ImageResult):
+    """Negociación de contenido común a /generate y /edit."""
+    file_path = result.saved_path
+    if download:
+        # Devuelve el archivo directamente como descarga, con un nombre legible (no el sha256)
+        item = await run_in_threadpool(store.get, result.generation_id) if result.generation_id is not None else None
+        return FileResponse(
+            path=str(file_path),
+            media_type="image/png",
+            filename=download_name(item) if item else file_path.name,
+        )
+
+    if mode is None and request.headers.get("accept", "").startswith("image/"):
+        mode = "binary"
+
+    url = public_url(file_path)
+    if mode == "binary":
+        headers = {"X-Saved-Path": str(file_path)}
+        if result.generation_id is not None:
+            headers["X-Generation-Id"] = str(result.generation_id)
+        if url:
+            headers["Content-Location"] = url
+        return Response(content=result.image_bytes, media_type="image/png", headers=headers)
+    if mode == "url":
+        return ImageURLResponse(url=url, saved_path=str(file_path), generation_id=result.generation_id)
+    return ImageResponse(image_b64=result.b64, saved_path=str(file_path), generation_id=result.generation_id)
+
+
+@router.post("/edit", response_model=Union[ImageResponse, ImageURLResponse])
+async def edit_image(
+    request: Request,
     prompt: str = Form(..., min_length=1, description="Texto que describe la edición a realizar"),
     size: str = Form(..., description="Tamaño de la imagen, ej: 256x256, 512x512, 1024x1024"),
     quality: Literal["low", "high"] = Form(..., description="Calidad de la imagen"),
     images: List[UploadFile] = File(..., description="1-8 imágenes de referencia"),
     download: bool = Query(False, description="Si true, devuelve el archivo como descarga (attachment)"),
+    response_mode: Optional[ResponseMode] = Query(None, alias="response", description=RESPONSE_MODE_DESCRIPTION),
 ):
     """Edita/genera una imagen a partir de múltiples imágenes de referencia (hasta 8)."""
     # Validaciones básicas
@@ -54,170 +102,93 @@ def edit_image(
         if uf.content_type not in allowed_types:
             raise HTTPException(status_code=400, detail=f"Tipo de imagen no soportado: {uf.content_type}")
 
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
+    if not provider.configured():
         raise HTTPException(status_code=500, detail="Falta OPENAI_API_KEY en variables de entorno")
-    client = OpenAI(api_key=api_key)
-
-    # Guardar referencias temporalmente para proporcionar archivos con nombre a la API
-    tmp_dir = Path(os.getenv("IMAGE_TMP_DIR", "generated/tmp"))
-    tmp_dir.mkdir(parents=True, exist_ok=True)
-    open_files = []
-    tmp_paths = []
-    ts = int(time.time())
-    try:
-        for idx, uf in enumerate(images[:8]):
-            try:
-                uf.file.seek(0)
-                data = uf.file.read()
-            except Exception:
-                raise HTTPException(status_code=400, detail="No se pudo leer uno de los archivos subidos")
-
-            ext = os.path.splitext(uf.filename or "")[1].lower()
-            if ext not in {".png", ".jpg", ".jpeg", ".webp"}:
-                # Si la extensión no es reconocida, predeterminar a .png
-                ext = ".png"
-
-            tmp_path = tmp_dir / f"ref_{ts}_{idx}{ext}"
-            try:
-                with open(tmp_path, "wb") as f:
-                    f.write(data)
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=f"Error al escribir archivo temporal: {e}")
-
-            try:
-                f = open(tmp_path, "rb")
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=f"Error al abrir archivo temporal: {e}")
-
-            open_files.append(f)
-            tmp_paths.append(tmp_path)
-
-        # Llamada a la API de OpenAI para editar con múltiples imágenes
+
+    # Se entregan al SDK los ficheros que ya creó FastAPI (en memoria o spooled
+    # a disco si son grandes) como (nombre, fichero, MIME): sin copias temporales
+    ref_files = []
+    for idx, uf in enumerate(images[:8]):
         try:
-            img = client.images.edit(
-                model="gpt-image-1",
-                image=open_files,
-                prompt=prompt,
-                n=1,
-                quality=quality,
-                size=size,
-            )
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"OpenAI error: {e}")
-    finally:
-        # Cerrar handles
-        for f in open_files:
-            try:
-                f.close()
-            except Exception:
-                pass
-        # Limpiar archivos temporales
-        for p in tmp_paths:
-            try:
-                p.unlink(missing_ok=True)
-            except Exception:
-                pass
-
-    try:
-        b64_png = img.data[0].b64_json
-    except Exception:
-        raise HTTPException(status_code=500, detail="No se pudo obtener la imagen editada")
-
-    # Decodificar y guardar
-    try:
-        image_bytes = base64.b64decode(b64_png)
-    except Exception:
-        raise HTTPException(status_code=500, detail="Error al decodificar la imagen base64")
-
-    output_dir = Path(os.getenv("IMAGE_OUTPUT_DIR", "generated")) / "edits"
-    try:
-        output_dir.mkdir(parents=True, exist_ok=True)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"No se pudo crear el directorio de salida: {e}")
-
-    slug = re.sub(r"[^a-zA-Z0-9_-]+", "-", prompt).strip("-")
-    slug = re.sub(r"-+", "-", slug)
-    filename = f"edit_{slug[:40]}_{int(time.time())}.png" if slug else f"edit_{int(time.time())}.png"
-    file_path = output_dir / filename
-
-    try:
-        with open(file_path, "wb") as f:
-            f.write(image_bytes)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error al guardar la imagen: {e}")
+            await uf.seek(0)
+        except Exception:
+            raise HTTPException(status_code=400, detail="No se pudo leer uno de los archivos subidos")
 
-    if download:
-        return FileResponse(
-            path=str(file_path),
-            media_type="image/png",
-            filename=file_path.name,
-        )
+        name, ext = os.path.splitext(os.path.basename(uf.filename or ""))
+        if ext.lower() not in {".png", ".jpg", ".jpeg", ".webp"}:
+            # Si la extensión no es reconocida, predeterminar a .png
+            ext = ".png"
+        name = name or f"ref_{idx}"
+
+        # Validación de cabeceras y reescalado opcional (PREPROCESS_OPENAI_*)
+        if preprocess.enabled("openai"):
+            processed = await preprocess.process_upload("openai", uf.file)
+            if processed is not None:
+                data, info = processed
+                ref_files.append((f"{name}{preprocess.EXTENSIONS[info.format]}", io.BytesIO(data), preprocess.MIME_TYPES[info.format]))
+                continue
+
+        ref_files.append((f"{name}{ext.lower()}", uf.file, uf.content_type))
+
+    # Llamada a la API de OpenAI para editar con múltiples imágenes
+    result = await provider.edit(prompt, size, quality, ref_files)
+    return await _image_reply(request, response_mode, download, result)
 
-    return ImageResponse(image_b64=b64_png, saved_path=str(file_path))
 
-@router.post("/generate", response_model=ImageResponse)
-def generate_image(
+@router.post("/generate", response_model=Union[ImageResponse, ImageURLResponse])
+async def generate_image(
     body: ImageRequest,
+    request: Request,
     download: bool = Query(False, description="Si true, devuelve el archivo como descarga (attachment)"),
+    response_mode: Optional[ResponseMode] = Query(None, alias="response", description=RESPONSE_MODE_DESCRIPTION),
 ):
     """Genera una imagen con gpt-image-1 y devuelve la imagen en Base64 (PNG)."""
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
+    if not provider.configured():
         raise HTTPException(status_code=500, detail="Falta OPENAI_API_KEY en variables de entorno")
 
-    client = OpenAI(api_key=api_key)
-
-    prompt = body.prompt
-    try:
-        img = client.images.generate(
-            model="gpt-image-1",
-            prompt=prompt,
-            background="transparent",
-            n=1,
-            quality=body.quality,
-            size=body.size,
-            moderation="auto",
-            output_format="png",
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"OpenAI error: {e}")
-
-    try:
-        b64_png = img.data[0].b64_json
-    except Exception:
-        raise HTTPException(status_code=500, detail="No se pudo obtener la imagen generada")
-
-    # Decodificar y guardar localmente
-    try:
-        image_bytes = base64.b64decode(b64_png)
-    except Exception:
-        raise HTTPException(status_code=500, detail="Error al decodificar la imagen base64")
-
-    output_dir = Path(os.getenv("IMAGE_OUTPUT_DIR", "generated"))
-    try:
-        output_dir.mkdir(parents=True, exist_ok=True)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"No se pudo crear el directorio de salida: {e}")
-
-    # Crear un nombre de archivo seguro a partir del prompt
-    slug = re.sub(r"[^a-zA-Z0-9_-]+", "-", prompt).strip("-")
-    slug = re.sub(r"-+", "-", slug)
-    filename = f"{slug[:40]}_{int(time.time())}.png" if slug else f"image_{int(time.time())}.png"
-    file_path = output_dir / filename
-
-    try:
-        with open(file_path, "wb") as f:
-            f.write(image_bytes)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error al guardar la imagen: {e}")
+    # Peticiones idénticas en vuelo comparten la llamada a OpenAI y el fichero guardado
+    key = cache_key(MODEL, body.prompt, body.size, body.quality)
+    width, height = (int(v) for v in body.size.split("x"))
+    result = await singleflight.do("openai", key, lambda: provider.generate(body.prompt, width, height, body.quality))
+    return await _image_reply(request, response_mode, download, result)
 
-    if download:
-        # Devuelve el archivo directamente como descarga
-        return FileResponse(
-            path=str(file_path),
-            media_type="image/png",
-            filename=file_path.name,
-        )
 
-    return ImageResponse(image_b64=b64_png, saved_path=str(file_path))
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/generate/stream")
+async def generate_image_stream(body: ImageStreamRequest, request: Request):
+    """Genera con gpt-image-1 en streaming: cada imagen parcial llega como evento SSE `partial` y la final, ya guardada, como `done`."""
+    if not provider.configured():
+        raise HTTPException(status_code=500, detail="Falta OPENAI_API_KEY en variables de entorno")
+
+    width, height = (int(v) for v in body.size.split("x"))
+    # Los errores al abrir (429, breaker abierto, clave inválida) son HTTP normales; después van como evento `error`
+    stream = await provider.open_stream(body.prompt, width, height, body.quality, body.partial_images)
+    meta = ImageMeta(provider.name, body.prompt, size=body.size, label="image")
+
+    async def events():
+        relay = provider.stream_events(stream, meta)
+        try:
+            async for kind, item in relay:
+                if await request.is_disconnected():
+                    break
+                if kind == "partial":
+                    yield _sse("partial", {"index": item.partial_image_index, "image_b64": item.b64_json, "content_type": "image/png"})
+                else:
+                    yield _sse("done", {
+                        "image_b64": item.b64,
+                        "content_type": "image/png",
+                        "url": public_url(item.saved_path),
+                        "saved_path": str(item.saved_path),
+                        "generation_id": item.generation_id,
+                    })
+        except HTTPException as e:
+            yield _sse("error", {"error": e.detail})
+        except Exception as e:
+            yield _sse("error", {"error": f"Error durante el streaming de OpenAI: {e}"})
+        finally:
+            await relay.aclose()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
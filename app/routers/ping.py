@@ -1,8 +1,12 @@
 from fastapi import APIRouter
 
+from ..resilience import breakers
+
 router = APIRouter()
 
 
+# async: no depende del threadpool, así responde aunque esté lleno
 @router.get("/ping")
-def ping():
-    return {"message": "pong"}
+async def ping():
+    # Estado del circuit breaker de cada proveedor: 'open' significa que se falla al instante
+    return {"message": "pong", "providers": {name: b.stats() for name, b in breakers.items()}}
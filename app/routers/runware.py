@@ -1,20 +1,23 @@
-import os
 import uuid
-from typing import Optional
+import asyncio
+from typing import Dict, List, Optional
 
-import httpx
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel, Field
-from dotenv import load_dotenv
-import re
-import time
-from pathlib import Path
 
-load_dotenv()
+from ..downloads import DOWNLOAD_IN_BACKGROUND, download_to_store
+from ..http_clients import get_client
+from ..providers.runware_provider import DEFAULT_MODEL, post_tasks, provider, task
+from ..response_cache import cache_key
+from ..scheduler import BATCH
+from ..settings import env_int
+from ..singleflight import singleflight
+from ..storage import ImageMeta
 
 router = APIRouter(prefix="/runware", tags=["runware"])
 
-RUNWARE_ENDPOINT = "https://api.runware.ai/v1/generate"
+RUNWARE_BATCH_MAX_ITEMS = env_int("RUNWARE_BATCH_MAX_ITEMS", 500)
+RUNWARE_DOWNLOAD_CONCURRENCY = env_int("RUNWARE_DOWNLOAD_CONCURRENCY", 8)
 
 
 class RunwareRequest(BaseModel):
@@ -28,92 +31,95 @@ class RunwareRequest(BaseModel):
 class RunwareResponse(BaseModel):
     image_url: str
     saved_path: str
+    save_pending: bool = Field(False, description="True si la imagen aún se está guardando en segundo plano")
+    generation_id: Optional[int] = Field(None, description="Id en /generations (también cuando el guardado está pendiente)")
+
+
+class RunwareBatchItem(BaseModel):
+    prompt: str = Field(..., min_length=1, description="Texto que describe la imagen a generar")
+    model: Optional[str] = Field(None, description="Modelo de Runware (opcional)")
+    width: int = Field(768, ge=128, le=2048, multiple_of=64, description="Ancho en píxeles (múltiplo de 64)")
+    height: int = Field(768, ge=128, le=2048, multiple_of=64, description="Alto en píxeles (múltiplo de 64)")
+
+
+class RunwareBatchRequest(BaseModel):
+    items: List[RunwareBatchItem] = Field(..., min_length=1, max_length=RUNWARE_BATCH_MAX_ITEMS)
+
+
+class RunwareBatchResult(BaseModel):
+    task_uuid: str
+    prompt: str
+    image_url: Optional[str] = None
+    saved_path: Optional[str] = None
+    generation_id: Optional[int] = None
+    error: Optional[str] = None
+
+
+class RunwareBatchResponse(BaseModel):
+    results: List[RunwareBatchResult]
 
 
 @router.post("/generate", response_model=RunwareResponse)
-def generate_image(body: RunwareRequest):
-    api_key = os.getenv("RUNWARE_API_KEY")
+async def generate_image(
+    body: RunwareRequest,
+    background_save: bool = Query(DOWNLOAD_IN_BACKGROUND, description="Si true, responde sin esperar a guardar la imagen"),
+):
+    if not provider.configured():
+        raise HTTPException(status_code=500, detail="Falta RUNWARE_API_KEY en variables de entorno")
+
+    # Mismo prompt y modelo en vuelo: una sola inferencia y un solo fichero guardado
+    key = cache_key(body.prompt, body.model or DEFAULT_MODEL, background_save)
+    result = await singleflight.do(
+        "runware", key, lambda: provider.generate(body.prompt, 768, 768, model=body.model, background_save=background_save)
+    )
+    return RunwareResponse(
+        image_url=result.remote_url,
+        saved_path=str(result.saved_path or ""),
+        save_pending=result.save_pending,
+        generation_id=result.generation_id,
+    )
+
+
+@router.post("/batch", response_model=RunwareBatchResponse)
+async def generate_batch(body: RunwareBatchRequest):
+    """Genera N imágenes con una sola llamada a Runware y las descarga en paralelo."""
+    api_key = provider.api_key()
     if not api_key:
         raise HTTPException(status_code=500, detail="Falta RUNWARE_API_KEY en variables de entorno")
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-    }
-
-    task_uuid = str(uuid.uuid4())
-    model_to_use = body.model or "rundiffusion:130@100"
-
-    payload = [
-        {
-            "taskType": "imageInference",
-            "taskUUID": task_uuid,
-            "positivePrompt": body.prompt,
-            "model": model_to_use,
-            "outputType": "URL",
-            "outputFormat": "PNG",
-            "outputQuality": 95,
-            "numberResults": 1,
-            "includeCost": False,
-            "width": 768,
-            "height": 768,
-        }
-    ]
-
-    try:
-        with httpx.Client(timeout=60) as client:
-            r = client.post(RUNWARE_ENDPOINT, headers=headers, json=payload)
-    except Exception as e:
-        raise HTTPException(status_code=502, detail=f"Error de red al llamar a Runware: {e}")
-
-    if r.status_code != 200:
+    uuids = [str(uuid.uuid4()) for _ in body.items]
+    payload = [task(u, it.prompt, it.model, it.width, it.height) for u, it in zip(uuids, body.items)]
+    # Los lotes ceden el turno a las peticiones interactivas
+    out = await post_tasks(api_key, payload, priority=BATCH)
+
+    # Emparejar resultados y errores por taskUUID (Runware no garantiza el orden)
+    urls: Dict[str, str] = {}
+    for item in out.get("data") or []:
+        if isinstance(item, dict) and item.get("taskUUID") and item.get("imageURL"):
+            urls.setdefault(item["taskUUID"], item["imageURL"])
+    errors: Dict[str, str] = {}
+    for err in out.get("errors") or []:
+        if isinstance(err, dict) and err.get("taskUUID"):
+            errors[err["taskUUID"]] = err.get("message") or str(err)
+
+    semaphore = asyncio.Semaphore(max(1, RUNWARE_DOWNLOAD_CONCURRENCY))
+
+    async def fetch(task_uuid: str, item: RunwareBatchItem) -> RunwareBatchResult:
+        result = RunwareBatchResult(task_uuid=task_uuid, prompt=item.prompt)
+        image_url = urls.get(task_uuid)
+        if not image_url:
+            result.error = errors.get(task_uuid, "La respuesta de Runware.ai no contiene 'imageURL'.")
+            return result
+        result.image_url = image_url
         try:
-            detail = r.json()
-        except Exception:
-            detail = r.text
-        raise HTTPException(status_code=502, detail={"status": r.status_code, "error": detail})
-
-    try:
-        out = r.json()
-        data_list = out.get("data") or []
-        first = data_list[0] if isinstance(data_list, list) and data_list else None
-        image_url = first.get("imageURL") if isinstance(first, dict) else None
-    except Exception:
-        image_url = None
-
-    if not image_url:
-        raise HTTPException(status_code=502, detail="La respuesta de Runware.ai no contiene 'imageURL'.")
-
-    # Descargar y guardar localmente
-    output_dir = Path(os.getenv("IMAGE_OUTPUT_DIR", "generated")) / "runware"
-    try:
-        output_dir.mkdir(parents=True, exist_ok=True)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"No se pudo crear el directorio de salida: {e}")
-
-    # Crear nombre de archivo seguro
-    slug = re.sub(r"[^a-zA-Z0-9_-]+", "-", body.prompt).strip("-")
-    slug = re.sub(r"-+", "-", slug)
-    base_url = image_url.split("?")[0]
-    ext = os.path.splitext(base_url)[1].lower()
-    if ext not in {".png", ".jpg", ".jpeg", ".webp"}:
-        ext = ".png"
-    filename = f"runware_{slug[:40]}_{int(time.time())}{ext}"
-    file_path = output_dir / filename
-
-    try:
-        with httpx.Client(timeout=120) as client:
-            img_resp = client.get(image_url)
-    except Exception as e:
-        raise HTTPException(status_code=502, detail=f"Error descargando la imagen de Runware: {e}")
-
-    if img_resp.status_code != 200:
-        raise HTTPException(status_code=502, detail=f"No se pudo descargar la imagen: status {img_resp.status_code}")
-
-    try:
-        with open(file_path, "wb") as f:
-            f.write(img_resp.content)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error al guardar la imagen: {e}")
-
-    return RunwareResponse(image_url=image_url, saved_path=str(file_path))
+            meta = ImageMeta("runware", item.prompt, size=f"{item.width}x{item.height}", label=item.model or DEFAULT_MODEL, remote_url=image_url)
+            async with semaphore:
+                stored = await download_to_store(get_client("runware"), image_url, meta)
+            result.saved_path = str(stored.path)
+            result.generation_id = stored.id
+        except HTTPException as e:
+            result.error = str(e.detail)
+        return result
+
+    results = await asyncio.gather(*(fetch(u, it) for u, it in zip(uuids, body.items)))
+    return RunwareBatchResponse(results=list(results))
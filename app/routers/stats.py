@@ -0,0 +1,67 @@
+from fastapi import APIRouter
+from fastapi.concurrency import run_in_threadpool
+
+from .. import admission, downloads, preprocess, resilience, thumbnails, tracing
+from ..scheduler import schedulers
+from ..singleflight import singleflight
+from ..storage import store
+
+router = APIRouter(prefix="/stats", tags=["stats"])
+
+# Todas async: leen contadores en memoria y no deben esperar por el threadpool.
+# Excepción: /stats/storage consulta sqlite y va al threadpool (no bloquea el event loop)
+
+
+@router.get("/singleflight")
+async def singleflight_stats():
+    """Llamadas upstream evitadas por coalescencia de peticiones idénticas."""
+    return singleflight.stats()
+
+
+@router.get("/downloads")
+async def downloads_stats():
+    """Descargas de imágenes resultado completadas, fallidas y pendientes en segundo plano."""
+    return downloads.stats()
+
+
+@router.get("/scheduler")
+async def scheduler_stats():
+    """Cola, turnos concedidos, esperas y 429 recibidos por proveedor."""
+    return {name: s.stats() for name, s in schedulers.items()}
+
+
+@router.get("/resilience")
+async def resilience_stats():
+    """Reintentos, peticiones hedged y estado de los circuit breakers."""
+    return resilience.stats()
+
+
+@router.get("/tracing")
+async def tracing_stats():
+    """Spans exportados, descartados (cola llena) y fallidos."""
+    return tracing.exporter.stats()
+
+
+@router.get("/admission")
+async def admission_stats():
+    """Peticiones en curso, en cola y rechazadas por grupo de rutas, y ocupación del threadpool."""
+    return admission.stats()
+
+
+@router.get("/preprocess")
+async def preprocess_stats():
+    """Configuración del preprocesado de subidas por ruta (los bytes ahorrados están en /metrics)."""
+    return preprocess.stats()
+
+
+@router.get("/storage")
+async def storage_stats():
+    """Objetos únicos en disco, generaciones indexadas y escrituras evitadas por deduplicación."""
+    # COUNT/SUM sobre el índice sqlite: bloquea, así que no puede ir en el event loop
+    return await run_in_threadpool(store.stats)
+
+
+@router.get("/thumbnails")
+async def thumbnails_stats():
+    """Miniaturas generadas (anticipadas y bajo demanda), pendientes y ocupación de la caché en disco."""
+    return thumbnails.stats()
@@ -0,0 +1,60 @@
+import logging
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, RedirectResponse
+
+from .. import thumbnails
+from ..metrics import METRICS_ENABLED, thumbnail_requests
+from ..storage import GENERATED_URL_PREFIX, store
+
+# Va antes del montaje estático de /generated para que esta ruta tenga prioridad
+router = APIRouter(prefix=GENERATED_URL_PREFIX, tags=["images"])
+
+logger = logging.getLogger(__name__)
+
+
+def _count(result: str) -> None:
+    if METRICS_ENABLED:
+        thumbnail_requests.inc(result=result)
+
+
+@router.get("/{generation_id}/thumb")
+async def thumbnail(
+    request: Request,
+    generation_id: int,
+    w: Optional[int] = Query(None, ge=1, description="Ancho deseado; se sirve el ancho configurado más cercano por encima"),
+):
+    """Miniatura WebP/AVIF (según Accept) de una generación guardada, cacheable para siempre."""
+    item = await run_in_threadpool(store.get, generation_id)
+    if item is None or item["status"] != "ready" or not item["sha256"]:
+        raise HTTPException(status_code=404, detail="Generación no encontrada o aún sin imagen")
+    if not thumbnails.HAS_PILLOW:
+        _count("fallback")
+        return RedirectResponse(item["url"], status_code=307)
+
+    width = thumbnails.snap_width(w)
+    formats = await thumbnails.ensure_ready()
+    fmt = thumbnails.negotiate(request.headers.get("accept", ""), formats)
+    headers = {
+        "Cache-Control": thumbnails.CACHE_CONTROL,
+        # El contenido depende de Accept (avif/webp): las cachés intermedias deben distinguirlo
+        "Vary": "Accept",
+        "ETag": f'"{item["sha256"][:16]}-{width}-{fmt}"',
+    }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        _count("not_modified")
+        return Response(status_code=304, headers=headers)
+
+    try:
+        path, hit = await thumbnails.get(item["sha256"], item["path"], width, fmt)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="El fichero original ya no existe")
+    except OSError as e:
+        # Pillow no puede decodificar el original (UnidentifiedImageError es un OSError): se sirve tal cual
+        logger.warning("No se pudo generar la miniatura de %s: %s", item["sha256"], e)
+        _count("fallback")
+        return RedirectResponse(item["url"], status_code=307)
+    _count("hit" if hit else "miss")
+    return FileResponse(path, media_type=thumbnails.MIME_TYPES[fmt], headers=headers)
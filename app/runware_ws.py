@@ -0,0 +1,194 @@
+"""Transporte WebSocket persistente para Runware (opcional).
+
+Cada conexión se autentica una sola vez y multiplexa muchas tareas
+`imageInference`; las respuestas se emparejan por `taskUUID`. Si la conexión
+no está lista o el envío falla, `submit` lanza `RunwareWSError` (las tareas no
+llegaron: el llamador puede enviarlas por REST). Si cae con tareas ya enviadas,
+lanza `RunwareWSTasksLost`: Runware pudo aceptarlas, así que no deben
+reenviarse. La conexión se reabre en segundo plano.
+"""
+import asyncio
+import itertools
+import json
+from typing import Any, Dict, List, Optional
+
+RUNWARE_WS_URL = "wss://ws-api.runware.ai/v1"
+
+
+class RunwareWSError(Exception):
+    """La conexión WebSocket no está disponible o el envío falló: las tareas no se enviaron."""
+
+
+class RunwareWSTasksLost(Exception):
+    """La conexión se cerró con tareas ya enviadas; Runware pudo ejecutarlas (y cobrarlas)."""
+
+
+class RunwareWSConnection:
+    def __init__(self, url: str, api_key: str, heartbeat: float = 30.0, reconnect_delay: float = 1.0):
+        self.url = url
+        self.api_key = api_key
+        self.heartbeat = heartbeat
+        self.reconnect_delay = reconnect_delay
+        self.session_uuid: Optional[str] = None
+        self.reconnects = 0
+        self._ws = None
+        self._ready = asyncio.Event()
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            # Cierre limpio (1000) antes de cancelar el bucle de reconexión
+            ws = self._ws
+            if ws is not None:
+                try:
+                    await ws.close()
+                except Exception:
+                    pass
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def wait_ready(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def submit(self, tasks: List[dict], timeout: float) -> Dict[str, Any]:
+        """Envía las tareas y devuelve `{"data": [...], "errors": [...]}` como la API REST."""
+        if not self.ready:
+            raise RunwareWSError("Conexión WebSocket con Runware no disponible")
+        loop = asyncio.get_running_loop()
+        futures = {t["taskUUID"]: loop.create_future() for t in tasks}
+        self._pending.update(futures)
+        try:
+            await self._ws.send(json.dumps(tasks))
+        except Exception as e:
+            for task_uuid in futures:
+                self._pending.pop(task_uuid, None)
+            raise RunwareWSError(f"Error enviando tareas por WebSocket: {e}")
+        try:
+            done, _ = await asyncio.wait(futures.values(), timeout=timeout)
+        finally:
+            for task_uuid in futures:
+                self._pending.pop(task_uuid, None)
+
+        out: Dict[str, Any] = {"data": [], "errors": []}
+        lost = None
+        for task_uuid, fut in futures.items():
+            if fut not in done:
+                fut.cancel()
+                out["errors"].append({"taskUUID": task_uuid, "message": "Timeout esperando el resultado por WebSocket"})
+                continue
+            exc = fut.exception()
+            if exc is not None:
+                lost = exc
+                continue
+            kind, item = fut.result()
+            out[kind].append(item)
+        if lost is not None:
+            raise lost
+        return out
+
+    async def _run(self) -> None:
+        import websockets
+
+        while True:
+            try:
+                async with websockets.connect(self.url, max_size=None) as ws:
+                    self._ws = ws
+                    await self._authenticate(ws)
+                    self._ready.set()
+                    heartbeat = asyncio.get_running_loop().create_task(self._heartbeat(ws))
+                    try:
+                        async for raw in ws:
+                            self._dispatch(raw)
+                    finally:
+                        heartbeat.cancel()
+            except asyncio.CancelledError:
+                self._close_pending()
+                raise
+            except Exception:
+                pass
+            self._close_pending()
+            self.reconnects += 1
+            await asyncio.sleep(self.reconnect_delay)
+
+    async def _authenticate(self, ws) -> None:
+        auth: Dict[str, Any] = {"taskType": "authentication", "apiKey": self.api_key}
+        # Reusar la sesión permite a Runware entregar resultados pendientes tras reconectar
+        if self.session_uuid:
+            auth["connectionSessionUUID"] = self.session_uuid
+        await ws.send(json.dumps([auth]))
+        msg = json.loads(await asyncio.wait_for(ws.recv(), timeout=10))
+        if msg.get("errors"):
+            raise RunwareWSError(f"Autenticación rechazada: {msg['errors']}")
+        for item in msg.get("data") or []:
+            if item.get("taskType") == "authentication":
+                self.session_uuid = item.get("connectionSessionUUID")
+
+    async def _heartbeat(self, ws) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            await ws.send(json.dumps([{"taskType": "ping", "ping": True}]))
+
+    def _dispatch(self, raw) -> None:
+        try:
+            msg = json.loads(raw)
+        except ValueError:
+            return
+        for kind in ("data", "errors"):
+            for item in msg.get(kind) or []:
+                if not isinstance(item, dict):
+                    continue
+                fut = self._pending.get(item.get("taskUUID"))
+                if fut is not None and not fut.done():
+                    fut.set_result((kind, item))
+
+    def _close_pending(self) -> None:
+        self._ready.clear()
+        self._ws = None
+        for fut in self._pending.values():
+            if not fut.done():
+                fut.set_exception(RunwareWSTasksLost("Conexión WebSocket con Runware cerrada con tareas en vuelo"))
+
+
+class RunwareWSPool:
+    """Pequeño pool de conexiones; reparte tareas en round-robin entre las listas."""
+
+    def __init__(self, url: str, api_key: str, size: int = 1, heartbeat: float = 30.0, timeout: float = 60.0):
+        self.timeout = timeout
+        self.connections = [RunwareWSConnection(url, api_key, heartbeat=heartbeat) for _ in range(max(1, size))]
+        self._rr = itertools.cycle(range(len(self.connections)))
+
+    async def start(self, wait: float = 5.0) -> None:
+        for conn in self.connections:
+            conn.start()
+        await asyncio.gather(*(c.wait_ready(wait) for c in self.connections))
+
+    async def stop(self) -> None:
+        await asyncio.gather(*(c.stop() for c in self.connections))
+
+    @property
+    def ready(self) -> bool:
+        return any(c.ready for c in self.connections)
+
+    def _pick(self) -> RunwareWSConnection:
+        for _ in range(len(self.connections)):
+            conn = self.connections[next(self._rr)]
+            if conn.ready:
+                return conn
+        raise RunwareWSError("Ninguna conexión WebSocket con Runware está lista")
+
+    async def submit(self, tasks: List[dict]) -> Dict[str, Any]:
+        return await self._pick().submit(tasks, timeout=self.timeout)
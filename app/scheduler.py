@@ -0,0 +1,259 @@
+"""Planificador por proveedor: token bucket, límite de concurrencia y cola con prioridad.
+
+Todas las llamadas upstream pasan por `schedule(provider, fn)`. Cuando el
+proveedor responde 429, el proveedor entero se pausa lo que indique
+`Retry-After` y la llamada se reencola; si se agotan los reintentos se
+devuelve 429 al cliente con el mismo `Retry-After`.
+"""
+import asyncio
+import contextvars
+import email.utils
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from .settings import env_float, env_int
+from .tracing import add_event, span
+
+INTERACTIVE = 0
+BATCH = 1
+
+PROVIDERS = ("openai", "gemini", "runware", "bfl")
+MAX_RETRY_AFTER = 60.0
+
+# Prioridad de la petición en curso (la fija PriorityMiddleware a partir de X-Priority)
+current_priority: contextvars.ContextVar[int] = contextvars.ContextVar("current_priority", default=INTERACTIVE)
+
+
+class RateLimited(Exception):
+    """El proveedor respondió 429."""
+
+    def __init__(self, retry_after: Optional[float] = None, detail: Any = None):
+        super().__init__(detail)
+        self.retry_after = retry_after
+        self.detail = detail
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Acepta segundos o fecha HTTP; devuelve segundos desde ahora."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def raise_for_rate_limit(response) -> None:
+    """Convierte una respuesta httpx 429 en RateLimited."""
+    if response.status_code == 429:
+        try:
+            detail = response.json()
+        except Exception:
+            detail = response.text
+        raise RateLimited(parse_retry_after(response.headers.get("retry-after")), detail)
+
+
+class ProviderScheduler:
+    def __init__(self, name: str, rate: float = 0.0, burst: float = 1.0, concurrency: int = 16, retries_429: int = 2):
+        self.name = name
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.concurrency = max(1, concurrency)
+        self.retries_429 = retries_429
+        self.tokens = self.burst
+        self._last = time.monotonic()
+        self._queue: List[tuple] = []
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Métricas
+        self.granted = 0
+        self.throttled = 0
+        self.rejected = 0
+        self.extra = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    @classmethod
+    def from_env(cls, name: str) -> "ProviderScheduler":
+        prefix = name.upper()
+        rate = env_float(f"{prefix}_RATE_LIMIT", 0.0)
+        return cls(
+            name,
+            rate=rate,
+            burst=env_float(f"{prefix}_BURST", max(1.0, rate)),
+            concurrency=env_int(f"{prefix}_MAX_CONCURRENCY", 16),
+            retries_429=env_int(f"{prefix}_429_RETRIES", 2),
+        )
+
+    async def run(self, fn: Callable[[], Awaitable[Any]], priority: Optional[int] = None) -> Any:
+        priority = current_priority.get() if priority is None else priority
+        last: Optional[RateLimited] = None
+        for attempt in range(self.retries_429 + 1):
+            with span(f"{self.name}.queue", priority=priority, attempt=attempt + 1):
+                await self._acquire(priority)
+            try:
+                return await fn()
+            except RateLimited as e:
+                self.throttled += 1
+                last = e
+                # Sin Retry-After: backoff exponencial 1s, 2s, 4s...
+                retry_after = e.retry_after if e.retry_after is not None else float(2 ** attempt)
+                last.retry_after = min(MAX_RETRY_AFTER, retry_after)
+                add_event("rate_limited", provider=self.name, retry_after=last.retry_after)
+                self.pause(last.retry_after)
+            finally:
+                self._release()
+        self.rejected += 1
+        raise HTTPException(
+            status_code=429,
+            detail={"error": f"Límite de peticiones de {self.name} alcanzado", "details": last.detail},
+            headers={"Retry-After": str(math.ceil(last.retry_after))},
+        )
+
+    @asynccontextmanager
+    async def slot(self, priority: Optional[int] = None) -> AsyncIterator[None]:
+        """Un turno suelto, sin reintentos por 429 (p. ej. la copia hedged de una llamada que ya va por `run`).
+
+        Un 429 pausa el proveedor igual que en `run` y se propaga tal cual.
+        """
+        priority = current_priority.get() if priority is None else priority
+        with span(f"{self.name}.queue", priority=priority, extra=True):
+            await self._acquire(priority)
+        self.extra += 1
+        try:
+            yield
+        except RateLimited as e:
+            self.throttled += 1
+            self.pause(min(MAX_RETRY_AFTER, e.retry_after if e.retry_after is not None else 1.0))
+            raise
+        finally:
+            self._release()
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._dispatch()
+
+    async def _acquire(self, priority: int) -> None:
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._seq), time.monotonic(), fut))
+        self._dispatch()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            # Si el turno ya se había concedido hay que devolverlo
+            if fut.done() and not fut.cancelled():
+                self._release()
+            raise
+
+    def _release(self) -> None:
+        self._in_flight -= 1
+        self._dispatch()
+
+    def _refill(self, now: float) -> None:
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def _dispatch(self) -> None:
+        now = time.monotonic()
+        self._refill(now)
+        while self._queue:
+            if self._queue[0][3].done():
+                heapq.heappop(self._queue)  # esperando cancelado
+                continue
+            if self._in_flight >= self.concurrency:
+                return  # _release vuelve a despachar
+            if now < self._paused_until:
+                self._arm(self._paused_until - now)
+                return
+            if self.rate > 0 and self.tokens < 1:
+                self._arm((1 - self.tokens) / self.rate)
+                return
+            _, _, enqueued, fut = heapq.heappop(self._queue)
+            if self.rate > 0:
+                self.tokens -= 1
+            self._in_flight += 1
+            self.granted += 1
+            waited = now - enqueued
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            fut.set_result(None)
+
+    def _arm(self, delay: float) -> None:
+        loop = asyncio.get_running_loop()
+        when = loop.time() + delay
+        if self._timer is not None and not self._timer.cancelled() and self._timer.when() <= when:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = loop.call_at(when, self._on_timer)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        waiting = [item for item in self._queue if not item[3].done()]
+        return {
+            "rate_limit": self.rate,
+            "burst": self.burst,
+            "max_concurrency": self.concurrency,
+            "in_flight": self._in_flight,
+            "queue_depth": len(waiting),
+            "queue_depth_by_priority": {
+                "interactive": sum(1 for item in waiting if item[0] == INTERACTIVE),
+                "batch": sum(1 for item in waiting if item[0] == BATCH),
+            },
+            "tokens": round(self.tokens, 3) if self.rate > 0 else None,
+            "paused_for": round(max(0.0, self._paused_until - time.monotonic()), 3),
+            "granted": self.granted,
+            "throttled_429": self.throttled,
+            "rejected_429": self.rejected,
+            "extra_slots": self.extra,
+            "wait_avg_ms": round(self.wait_total / self.granted * 1000, 3) if self.granted else 0.0,
+            "wait_max_ms": round(self.wait_max * 1000, 3),
+        }
+
+
+schedulers: Dict[str, ProviderScheduler] = {name: ProviderScheduler.from_env(name) for name in PROVIDERS}
+
+
+async def schedule(provider: str, fn: Callable[[], Awaitable[Any]], priority: Optional[int] = None) -> Any:
+    """Ejecuta `fn` (la llamada upstream) respetando los límites de `provider`."""
+    return await schedulers[provider].run(fn, priority)
+
+
+class PriorityMiddleware:
+    """Middleware ASGI: `X-Priority: batch` encola las llamadas upstream detrás de las interactivas."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        priority = INTERACTIVE
+        for name, value in scope.get("headers", []):
+            if name == b"x-priority":
+                if value.decode("latin-1").strip().lower() in {"batch", "low"}:
+                    priority = BATCH
+                break
+        token = current_priority.set(priority)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_priority.reset(token)
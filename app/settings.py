@@ -0,0 +1,75 @@
+"""Configuración central: `.env` se carga una sola vez y los valores se leen al arrancar.
+
+Todo el entorno se lee con los `env_*` de este módulo: `settings` para lo que
+comparten varios módulos y constantes de módulo (`env_bool(...)` al importar)
+para lo propio de cada uno. Los handlers nunca llaman a `os.getenv`.
+`settings.reload()` vuelve a leer solo los atributos de `settings`; las
+constantes de módulo se fijan al importar.
+"""
+import os
+from pathlib import Path
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def env_str(name: str, default: Optional[str] = None) -> Optional[str]:
+    value = os.getenv(name)
+    return value if value else default
+
+
+def env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in {"1", "true", "yes", "on"}
+
+
+class Settings:
+    def __init__(self):
+        self.reload()
+
+    def reload(self) -> None:
+        # API keys
+        self.openai_api_key: Optional[str] = env_str("OPENAI_API_KEY")
+        self.gemini_api_key: Optional[str] = env_str("GEMINI_API_KEY")
+        self.runware_api_key: Optional[str] = env_str("RUNWARE_API_KEY")
+        self.bfl_api_key: Optional[str] = env_str("BFL_API_KEY")
+
+        # URLs de los proveedores (sobrescribibles para apuntar a upstreams simulados)
+        self.openai_base_url: Optional[str] = env_str("OPENAI_BASE_URL")
+        self.gemini_endpoint: str = env_str(
+            "GEMINI_ENDPOINT", "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
+        )
+        self.runware_endpoint: str = env_str("RUNWARE_ENDPOINT", "https://api.runware.ai/v1/generate")
+        self.bfl_api_url: str = env_str("BFL_API_URL", "https://api.bfl.ai/v1/flux-kontext-pro")
+
+        # Timeout acotado: un upstream colgado no retiene un hilo del threadpool más de esto
+        self.openai_timeout: float = env_float("OPENAI_TIMEOUT", 120.0)
+
+        self.image_output_dir: Path = Path(env_str("IMAGE_OUTPUT_DIR", "generated"))
+        # Fuera de IMAGE_OUTPUT_DIR: ese directorio se sirve como estáticos
+        self.image_index_path: Path = Path(env_str("IMAGE_INDEX_PATH", "generated.sqlite3"))
+
+    def api_key(self, env_name: str) -> Optional[str]:
+        """API key por nombre de variable (`OPENAI_API_KEY` -> `settings.openai_api_key`)."""
+        return getattr(self, env_name.lower(), None)
+
+
+settings = Settings()
@@ -0,0 +1,54 @@
+"""Single-flight: peticiones idénticas concurrentes comparten una única llamada upstream."""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def _ns_stats(self, namespace: str) -> Dict[str, float]:
+        return self._stats.setdefault(namespace, {"calls": 0, "upstream_calls": 0, "coalesced": 0, "saved_seconds": 0.0})
+
+    async def do(self, namespace: str, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Ejecuta `fn` una sola vez por `key` mientras haya una llamada en curso.
+
+        La llamada corre en su propia tarea: si el cliente que la originó se
+        desconecta, el resto de peticiones que la esperan no se cancelan.
+        """
+        stats = self._ns_stats(namespace)
+        stats["calls"] += 1
+        full_key = f"{namespace}:{key}"
+        task = self._inflight.get(full_key)
+        if task is None:
+            stats["upstream_calls"] += 1
+            task = asyncio.ensure_future(self._run(full_key, stats, fn))
+            task.followers = 0
+            # Marca la excepción como consumida aunque todos los que esperaban se hayan ido
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._inflight[full_key] = task
+        else:
+            stats["coalesced"] += 1
+            task.followers += 1
+        return await asyncio.shield(task)
+
+    async def _run(self, full_key: str, stats: Dict[str, float], fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = asyncio.current_task()
+        started = time.perf_counter()
+        try:
+            return await fn()
+        finally:
+            # Cada petición que se unió se ahorró una llamada completa
+            stats["saved_seconds"] += task.followers * (time.perf_counter() - started)
+            self._inflight.pop(full_key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._inflight),
+            "providers": {ns: dict(values) for ns, values in self._stats.items()},
+        }
+
+
+singleflight = SingleFlight()
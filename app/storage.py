@@ -0,0 +1,317 @@
+"""Almacén de imágenes generadas direccionado por contenido, con índice sqlite.
+
+Cada imagen se guarda una sola vez como `objects/ab/cd/<sha256>.<ext>` bajo
+`IMAGE_OUTPUT_DIR` (dos niveles de directorios para no acumular miles de
+ficheros en uno). Cada generación es una fila del índice (`IMAGE_INDEX_PATH`,
+sqlite en modo WAL) con proveedor, prompt, tamaño, criatura, bytes y fechas;
+varias generaciones con el mismo contenido apuntan al mismo fichero.
+
+Los métodos de `ImageStore` bloquean (disco y sqlite): se llaman desde el threadpool.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from .preprocess import ImageInfo, probe, probe_bytes
+from .settings import settings
+
+GENERATED_URL_PREFIX = "/generated"
+OBJECTS_DIR = "objects"
+
+EXTENSIONS = {"png": ".png", "jpeg": ".jpg", "webp": ".webp"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    sha256 TEXT PRIMARY KEY,
+    ext TEXT NOT NULL,
+    bytes INTEGER NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS generations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    provider TEXT NOT NULL,
+    prompt TEXT,
+    size TEXT,
+    creature TEXT,
+    label TEXT,
+    remote_url TEXT,
+    sha256 TEXT REFERENCES objects(sha256),
+    status TEXT NOT NULL,
+    error TEXT,
+    created_at REAL NOT NULL,
+    completed_at REAL
+);
+CREATE INDEX IF NOT EXISTS generations_provider ON generations(provider, id);
+CREATE INDEX IF NOT EXISTS generations_creature ON generations(creature, id);
+CREATE INDEX IF NOT EXISTS generations_sha256 ON generations(sha256);
+"""
+
+_COLUMNS = (
+    "g.id, g.provider, g.prompt, g.size, g.creature, g.label, g.remote_url, g.sha256, g.status, g.error, "
+    "g.created_at, g.completed_at, o.ext, o.bytes, o.width, o.height"
+)
+
+
+class ImageMeta(NamedTuple):
+    """Metadatos de una generación (lo que se guarda en el índice junto al contenido)."""
+
+    provider: str
+    prompt: Optional[str] = None
+    size: Optional[str] = None
+    creature: Optional[str] = None
+    label: Optional[str] = None
+    remote_url: Optional[str] = None
+
+
+class StoredImage(NamedTuple):
+    id: int
+    sha256: str
+    path: Path
+    bytes: int
+    deduplicated: bool
+
+
+def output_dir() -> Path:
+    return settings.image_output_dir
+
+
+def public_url(file_path) -> Optional[str]:
+    """Ruta bajo `/generated` desde la que se sirve `file_path` (None si está fuera del directorio)."""
+    if not file_path:
+        return None
+    try:
+        rel = Path(file_path).resolve().relative_to(output_dir().resolve())
+    except ValueError:
+        return None
+    return f"{GENERATED_URL_PREFIX}/{rel.as_posix()}"
+
+
+def download_name(item: Dict[str, Any]) -> str:
+    """Nombre legible para descargar una generación: `<etiqueta>_<prompt>_<id>.<ext>`.
+
+    El fichero en disco se llama como su sha256; este nombre sale de los metadatos.
+    """
+    slug = re.sub(r"-+", "-", re.sub(r"[^a-zA-Z0-9_-]+", "-", item.get("prompt") or "")).strip("-")[:40]
+    parts = [item.get("label") or item["provider"], slug, str(item["id"])]
+    ext = Path(item["path"]).suffix if item.get("path") else ".png"
+    return "_".join(p for p in parts if p) + ext
+
+
+class ImageStore:
+    def __init__(self, root: Path, index_path: Path):
+        self.root = Path(root)
+        self.index_path = Path(index_path)
+        # Temporales junto a root (mismo sistema de ficheros, rename atómico) pero fuera
+        # de lo que sirve /generated: StaticFiles no oculta los ficheros con punto
+        resolved = self.root.resolve()
+        self.tmp_dir = resolved.parent / f"{resolved.name}.tmp"
+        # Una conexión por hilo: con WAL las lecturas no esperan a las escrituras
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+        self.writes = 0
+        self.deduplicated = 0
+        # Se llaman (en el hilo que guardó) tras registrar cada imagen; p. ej. las miniaturas
+        self.listeners: List[Callable[[StoredImage], None]] = []
+
+    # --- sqlite ---
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self._ensure_schema()
+            conn = sqlite3.connect(str(self.index_path), timeout=10.0)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _ensure_schema(self) -> None:
+        with self._init_lock:
+            if self._initialized:
+                return
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.index_path), timeout=10.0)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(_SCHEMA)
+                conn.commit()
+            finally:
+                conn.close()
+            self._initialized = True
+
+    # --- ficheros ---
+
+    def object_path(self, sha256: str, ext: str) -> Path:
+        return self.root / OBJECTS_DIR / sha256[:2] / sha256[2:4] / f"{sha256}{ext}"
+
+    def temp_path(self) -> Path:
+        """Fichero temporal en el mismo sistema de ficheros que los objetos (el rename es atómico)."""
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        return self.tmp_dir / f"{uuid.uuid4().hex}.part"
+
+    def _object(self, info: Optional[ImageInfo], size: int) -> Dict[str, Any]:
+        ext = EXTENSIONS.get(info.format, ".png") if info else ".png"
+        return {"ext": ext, "bytes": size, "width": info.width if info else None, "height": info.height if info else None}
+
+    # --- API ---
+
+    def reserve(self, meta: ImageMeta) -> int:
+        """Registra una generación cuyo contenido llegará después (guardado en segundo plano)."""
+        conn = self._conn()
+        with conn:
+            cur = conn.execute(
+                "INSERT INTO generations (provider, prompt, size, creature, label, remote_url, status, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, 'pending', ?)",
+                (meta.provider, meta.prompt, meta.size, meta.creature, meta.label, meta.remote_url, time.time()),
+            )
+        return int(cur.lastrowid)
+
+    def fail(self, generation_id: int, error: str) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "UPDATE generations SET status = 'failed', error = ?, completed_at = ? WHERE id = ?",
+                (error[:1000], time.time(), generation_id),
+            )
+
+    def put_bytes(self, data: bytes, meta: ImageMeta, generation_id: Optional[int] = None) -> StoredImage:
+        sha256 = hashlib.sha256(data).hexdigest()
+        obj = self._object(probe_bytes(data), len(data))
+        dest = self.object_path(sha256, obj["ext"])
+        deduplicated = dest.exists()
+        if not deduplicated:
+            tmp = self.temp_path()
+            try:
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp, dest)
+            finally:
+                if tmp.exists():
+                    tmp.unlink()
+        return self._record(sha256, dest, obj, deduplicated, meta, generation_id)
+
+    def put_file(
+        self, tmp: Path, sha256: str, size: int, meta: ImageMeta, generation_id: Optional[int] = None
+    ) -> StoredImage:
+        """Da de alta `tmp` (ya escrito y con su sha256 calculado); si el contenido ya existía se descarta."""
+        with open(tmp, "rb") as f:
+            obj = self._object(probe(f), size)
+        dest = self.object_path(sha256, obj["ext"])
+        deduplicated = dest.exists()
+        if deduplicated:
+            tmp.unlink()
+        else:
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            # Dos escrituras simultáneas del mismo contenido: ambos renames dejan el mismo fichero
+            os.replace(tmp, dest)
+        return self._record(sha256, dest, obj, deduplicated, meta, generation_id)
+
+    def _record(
+        self, sha256: str, dest: Path, obj: Dict[str, Any], deduplicated: bool, meta: ImageMeta, generation_id: Optional[int]
+    ) -> StoredImage:
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO objects (sha256, ext, bytes, width, height, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (sha256, obj["ext"], obj["bytes"], obj["width"], obj["height"], now),
+            )
+            if generation_id is None:
+                cur = conn.execute(
+                    "INSERT INTO generations (provider, prompt, size, creature, label, remote_url, sha256, status, created_at, completed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, 'ready', ?, ?)",
+                    (meta.provider, meta.prompt, meta.size, meta.creature, meta.label, meta.remote_url, sha256, now, now),
+                )
+                generation_id = int(cur.lastrowid)
+            else:
+                conn.execute(
+                    "UPDATE generations SET sha256 = ?, status = 'ready', error = NULL, completed_at = ? WHERE id = ?",
+                    (sha256, now, generation_id),
+                )
+        self.writes += 1
+        if deduplicated:
+            self.deduplicated += 1
+        stored = StoredImage(generation_id, sha256, dest, obj["bytes"], deduplicated)
+        for listener in self.listeners:
+            listener(stored)
+        return stored
+
+    def _item(self, row: sqlite3.Row) -> Dict[str, Any]:
+        item = dict(row)
+        ext = item.pop("ext")
+        if item["sha256"] and ext:
+            path = self.object_path(item["sha256"], ext)
+            item["path"] = str(path)
+            # Sin resolve(): la ruta relativa de un objeto se conoce sin tocar el disco
+            item["url"] = f"{GENERATED_URL_PREFIX}/{path.relative_to(self.root).as_posix()}"
+        else:
+            item["path"] = item["url"] = None
+        return item
+
+    def get(self, generation_id: int) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            f"SELECT {_COLUMNS} FROM generations g LEFT JOIN objects o ON o.sha256 = g.sha256 WHERE g.id = ?",
+            (generation_id,),
+        ).fetchone()
+        return self._item(row) if row else None
+
+    def list(
+        self,
+        provider: Optional[str] = None,
+        creature: Optional[str] = None,
+        status: Optional[str] = None,
+        before: Optional[int] = None,
+        limit: int = 50,
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """Página de generaciones, de la más reciente a la más antigua.
+
+        Paginación por clave (`before` = último id de la página anterior): cada
+        página es un recorrido de índice, sin OFFSET. Devuelve (filas, siguiente cursor).
+        """
+        where, params = [], []  # type: List[str], List[Any]
+        if provider:
+            where.append("g.provider = ?")
+            params.append(provider)
+        if creature:
+            where.append("g.creature = ?")
+            params.append(creature)
+        if status:
+            where.append("g.status = ?")
+            params.append(status)
+        if before is not None:
+            where.append("g.id < ?")
+            params.append(before)
+        sql = f"SELECT {_COLUMNS} FROM generations g LEFT JOIN objects o ON o.sha256 = g.sha256"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY g.id DESC LIMIT ?"
+        rows = self._conn().execute(sql, (*params, limit + 1)).fetchall()
+        items = [self._item(r) for r in rows[:limit]]
+        next_cursor = items[-1]["id"] if len(rows) > limit else None
+        return items, next_cursor
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._conn()
+        objects, stored_bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM objects").fetchone()
+        generations = conn.execute("SELECT COUNT(*) FROM generations").fetchone()[0]
+        return {
+            "objects": objects,
+            "bytes": stored_bytes,
+            "generations": generations,
+            "writes": self.writes,
+            "deduplicated": self.deduplicated,
+            "index": str(self.index_path),
+        }
+
+
+store = ImageStore(settings.image_output_dir, settings.image_index_path)
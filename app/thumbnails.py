@@ -0,0 +1,301 @@
+"""Miniaturas WebP/AVIF de las imágenes guardadas, con caché en disco y presupuesto LRU.
+
+- Tras cada guardado (si `THUMBNAIL_EAGER`), un proceso del pool genera todas
+  las combinaciones de `THUMBNAIL_WIDTHS` x `THUMBNAIL_FORMATS` decodificando
+  el original una sola vez.
+- `/generated/{id}/thumb?w=` sirve la miniatura; si falta (desalojada, imagen
+  anterior o sin generación anticipada) se genera bajo demanda. Peticiones
+  iguales simultáneas comparten la misma generación (single-flight).
+- La caché vive en `THUMBNAIL_DIR` y no pasa de `THUMBNAIL_CACHE_MAX_BYTES`:
+  se desalojan primero las miniaturas servidas hace más tiempo.
+
+Como el original está direccionado por contenido, cada miniatura es inmutable
+y se sirve con `Cache-Control: immutable`. Requiere Pillow (opcional); sin él
+la ruta redirige al original.
+"""
+import asyncio
+import importlib.util
+import logging
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from .metrics import phase, thumbnail_cache_bytes
+from .settings import env_bool, env_int, env_str
+from .singleflight import singleflight
+from .storage import StoredImage, store
+
+logger = logging.getLogger(__name__)
+
+
+def _widths(raw: str) -> List[int]:
+    widths = sorted({int(v) for v in raw.split(",") if v.strip().isdigit() and int(v) > 0})
+    return widths or [256, 512]
+
+
+THUMBNAIL_DIR = Path(env_str("THUMBNAIL_DIR", "thumbnails"))
+THUMBNAIL_WIDTHS = _widths(env_str("THUMBNAIL_WIDTHS", "256,512"))
+# Orden de preferencia; se sirve el primero que acepte el cliente
+THUMBNAIL_FORMATS = [f for f in env_str("THUMBNAIL_FORMATS", "webp").lower().replace(" ", "").split(",") if f in ("webp", "avif")] or ["webp"]
+THUMBNAIL_QUALITY = env_int("THUMBNAIL_QUALITY", 80)
+THUMBNAIL_WORKERS = env_int("THUMBNAIL_WORKERS", 2)
+THUMBNAIL_EAGER = env_bool("THUMBNAIL_EAGER", True)
+THUMBNAIL_CACHE_MAX_BYTES = env_int("THUMBNAIL_CACHE_MAX_BYTES", 512 * 1024 * 1024)
+
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+MIME_TYPES = {"webp": "image/webp", "avif": "image/avif"}
+
+HAS_PILLOW = importlib.util.find_spec("PIL") is not None
+
+
+def snap_width(requested: Optional[int]) -> int:
+    """Ancho configurado más pequeño que cubre `requested` (solo hay tantas variantes como anchos)."""
+    if requested is None:
+        return THUMBNAIL_WIDTHS[0]
+    for width in THUMBNAIL_WIDTHS:
+        if width >= requested:
+            return width
+    return THUMBNAIL_WIDTHS[-1]
+
+
+def negotiate(accept: str, formats: List[str]) -> str:
+    for fmt in formats:
+        if MIME_TYPES[fmt] in accept:
+            return fmt
+    return formats[-1]
+
+
+def thumb_path(sha256: str, width: int, fmt: str) -> Path:
+    return THUMBNAIL_DIR / sha256[:2] / f"{sha256}_{width}.{fmt}"
+
+
+# --- Procesos ------------------------------------------------------------------
+
+def _render(src: str, targets: List[Tuple[int, str, str]], quality: int) -> List[Tuple[str, int]]:
+    """Genera `targets` (ancho, formato, ruta) desde `src`, decodificándolo una vez. Devuelve (ruta, bytes)."""
+    from PIL import Image
+
+    done = []
+    with Image.open(src) as original:
+        has_alpha = original.mode in ("RGBA", "LA", "PA") or "transparency" in original.info
+        base = original.convert("RGBA" if has_alpha else "RGB")
+        # De mayor a menor: cada ancho se reduce desde el anterior, más barato que desde el original
+        for width in sorted({t[0] for t in targets}, reverse=True):
+            target_w = min(width, base.width)
+            if target_w != base.width:
+                base = base.resize((target_w, max(1, round(base.height * target_w / base.width))), Image.LANCZOS)
+            for w, fmt, dest in targets:
+                if w != width:
+                    continue
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                tmp = f"{dest}.{os.getpid()}.part"
+                base.save(tmp, format=fmt.upper(), quality=quality)
+                os.replace(tmp, dest)
+                done.append((dest, os.path.getsize(dest)))
+    return done
+
+
+def _supported(formats: List[str]) -> List[str]:
+    from PIL import features
+
+    return [f for f in formats if features.check(f)]
+
+
+class ThumbnailCache:
+    """Índice LRU en memoria de las miniaturas en disco (ruta -> bytes)."""
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self.bytes = 0
+        self.evicted = 0
+
+    def load(self) -> None:
+        # Una vez al arrancar: lo usado más recientemente (mtime) queda al final
+        found = []
+        if self.root.exists():
+            for dirpath, _, names in os.walk(self.root):
+                for name in names:
+                    if name.endswith(".part"):
+                        continue
+                    path = os.path.join(dirpath, name)
+                    st = os.stat(path)
+                    found.append((st.st_mtime, path, st.st_size))
+        found.sort()
+        for _, path, size in found:
+            self._entries[path] = size
+            self.bytes += size
+        thumbnail_cache_bytes.set(self.bytes)
+
+    def touch(self, path: Path) -> bool:
+        key = str(path)
+        if key not in self._entries:
+            return False
+        self._entries.move_to_end(key)
+        return True
+
+    def add(self, path: str, size: int) -> List[str]:
+        """Registra una miniatura y devuelve las que hay que borrar para respetar el presupuesto."""
+        if path in self._entries:
+            self.bytes -= self._entries.pop(path)
+        self._entries[path] = size
+        self.bytes += size
+        evict = []
+        while self.bytes > self.max_bytes and len(self._entries) > 1:
+            old, old_size = self._entries.popitem(last=False)
+            self.bytes -= old_size
+            self.evicted += 1
+            evict.append(old)
+        thumbnail_cache_bytes.set(self.bytes)
+        return evict
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "bytes": self.bytes, "max_bytes": self.max_bytes, "evicted": self.evicted}
+
+
+cache = ThumbnailCache(THUMBNAIL_DIR, THUMBNAIL_CACHE_MAX_BYTES)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_ready: Optional[asyncio.Task] = None
+_formats: List[str] = list(THUMBNAIL_FORMATS)
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_background: Set[asyncio.Task] = set()
+_stats: Dict[str, int] = {"rendered": 0, "eager": 0, "failed": 0}
+
+
+def _executor() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=max(1, THUMBNAIL_WORKERS), mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+async def _prepare() -> None:
+    global _formats
+    await run_in_threadpool(cache.load)
+    supported = await asyncio.get_running_loop().run_in_executor(_executor(), _supported, THUMBNAIL_FORMATS)
+    if supported != THUMBNAIL_FORMATS:
+        logger.warning("Formatos de miniatura no soportados por Pillow: %s", sorted(set(THUMBNAIL_FORMATS) - set(supported)))
+    _formats = supported or ["webp"]
+
+
+async def ensure_ready() -> List[str]:
+    """Carga el índice de la caché y comprueba los formatos (una sola vez). Devuelve los formatos utilizables."""
+    global _ready
+    if _ready is None:
+        _ready = asyncio.ensure_future(_prepare())
+    await asyncio.shield(_ready)
+    return _formats
+
+
+async def _render_targets(src: Path, targets: List[Tuple[int, str, str]]) -> None:
+    with phase("thumbnails", "render") as p:
+        loop = asyncio.get_running_loop()
+        done = await loop.run_in_executor(_executor(), _render, str(src), targets, THUMBNAIL_QUALITY)
+        p.span.set_attribute("variants", len(done))
+    _stats["rendered"] += len(done)
+    evict: List[str] = []
+    for path, size in done:
+        evict.extend(cache.add(path, size))
+    if evict:
+        await run_in_threadpool(_unlink, evict)
+
+
+def _unlink(paths: List[str]) -> None:
+    for path in paths:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+async def get(sha256: str, src: Path, width: int, fmt: str) -> Tuple[Path, bool]:
+    """Ruta de la miniatura, generándola si falta. Devuelve (ruta, acierto de caché)."""
+    await ensure_ready()
+    path = thumb_path(sha256, width, fmt)
+    if cache.touch(path):
+        return path, True
+
+    async def render():
+        await _render_targets(src, [(width, fmt, str(path))])
+        return path
+
+    return await singleflight.do("thumbnails", f"{sha256}:{width}:{fmt}", render), False
+
+
+async def _render_all(stored: StoredImage) -> None:
+    formats = await ensure_ready()
+    targets = [
+        (w, fmt, str(thumb_path(stored.sha256, w, fmt)))
+        for w in THUMBNAIL_WIDTHS
+        for fmt in formats
+        if not cache.touch(thumb_path(stored.sha256, w, fmt))
+    ]
+    if not targets:
+        return
+    try:
+        await singleflight.do("thumbnails", f"{stored.sha256}:all", lambda: _render_targets(stored.path, targets))
+        _stats["eager"] += 1
+    except Exception as e:
+        _stats["failed"] += 1
+        logger.warning("No se pudieron generar las miniaturas de %s: %s", stored.sha256, e)
+
+
+def _schedule(stored: StoredImage) -> None:
+    task = asyncio.ensure_future(_render_all(stored))
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+def _on_stored(stored: StoredImage) -> None:
+    # Se llama desde el hilo que guardó la imagen: la tarea se crea en el event loop
+    if not stored.deduplicated and _loop is not None:
+        _loop.call_soon_threadsafe(_schedule, stored)
+
+
+async def startup() -> None:
+    """Registra el listener del almacén. No espera al pool: el arranque no se retrasa."""
+    global _loop, _ready
+    if not HAS_PILLOW or not THUMBNAIL_EAGER:
+        return
+    _loop = asyncio.get_running_loop()
+    store.listeners.append(_on_stored)
+    # Calentamiento en segundo plano: la primera imagen no suele pagar el arranque del pool
+    if _ready is None:
+        _ready = asyncio.ensure_future(_prepare())
+
+
+async def shutdown() -> None:
+    global _pool, _ready, _loop
+    if _on_stored in store.listeners:
+        store.listeners.remove(_on_stored)
+    _loop = None
+    tasks = list(_background)
+    if _ready is not None:
+        tasks.append(_ready)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    _ready = None
+    if _pool is not None:
+        pool, _pool = _pool, None
+        # wait=True en un hilo: se esperan los procesos (y se liberan sus semáforos) sin bloquear el loop
+        await run_in_threadpool(lambda: pool.shutdown(wait=True, cancel_futures=True))
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "pillow": HAS_PILLOW,
+        "widths": THUMBNAIL_WIDTHS,
+        "formats": _formats,
+        "eager": THUMBNAIL_EAGER,
+        "pending": len(_background),
+        **_stats,
+        "cache": cache.stats(),
+    }
@@ -0,0 +1,444 @@
+"""Trazas estilo OpenTelemetry sin dependencias externas.
+
+- `TracingMiddleware`: span raíz por petición y cabecera `X-Request-ID` en la respuesta
+  (se respeta la del cliente o se genera una). Acepta `traceparent` (W3C).
+- `span(nombre, **atributos)`: span hijo del actual (contextvars); marca error si hay excepción.
+- `TracingTransport`: span por cada petición httpx a un proveedor.
+- Exportador en un hilo aparte: JSON por líneas en formato OTLP/JSON (`TRACE_FILE`,
+  funciona sin red) o POST a un colector OTLP/HTTP (`OTEL_EXPORTER_OTLP_ENDPOINT`).
+- El `request_id` de la petición en curso se añade a todos los registros de logging.
+
+Resumen de una traza guardada: `python -m app.tracing traces.jsonl <request_id>`.
+"""
+import json
+import logging
+import queue
+import re
+import secrets
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+from .settings import env_bool, env_str
+
+TRACING_ENABLED = env_bool("TRACING_ENABLED", False)
+TRACE_EXPORTER = env_str("TRACE_EXPORTER", "file").strip().lower()  # file | otlp | none
+TRACE_FILE = env_str("TRACE_FILE", "traces.jsonl")
+OTLP_ENDPOINT = env_str("OTEL_EXPORTER_OTLP_ENDPOINT", "http://127.0.0.1:4318")
+SERVICE_NAME = env_str("OTEL_SERVICE_NAME", "fastapi-rest")
+
+REQUEST_ID_HEADER = "x-request-id"
+_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+# Valores de SpanKind y StatusCode de OTLP
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+STATUS_OK, STATUS_ERROR = 1, 2
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+_current: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    __slots__ = ("name", "kind", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "events", "status", "status_message")
+
+    def __init__(self, name: str, kind: int = INTERNAL, parent: Optional["Span"] = None, trace_id: Optional[str] = None, parent_id: Optional[str] = None):
+        self.name = name
+        self.kind = kind
+        self.trace_id = parent.trace_id if parent is not None else (trace_id or secrets.token_hex(16))
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent is not None else parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = {}
+        self.events: List[Tuple[int, str, Dict[str, Any]]] = []
+        self.status = 0
+        self.status_message = ""
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def add_event(self, name: str, **attributes: Any) -> None:
+        self.events.append((time.time_ns(), name, attributes))
+
+    def record_exception(self, e: BaseException) -> None:
+        status = getattr(e, "status_code", None)
+        self.status = STATUS_ERROR
+        self.status_message = f"{type(e).__name__}: {getattr(e, 'detail', e)}"[:500]
+        self.add_event("exception", **{"exception.type": type(e).__name__, **({"http.status_code": status} if status else {})})
+
+    def end(self) -> None:
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            exporter.export(self)
+
+    def to_otlp(self) -> Dict[str, Any]:
+        out = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": _attributes(self.attributes),
+            "status": {"code": self.status, "message": self.status_message} if self.status else {},
+        }
+        if self.parent_id:
+            out["parentSpanId"] = self.parent_id
+        if self.events:
+            out["events"] = [{"timeUnixNano": str(t), "name": n, "attributes": _attributes(a)} for t, n, a in self.events]
+        return out
+
+
+class _NoopSpan:
+    """Sustituto sin coste cuando TRACING_ENABLED=false."""
+
+    trace_id = span_id = ""
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_attributes(self, **attributes: Any) -> None:
+        pass
+
+    def add_event(self, name: str, **attributes: Any) -> None:
+        pass
+
+    def record_exception(self, e: BaseException) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+
+NOOP = _NoopSpan()
+
+
+def _value(v: Any) -> Dict[str, Any]:
+    if isinstance(v, bool):
+        return {"boolValue": v}
+    if isinstance(v, int):
+        return {"intValue": str(v)}
+    if isinstance(v, float):
+        return {"doubleValue": v}
+    return {"stringValue": str(v)}
+
+
+def _attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": k, "value": _value(v)} for k, v in attributes.items() if v is not None]
+
+
+def current_span():
+    return _current.get() or NOOP
+
+
+def request_id() -> Optional[str]:
+    return request_id_var.get()
+
+
+def add_event(name: str, **attributes: Any) -> None:
+    """Evento en el span actual (p. ej. un reintento)."""
+    span_ = _current.get()
+    if span_ is not None:
+        span_.add_event(name, **attributes)
+
+
+def start_span(name: str, kind: int = INTERNAL, **attributes: Any):
+    """Abre un span hijo del actual sin convertirlo en el actual; hay que llamar a `end()`."""
+    if not TRACING_ENABLED:
+        return NOOP
+    span_ = Span(name, kind, parent=_current.get())
+    span_.attributes.update(attributes)
+    return span_
+
+
+@contextmanager
+def span(name: str, kind: int = INTERNAL, **attributes: Any) -> Iterator[Any]:
+    """Span hijo del actual durante el bloque."""
+    if not TRACING_ENABLED:
+        yield NOOP
+        return
+    span_ = start_span(name, kind, **attributes)
+    token = _current.set(span_)
+    try:
+        yield span_
+    except BaseException as e:
+        span_.record_exception(e)
+        raise
+    finally:
+        _current.reset(token)
+        span_.end()
+
+
+def capture() -> Tuple[Optional[Span], Optional[str]]:
+    """Contexto de traza actual, para retomarlo en tareas que no heredan el de la petición."""
+    return _current.get(), request_id_var.get()
+
+
+@contextmanager
+def activate(captured: Tuple[Optional[Span], Optional[str]]) -> Iterator[None]:
+    span_token = _current.set(captured[0])
+    rid_token = request_id_var.set(captured[1])
+    try:
+        yield
+    finally:
+        request_id_var.reset(rid_token)
+        _current.reset(span_token)
+
+
+class Exporter:
+    """Agrupa spans terminados y los escribe desde un hilo, fuera del event loop."""
+
+    def __init__(self, kind: str = TRACE_EXPORTER, path: str = TRACE_FILE, endpoint: str = OTLP_ENDPOINT, batch_size: int = 256, interval: float = 1.0):
+        self.kind = kind
+        self.path = path
+        self.endpoint = endpoint.rstrip("/") + "/v1/traces"
+        self.batch_size = batch_size
+        self.interval = interval
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+        self._queue: "queue.Queue[Optional[Span]]" = queue.Queue(maxsize=10000)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def export(self, span_: Span) -> None:
+        if self.kind == "none":
+            return
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(span_)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            batch: List[Span] = []
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch: List[Span]) -> None:
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": _attributes({"service.name": SERVICE_NAME})},
+                "scopeSpans": [{"scope": {"name": "app.tracing"}, "spans": [s.to_otlp() for s in batch]}],
+            }]
+        }
+        try:
+            if self.kind == "otlp":
+                httpx.post(self.endpoint, json=payload, timeout=5.0).raise_for_status()
+            else:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(payload, separators=(",", ":")) + "\n")
+            self.exported += len(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            logger.warning("No se pudieron exportar %d spans: %s", len(batch), e)
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """Vacía la cola pendiente y detiene el hilo."""
+        thread = self._thread
+        if thread is None:
+            return
+        self._queue.put(None)
+        thread.join(timeout)
+        self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"exporter": self.kind, "exported": self.exported, "dropped": self.dropped, "failed": self.failed, "queued": self._queue.qsize()}
+
+
+exporter = Exporter()
+
+
+class TracingTransport(httpx.AsyncBaseTransport):
+    """Transporte httpx que abre un span CLIENT por petición (hasta recibir las cabeceras)."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if not TRACING_ENABLED:
+            return await self._transport.handle_async_request(request)
+        # Sin query string: algunas URLs de proveedores llevan tokens firmados
+        url = str(request.url.copy_with(query=None))
+        span_ = start_span(f"HTTP {request.method}", CLIENT, **{"http.method": request.method, "http.url": url, "server.address": request.url.host})
+        length = request.headers.get("content-length")
+        if length and length.isdigit():
+            span_.set_attribute("http.request_content_length", int(length))
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException as e:
+            span_.record_exception(e)
+            span_.end()
+            raise
+        span_.set_attribute("http.status_code", response.status_code)
+        length = response.headers.get("content-length")
+        if length and length.isdigit():
+            span_.set_attribute("http.response_content_length", int(length))
+        if response.status_code >= 500:
+            span_.status = STATUS_ERROR
+        span_.end()
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1").strip()
+    return None
+
+
+class TracingMiddleware:
+    """Middleware ASGI: X-Request-ID y span raíz de cada petición."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        rid = _header(scope, REQUEST_ID_HEADER.encode())
+        if not rid or not _REQUEST_ID_RE.match(rid):
+            rid = uuid.uuid4().hex
+        rid_token = request_id_var.set(rid)
+
+        root = NOOP
+        span_token = None
+        if TRACING_ENABLED:
+            parent = _TRACEPARENT_RE.match(_header(scope, b"traceparent") or "")
+            root = Span(
+                scope["method"],
+                SERVER,
+                trace_id=parent.group(1) if parent else None,
+                parent_id=parent.group(2) if parent else None,
+            )
+            root.set_attributes(**{"http.method": scope["method"], "http.target": scope["path"], "http.request_id": rid})
+            span_token = _current.set(root)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", rid.encode("latin-1"))]
+                root.set_attribute("http.status_code", message["status"])
+                if message["status"] >= 500:
+                    root.status = STATUS_ERROR
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as e:
+            root.record_exception(e)
+            raise
+        finally:
+            route = getattr(scope.get("route"), "path", None)
+            if route:
+                root.name = f"{scope['method']} {route}"
+                root.set_attribute("http.route", route)
+            if span_token is not None:
+                _current.reset(span_token)
+            root.end()
+            request_id_var.reset(rid_token)
+
+
+_base_factory = logging.getLogRecordFactory()
+
+
+def _record_factory(*args, **kwargs) -> logging.LogRecord:
+    record = _base_factory(*args, **kwargs)
+    record.request_id = request_id_var.get() or "-"
+    return record
+
+
+def configure_logging() -> None:
+    """Añade `request_id` a todos los registros y, si nadie configuró logging, un formato que lo muestra."""
+    if logging.getLogRecordFactory() is not _record_factory:
+        logging.setLogRecordFactory(_record_factory)
+    root = logging.getLogger()
+    if not root.handlers:
+        logging.basicConfig(
+            level=env_str("LOG_LEVEL", "WARNING").upper(),
+            format="%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s",
+        )
+
+
+def _summarize(path: str, rid: str) -> None:
+    spans: List[Dict[str, Any]] = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            for rs in json.loads(line).get("resourceSpans", []):
+                for ss in rs.get("scopeSpans", []):
+                    spans.extend(ss.get("spans", []))
+
+    def attr(s: Dict[str, Any], key: str) -> Optional[str]:
+        for a in s.get("attributes", []):
+            if a["key"] == key:
+                return next(iter(a["value"].values()))
+        return None
+
+    trace_ids = {s["traceId"] for s in spans if attr(s, "http.request_id") == rid}
+    selected = sorted((s for s in spans if s["traceId"] in trace_ids), key=lambda s: int(s["startTimeUnixNano"]))
+    if not selected:
+        print(f"No hay spans para request_id={rid}")
+        return
+    t0 = int(selected[0]["startTimeUnixNano"])
+    children: Dict[Optional[str], List[Dict[str, Any]]] = {}
+    ids = {s["spanId"] for s in selected}
+    for s in selected:
+        parent = s.get("parentSpanId")
+        children.setdefault(parent if parent in ids else None, []).append(s)
+
+    def show(s: Dict[str, Any], depth: int) -> None:
+        start = (int(s["startTimeUnixNano"]) - t0) / 1e6
+        duration = (int(s["endTimeUnixNano"]) - int(s["startTimeUnixNano"])) / 1e6
+        error = "  ERROR" if s.get("status", {}).get("code") == STATUS_ERROR else ""
+        extra = " ".join(f"{a['key']}={next(iter(a['value'].values()))}" for a in s.get("attributes", []) if a["key"] in {"http.status_code", "bytes", "attempt"})
+        print(f"{'  ' * depth}{s['name']:<40} +{start:9.1f} ms {duration:9.1f} ms {extra}{error}")
+        for event in s.get("events", []):
+            at = (int(event["timeUnixNano"]) - t0) / 1e6
+            fields = " ".join(f"{a['key']}={next(iter(a['value'].values()))}" for a in event.get("attributes", []))
+            print(f"{'  ' * (depth + 1)}· {event['name']} +{at:.1f} ms {fields}")
+        for child in children.get(s["spanId"], []):
+            show(child, depth + 1)
+
+    for s in children.get(None, []):
+        show(s, 0)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Uso: python -m app.tracing <traces.jsonl> <request_id>")
+        sys.exit(2)
+    _summarize(sys.argv[1], sys.argv[2])
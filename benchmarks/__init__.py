@@ -0,0 +1 @@
+"""Benchmarks reproducibles contra upstreams locales."""
@@ -0,0 +1,116 @@
+"""Utilidades compartidas por los benchmarks (servidores locales y percentiles)."""
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+import uvicorn
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def self_signed_cert() -> Optional[Tuple[str, str]]:
+    """Genera un certificado autofirmado con openssl (si está disponible).
+
+    Se exporta en SSL_CERT_FILE para que httpx lo acepte sin desactivar la verificación.
+    """
+    if not shutil.which("openssl"):
+        return None
+    tmp = tempfile.mkdtemp(prefix="bench_tls_")
+    cert, key = os.path.join(tmp, "cert.pem"), os.path.join(tmp, "key.pem")
+    proc = subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1",
+         "-keyout", key, "-out", cert],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    if proc.returncode != 0:
+        return None
+    os.environ["SSL_CERT_FILE"] = cert
+    return cert, key
+
+
+@contextmanager
+def serve(app, port: Optional[int] = None, tls: Optional[Tuple[str, str]] = None):
+    """Levanta `app` con uvicorn en un hilo y devuelve la URL base."""
+    port = port or free_port()
+    kwargs = {"ssl_certfile": tls[0], "ssl_keyfile": tls[1]} if tls else {}
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", **kwargs)
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        yield f"{'https' if tls else 'http'}://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+def summary(samples: List[float]) -> str:
+    ms = [s * 1000 for s in samples]
+    return f"p50={percentile(ms, 50):7.2f} ms  p99={percentile(ms, 99):7.2f} ms  n={len(ms)}"
+
+
+def wait_until_up(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"{url} no responde tras {timeout} s")
+        time.sleep(0.1)
+
+
+@contextmanager
+def spawn(args: List[str], env: Optional[Dict[str, str]] = None, ready_url: Optional[str] = None) -> Iterator[subprocess.Popen]:
+    """Lanza `python <args>` en otro proceso (p. ej. la app con uvicorn) y lo para al salir."""
+    proc = subprocess.Popen([sys.executable, *args], env={**os.environ, **(env or {})})
+    try:
+        if ready_url:
+            wait_until_up(ready_url)
+        yield proc
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def rss_mb(pid: int) -> Tuple[Optional[float], Optional[float]]:
+    """RSS actual y pico (VmRSS, VmHWM) de un proceso en MB; solo Linux."""
+    values = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in {"VmRSS", "VmHWM"}:
+                    values[key] = int(rest.split()[0]) / 1024
+    except OSError:
+        pass
+    return values.get("VmRSS"), values.get("VmHWM")
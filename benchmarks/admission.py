@@ -0,0 +1,129 @@
+"""Latencia de /ping mientras una ruta cara está saturada, con y sin control de admisión.
+
+Uso:
+    python -m benchmarks.admission [--target bfl|openai] [--flood 300] [--duration 10]
+                                   [--max-in-flight 32] [--max-queue 32]
+
+Levanta los upstreams simulados y la app (dos veces: ADMISSION_ENABLED=false y
+true). Durante `--duration` segundos mantiene `--flood` peticiones concurrentes
+contra /bfl/flux-kontext (o /image/generate) y mide /ping a ritmo constante.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import tempfile
+import time
+from collections import Counter
+from typing import Dict, List, Tuple
+
+import httpx
+
+from benchmarks._common import free_port, percentile, spawn
+from benchmarks.load import SCENARIOS
+from benchmarks.mock_upstreams import env_for
+
+
+async def _flood(base: str, target: str, concurrency: int, duration: float) -> Counter:
+    method, path, body, headers = SCENARIOS[target]
+    statuses: Counter = Counter()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async def worker(client: httpx.AsyncClient, n: int):
+        i = n
+        while time.monotonic() < deadline:
+            try:
+                r = await client.request(method, path, json=body(i), headers=headers)
+                statuses[r.status_code] += 1
+                if r.status_code == 503:
+                    # Como un cliente bien educado: espera lo que indica Retry-After
+                    await asyncio.sleep(float(r.headers.get("retry-after", "1")))
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+            i += concurrency
+
+    deadline = time.monotonic() + duration
+    async with httpx.AsyncClient(base_url=base, timeout=300, limits=limits) as client:
+        await asyncio.gather(*(worker(client, n) for n in range(concurrency)))
+    return statuses
+
+
+def _flood_process(base: str, target: str, concurrency: int, duration: float, out: multiprocessing.Queue) -> None:
+    # En su propio proceso: la carga no compite con la sonda por el mismo event loop
+    out.put(dict(asyncio.run(_flood(base, target, concurrency, duration))))
+
+
+async def _probe(base: str, duration: float, rate: float) -> List[float]:
+    samples = []
+    async with httpx.AsyncClient(base_url=base, timeout=30) as client:
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            t0 = time.perf_counter()
+            (await client.get("/ping")).raise_for_status()
+            samples.append((time.perf_counter() - t0) * 1000)
+            await asyncio.sleep(max(0.0, 1 / rate - (time.perf_counter() - t0)))
+    return samples
+
+
+def _scenario(base: str, target: str, flood: int, duration: float) -> Tuple[List[float], List[float], Counter]:
+    idle = asyncio.run(_probe(base, 2.0, 20))
+    out: multiprocessing.Queue = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=_flood_process, args=(base, target, flood, duration + 1.0, out))
+    proc.start()
+    # Un margen para que la ruta cara se llene antes de medir
+    time.sleep(1.0)
+    loaded = asyncio.run(_probe(base, duration, 20))
+    statuses = Counter(out.get())
+    proc.join()
+    return idle, loaded, statuses
+
+
+def _line(label: str, ms: List[float]) -> str:
+    return f"{label:<22} p50={percentile(ms, 50):8.1f} ms  p95={percentile(ms, 95):8.1f} ms  p99={percentile(ms, 99):8.1f} ms  max={max(ms):8.1f} ms  n={len(ms)}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--target", choices=["bfl", "openai"], default="bfl")
+    parser.add_argument("--flood", type=int, default=300, help="Peticiones concurrentes contra la ruta cara")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--max-in-flight", type=int, default=32)
+    parser.add_argument("--max-queue", type=int, default=32)
+    args = parser.parse_args()
+
+    mock_port = free_port()
+    mock_base = f"http://127.0.0.1:{mock_port}"
+    # Trabajos BFL de 3 s y llamadas a OpenAI de 2 s: cada petición ocupa su hueco un buen rato
+    mock_args = ["-m", "benchmarks.mock_upstreams", "--port", str(mock_port), "--latency", "0.05",
+                 "--provider-latency", "openai=2.0", "--bfl-ready-after", "3.0", "--payload-bytes", "500000"]
+    group = args.target.upper()
+
+    with spawn(mock_args, ready_url=f"{mock_base}/"):
+        for enabled in ("false", "true"):
+            app_port = free_port()
+            output_dir = tempfile.mkdtemp(prefix="bench_admission_")
+            env: Dict[str, str] = {
+                **env_for(mock_base),
+                "ADMISSION_ENABLED": enabled,
+                "IMAGE_OUTPUT_DIR": output_dir,
+                "IMAGE_INDEX_PATH": output_dir + ".sqlite3",
+                # Las imágenes simuladas no son decodificables: sin miniaturas al guardar
+                "THUMBNAIL_EAGER": "false",
+                f"ADMISSION_{group}_MAX_IN_FLIGHT": str(args.max_in_flight),
+                f"ADMISSION_{group}_MAX_QUEUE": str(args.max_queue),
+                f"ADMISSION_{group}_QUEUE_TIMEOUT": "2",
+                "BFL_POLL_MIN_INTERVAL": "0.5",
+                "BFL_MAX_CONCURRENCY": "1000",
+                "OPENAI_MAX_CONCURRENCY": "1000",
+            }
+            app_base = f"http://127.0.0.1:{app_port}"
+            with spawn(["-m", "uvicorn", "app.main:app", "--port", str(app_port), "--log-level", "warning"],
+                       env=env, ready_url=f"{app_base}/ping"):
+                idle, loaded, statuses = _scenario(app_base, args.target, args.flood, args.duration)
+            print(f"\nADMISSION_ENABLED={enabled}  ({args.flood} concurrentes contra {SCENARIOS[args.target][1]})")
+            print(_line("/ping en reposo", idle))
+            print(_line("/ping con saturación", loaded))
+            print(f"{'respuestas ruta cara':<22} " + " ".join(f"{k}:{v}" for k, v in sorted(statuses.items(), key=str)))
+
+
+if __name__ == "__main__":
+    main()
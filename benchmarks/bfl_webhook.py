@@ -0,0 +1,115 @@
+"""Flux-Kontext con webhook frente a polling, contra un BFL local que hace callback.
+
+Uso:
+    python -m benchmarks.bfl_webhook [--requests 20] [--delay 2.2]
+
+El stand-in de BFL marca cada tarea como Ready tras `--delay` segundos y, si el
+payload trae `webhook_url`, hace POST firmado (HMAC-SHA256) a `/bfl/webhook`.
+Se reportan latencia extremo a extremo y GETs de polling por petición.
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import tempfile
+import time
+import uuid
+
+os.environ.setdefault("BFL_API_KEY", "bench")
+os.environ.setdefault("IMAGE_OUTPUT_DIR", tempfile.mkdtemp(prefix="bench_bfl_"))
+os.environ.setdefault("IMAGE_INDEX_PATH", os.environ["IMAGE_OUTPUT_DIR"] + ".sqlite3")
+os.environ.setdefault("HTTP_PREWARM", "false")
+
+import httpx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from benchmarks._common import free_port, serve, summary
+from app.main import app
+from app.providers import bfl_provider
+
+DELAY = 2.2
+_tasks = {}
+_polls = {"n": 0}
+_callback_client = {}
+
+
+async def _submit(request: Request):
+    payload = await request.json()
+    task_id = uuid.uuid4().hex
+    _tasks[task_id] = time.monotonic() + DELAY
+    base = str(request.base_url).rstrip("/")
+    if payload.get("webhook_url"):
+        asyncio.get_running_loop().create_task(
+            _callback(payload["webhook_url"], payload["webhook_secret"], task_id, base)
+        )
+    return JSONResponse({"id": task_id, "polling_url": f"{base}/v1/get_result?id={task_id}"})
+
+
+async def _callback(url: str, secret: str, task_id: str, base: str):
+    await asyncio.sleep(DELAY)
+    body = json.dumps({"id": task_id, "status": "Ready", "result": {"sample": f"{base}/sample/{task_id}.png"}}).encode()
+    signature = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    client = _callback_client.get("c")
+    if client is None:
+        client = _callback_client["c"] = httpx.AsyncClient()
+    await client.post(url, content=body, headers={"Content-Type": "application/json", "X-Webhook-Signature": f"sha256={signature}"})
+
+
+async def _get_result(request: Request):
+    _polls["n"] += 1
+    task_id = request.query_params["id"]
+    if time.monotonic() < _tasks[task_id]:
+        return JSONResponse({"id": task_id, "status": "Pending"})
+    base = str(request.base_url).rstrip("/")
+    return JSONResponse({"id": task_id, "status": "Ready", "result": {"sample": f"{base}/sample/{task_id}.png"}})
+
+
+async def _sample(request: Request):
+    return Response(b"\x89PNG" + b"\0" * 4096, media_type="image/png")
+
+
+standin = Starlette(routes=[
+    Route("/v1/flux-kontext-pro", _submit, methods=["POST", "HEAD"]),
+    Route("/v1/get_result", _get_result),
+    Route("/sample/{name}", _sample),
+])
+
+
+async def _run(api: str, n: int) -> list:
+    async with httpx.AsyncClient(timeout=120) as client:
+        async def one():
+            t0 = time.perf_counter()
+            r = await client.post(f"{api}/bfl/flux-kontext", json={"prompt": "bench", "image_base64": "AAAA"})
+            r.raise_for_status()
+            return time.perf_counter() - t0
+
+        return await asyncio.gather(*(one() for _ in range(n)))
+
+
+def main() -> None:
+    global DELAY
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--delay", type=float, default=DELAY)
+    args = parser.parse_args()
+    DELAY = args.delay
+
+    api_port = free_port()
+    with serve(standin) as upstream, serve(app, port=api_port) as api:
+        bfl_provider.BFL_API_URL = f"{upstream}/v1/flux-kontext-pro"
+        # Un secreto fijo, como en un despliegue con varios workers
+        bfl_provider.BFL_WEBHOOK_SECRET = "bench-webhook-secret"
+        for mode, webhook_url in (("polling", None), ("webhook", f"{api}/bfl/webhook")):
+            bfl_provider.BFL_WEBHOOK_URL = webhook_url
+            _polls["n"] = 0
+            samples = asyncio.run(_run(api, args.requests))
+            print(f"{mode:8s} {summary(samples)}  polls/petición={_polls['n'] / args.requests:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Rendimiento de /gemini/batch frente a llamar a /gemini/generate de una en una.
+
+Uso:
+    python -m benchmarks.gemini_batch [--items 10,100,1000] [--latency 0.2] [--concurrency 16]
+                                      [--sequential-max 50] [--error-rate 0.0]
+
+Levanta el upstream simulado de Gemini y la app (procesos aparte, como
+benchmarks.load). Para cada tamaño de lote mide:
+- secuencial: un cliente que llama a /gemini/generate prompt a prompt (como
+  los trabajos offline de ahora); como mucho `--sequential-max` prompts y se
+  extrapola el total;
+- batch: una sola petición a /gemini/batch, con el tiempo hasta la primera
+  línea NDJSON y hasta la última.
+Todas las peticiones llevan Cache-Control: no-cache para no medir la caché.
+"""
+import argparse
+import json
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+import httpx
+
+from benchmarks._common import free_port, spawn
+from benchmarks.mock_upstreams import env_for
+
+SYSTEM_PROMPT = "Responde en una frase."
+NO_CACHE = {"Cache-Control": "no-cache"}
+
+
+def _sequential(client: httpx.Client, n: int, tag: str) -> float:
+    t0 = time.perf_counter()
+    for i in range(n):
+        client.post("/gemini/generate", json={"system_prompt": SYSTEM_PROMPT, "user_prompt": f"{tag} {i}"}, headers=NO_CACHE)
+    return time.perf_counter() - t0
+
+
+def _batch(client: httpx.Client, n: int, tag: str) -> Tuple[float, float, Dict[str, int]]:
+    body = {"system_prompt": SYSTEM_PROMPT, "items": [{"id": str(i), "user_prompt": f"{tag} {i}"} for i in range(n)]}
+    statuses: Dict[str, int] = {}
+    first = None
+    t0 = time.perf_counter()
+    with client.stream("POST", "/gemini/batch", json=body, headers=NO_CACHE) as r:
+        r.raise_for_status()
+        for line in r.iter_lines():
+            if not line:
+                continue
+            if first is None:
+                first = time.perf_counter() - t0
+            status = str(json.loads(line)["status"])
+            statuses[status] = statuses.get(status, 0) + 1
+    return first or 0.0, time.perf_counter() - t0, statuses
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", default="10,100,1000")
+    parser.add_argument("--latency", type=float, default=0.2, help="Latencia de Gemini por llamada (s)")
+    parser.add_argument("--concurrency", type=int, default=16, help="GEMINI_BATCH_CONCURRENCY (y GEMINI_MAX_CONCURRENCY)")
+    parser.add_argument("--sequential-max", type=int, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    sizes: List[int] = [int(v) for v in args.items.split(",")]
+
+    mock_port, app_port = free_port(), free_port()
+    mock_base, app_base = f"http://127.0.0.1:{mock_port}", f"http://127.0.0.1:{app_port}"
+    mock_args = ["-m", "benchmarks.mock_upstreams", "--port", str(mock_port), "--latency", str(args.latency),
+                 "--error-rate", str(args.error_rate)]
+    output_dir = tempfile.mkdtemp(prefix="bench_batch_")
+    app_env = {
+        **env_for(mock_base),
+        "IMAGE_OUTPUT_DIR": output_dir,
+        "IMAGE_INDEX_PATH": output_dir + ".sqlite3",
+        "THUMBNAIL_EAGER": "false",
+        "GEMINI_BATCH_CONCURRENCY": str(args.concurrency),
+        "GEMINI_MAX_CONCURRENCY": str(args.concurrency),
+        "GEMINI_BATCH_MAX_ITEMS": str(max(sizes)),
+    }
+
+    with spawn(mock_args, ready_url=f"{mock_base}/"), \
+            spawn(["-m", "uvicorn", "app.main:app", "--port", str(app_port), "--log-level", "warning"],
+                  env=app_env, ready_url=f"{app_base}/ping"), \
+            httpx.Client(base_url=app_base, timeout=600) as client:
+        print(f"Gemini simulado: {args.latency * 1000:.0f} ms por llamada, concurrencia del lote {args.concurrency}")
+        print(f"{'items':>6} {'secuencial s':>13} {'items/s':>8} {'batch s':>8} {'items/s':>8} {'1ª línea ms':>12} {'x':>6}  status")
+        for n in sizes:
+            measured = min(n, args.sequential_max)
+            seq = _sequential(client, measured, f"seq{n}") * n / measured
+            first, total, statuses = _batch(client, n, f"batch{n}")
+            codes = " ".join(f"{k}:{v}" for k, v in sorted(statuses.items()))
+            approx = "~" if measured < n else " "
+            print(f"{n:>6} {approx}{seq:12.2f} {n / seq:8.1f} {total:8.2f} {n / total:8.1f} {first * 1000:12.0f} {seq / total:6.1f}  {codes}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Caché de contexto de Gemini: bytes por petición y latencia con un system prompt largo y repetido.
+
+Uso:
+    python -m benchmarks.gemini_context [--requests 50] [--prompt-kb 40] [--prefill-per-kb 0.005]
+
+Levanta el upstream simulado de Gemini (que tarda `--prefill-per-kb` segundos
+por KiB de `systemInstruction` en línea, como el prefill real) y la app en este
+proceso. Envía `--requests` peticiones a /gemini/generate con el mismo system
+prompt y mensajes distintos, primero con GEMINI_CONTEXT_CACHE_ENABLED=false y
+después con true, y compara los bytes que llegan al upstream y la latencia.
+"""
+import argparse
+import os
+import time
+
+os.environ.setdefault("HTTP_PREWARM", "false")
+os.environ.setdefault("GEMINI_CONTEXT_CACHE_MIN_USES", "1")
+
+import httpx
+
+from benchmarks._common import serve, summary
+from benchmarks.mock_upstreams import MockConfig, build_app, env_for
+
+
+class _CountBodies:
+    """Envuelve el upstream para contar los bytes recibidos en generateContent."""
+
+    def __init__(self, app):
+        self.app = app
+        self.bytes = 0
+        self.requests = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].endswith(":generateContent"):
+            return await self.app(scope, receive, send)
+        self.requests += 1
+
+        async def counting():
+            message = await receive()
+            self.bytes += len(message.get("body", b""))
+            return message
+
+        await self.app(scope, counting, send)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--prompt-kb", type=int, default=40)
+    parser.add_argument("--prefill-per-kb", type=float, default=0.005)
+    args = parser.parse_args()
+
+    system_prompt = ("Eres un agente que sigue estas instrucciones al pie de la letra. " * 2000)[: args.prompt_kb * 1024]
+    upstream = _CountBodies(build_app(MockConfig(latency=0.05, jitter=0.0, gemini_prefill_per_kb=args.prefill_per_kb)))
+    with serve(upstream) as up:
+        for name, value in env_for(up).items():
+            os.environ.setdefault(name, value)
+        # Después de fijar GEMINI_ENDPOINT: la configuración se lee al importar
+        from app import gemini_context
+        from app.main import app
+        from app.routers.gemini import context_cache
+
+        with serve(app) as api, httpx.Client(base_url=api, timeout=60) as client:
+            print(f"system prompt de {args.prompt_kb} KiB, prefill simulado {args.prefill_per_kb * 1000:.1f} ms/KiB")
+            for enabled in (False, True):
+                gemini_context.GEMINI_CONTEXT_CACHE_ENABLED = enabled
+                upstream.bytes = upstream.requests = 0
+                samples = []
+                for i in range(args.requests):
+                    body = {"system_prompt": system_prompt, "user_prompt": f"pregunta {i} {enabled}"}
+                    t0 = time.perf_counter()
+                    client.post("/gemini/generate", json=body, headers={"Cache-Control": "no-cache"}).raise_for_status()
+                    samples.append(time.perf_counter() - t0)
+                    if enabled and i == 0:
+                        # Da tiempo a que se registre el contexto en segundo plano
+                        time.sleep(0.5)
+                label = "con caché de contexto" if enabled else "prompt en línea      "
+                print(f"  {label}: {upstream.bytes / max(1, upstream.requests) / 1024:7.1f} KiB/petición  {summary(samples)}")
+            print(f"  {context_cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Listado de generaciones: índice sqlite frente a recorrer el directorio de salida.
+
+Uso:
+    python -m benchmarks.generations [--rows 100000] [--files 20000] [--creatures 50] [--limit 50]
+
+1. Rellena un índice temporal con `--rows` generaciones y mide la primera
+   página, una página profunda (por cursor) y el filtro por criatura.
+2. Crea `--files` ficheros con el esquema antiguo (`bfl/<criatura>/<label>_<ts>.png`)
+   y mide lo que costaba lo mismo con `os.walk` + `stat` + ordenar.
+3. Coste de `put_bytes` para contenido nuevo y repetido (dedup).
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List
+
+from app.storage import ImageMeta, ImageStore
+
+
+def _ms(fn: Callable[[], object], runs: int = 20) -> float:
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+def _fill_index(store: ImageStore, rows: int, creatures: int) -> None:
+    conn = store._conn()
+    now = time.time()
+    with conn:
+        conn.executemany(
+            "INSERT INTO objects (sha256, ext, bytes, width, height, created_at) VALUES (?, '.png', 1000, 1024, 1024, ?)",
+            ((f"{i:064x}", now) for i in range(rows)),
+        )
+        conn.executemany(
+            "INSERT INTO generations (provider, prompt, creature, label, sha256, status, created_at, completed_at) "
+            "VALUES (?, ?, ?, 'image', ?, 'ready', ?, ?)",
+            ((("bfl", "runware", "openai")[i % 3], f"prompt {i}", f"creature{i % creatures}", f"{i:064x}", now + i, now + i)
+             for i in range(rows)),
+        )
+
+
+def _fill_legacy(root: Path, files: int, creatures: int) -> None:
+    for i in range(files):
+        d = root / "bfl" / f"creature{i % creatures}"
+        d.mkdir(parents=True, exist_ok=True)
+        (d / f"image_{1700000000 + i}.png").write_bytes(b"")
+
+
+def _legacy_page(root: Path, creature: str, offset: int, limit: int) -> List[str]:
+    # Lo que hacía falta antes: recorrer, hacer stat de cada fichero y ordenar
+    entries = []
+    for dirpath, _, names in os.walk(root):
+        if creature and Path(dirpath).name != creature:
+            continue
+        for name in names:
+            path = os.path.join(dirpath, name)
+            entries.append((os.stat(path).st_mtime, path))
+    entries.sort(reverse=True)
+    return [p for _, p in entries[offset:offset + limit]]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--files", type=int, default=20_000)
+    parser.add_argument("--creatures", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+
+    tmp = Path(tempfile.mkdtemp(prefix="bench_generations_"))
+    store = ImageStore(tmp / "generated", tmp / "index.sqlite3")
+    t0 = time.perf_counter()
+    _fill_index(store, args.rows, args.creatures)
+    print(f"índice: {args.rows} generaciones insertadas en {time.perf_counter() - t0:.1f} s")
+
+    _, cursor = store.list(limit=args.limit)
+    deep = args.rows // 2
+    print(f"  primera página:             {_ms(lambda: store.list(limit=args.limit)):8.3f} ms")
+    print(f"  página profunda (id<{deep}): {_ms(lambda: store.list(before=deep, limit=args.limit)):8.3f} ms")
+    print(f"  por criatura:               {_ms(lambda: store.list(creature='creature7', limit=args.limit)):8.3f} ms")
+    print(f"  por proveedor + cursor:     {_ms(lambda: store.list(provider='bfl', before=deep, limit=args.limit)):8.3f} ms")
+
+    legacy = tmp / "legacy"
+    t0 = time.perf_counter()
+    _fill_legacy(legacy, args.files, args.creatures)
+    print(f"\ndirectorio: {args.files} ficheros creados en {time.perf_counter() - t0:.1f} s")
+    print(f"  primera página:             {_ms(lambda: _legacy_page(legacy, '', 0, args.limit), 5):8.3f} ms")
+    print(f"  página profunda:            {_ms(lambda: _legacy_page(legacy, '', args.files // 2, args.limit), 5):8.3f} ms")
+    print(f"  por criatura:               {_ms(lambda: _legacy_page(legacy, 'creature7', 0, args.limit), 5):8.3f} ms")
+
+    meta = ImageMeta("bench", "prompt")
+    payloads = [os.urandom(512 * 1024) for _ in range(50)]
+    t0 = time.perf_counter()
+    for data in payloads:
+        store.put_bytes(data, meta)
+    fresh = (time.perf_counter() - t0) / len(payloads) * 1000
+    t0 = time.perf_counter()
+    for data in payloads:
+        store.put_bytes(data, meta)
+    dup = (time.perf_counter() - t0) / len(payloads) * 1000
+    print(f"\nput_bytes 512 KiB: nuevo {fresh:.2f} ms, repetido (dedup) {dup:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
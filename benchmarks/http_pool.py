@@ -0,0 +1,69 @@
+"""Compara un cliente httpx nuevo por petición contra el cliente compartido del pool.
+
+Uso:
+    python -m benchmarks.http_pool [--requests 300] [--no-tls]
+
+Levanta un upstream local (HTTPS con certificado autofirmado si hay openssl)
+y mide p50/p99 de una llamada tipo "submit" en ambos modos.
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from benchmarks._common import self_signed_cert, serve, summary
+from app import http_clients
+
+
+async def _submit(request):
+    return JSONResponse({"id": "job", "polling_url": str(request.url)})
+
+
+upstream = Starlette(routes=[Route("/v1/submit", _submit, methods=["GET", "POST", "HEAD"])])
+
+
+async def _per_request(url: str, n: int) -> list:
+    samples = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        async with httpx.AsyncClient(timeout=60) as client:
+            (await client.post(url, json={"prompt": "x"})).raise_for_status()
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+async def _pooled(url: str, n: int) -> list:
+    # Mismo camino que usan los routers: cliente compartido + precalentamiento
+    await http_clients.startup(prewarm_urls={"bfl": url})
+    client = http_clients.get_client("bfl")
+    samples = []
+    try:
+        for _ in range(n):
+            t0 = time.perf_counter()
+            (await client.post(url, json={"prompt": "x"})).raise_for_status()
+            samples.append(time.perf_counter() - t0)
+    finally:
+        await http_clients.shutdown()
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--no-tls", action="store_true")
+    args = parser.parse_args()
+
+    tls = None if args.no_tls else self_signed_cert()
+    with serve(upstream, tls=tls) as base:
+        url = f"{base}/v1/submit"
+        print(f"upstream: {url}")
+        print(f"cliente por petición: {summary(asyncio.run(_per_request(url, args.requests)))}")
+        print(f"cliente compartido:   {summary(asyncio.run(_pooled(url, args.requests)))}")
+
+
+if __name__ == "__main__":
+    main()
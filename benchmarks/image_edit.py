@@ -0,0 +1,89 @@
+"""Sobrecoste de /image/edit sin contar el tiempo del upstream.
+
+Uso:
+    python -m benchmarks.image_edit [--requests 30] [--images 8] [--size-mb 2]
+
+Apunta el SDK de OpenAI (OPENAI_BASE_URL) a un upstream local que responde al
+instante, envía `--images` referencias por petición y reporta la latencia de
+extremo a extremo, el tiempo dentro del upstream y los bytes escritos a disco
+por petición (de /proc/self/io, Linux).
+"""
+import argparse
+import base64
+import os
+import tempfile
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("IMAGE_OUTPUT_DIR", tempfile.mkdtemp(prefix="bench_edit_"))
+os.environ.setdefault("IMAGE_INDEX_PATH", os.environ["IMAGE_OUTPUT_DIR"] + ".sqlite3")
+os.environ.setdefault("HTTP_PREWARM", "false")
+
+import httpx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from benchmarks._common import serve, summary
+from app.main import app
+from app.settings import settings
+
+_PNG = base64.b64encode(b"\x89PNG\r\n\x1a\n" + b"\0" * 256).decode()
+_upstream_time = []
+
+
+async def _edits(request: Request):
+    t0 = time.perf_counter()
+    await request.body()
+    _upstream_time.append(time.perf_counter() - t0)
+    return JSONResponse({"created": int(time.time()), "data": [{"b64_json": _PNG}]})
+
+
+upstream = Starlette(routes=[Route("/v1/images/edits", _edits, methods=["POST"])])
+
+
+def _write_bytes() -> int:
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("write_bytes:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--images", type=int, default=8)
+    parser.add_argument("--size-mb", type=float, default=2.0)
+    args = parser.parse_args()
+
+    blob = os.urandom(int(args.size_mb * 1024 * 1024))
+    files = [("images", (f"ref{i}.png", blob, "image/png")) for i in range(args.images)]
+    data = {"prompt": "bench", "size": "1024x1024", "quality": "low"}
+
+    with serve(upstream) as up, serve(app) as api:
+        settings.openai_base_url = f"{up}/v1"
+        samples = []
+        with httpx.Client(timeout=120) as client:
+            client.post(f"{api}/image/edit", data=data, files=files).raise_for_status()
+            _upstream_time.clear()
+            w0 = _write_bytes()
+            for _ in range(args.requests):
+                t0 = time.perf_counter()
+                client.post(f"{api}/image/edit", data=data, files=files).raise_for_status()
+                samples.append(time.perf_counter() - t0)
+            written = (_write_bytes() - w0) / args.requests
+
+    overhead = [s - u for s, u in zip(samples, _upstream_time)]
+    print(f"{args.images} imágenes x {args.size_mb} MiB por petición")
+    print(f"extremo a extremo:      {summary(samples)}")
+    print(f"sin tiempo de upstream: {summary(overhead)}")
+    print(f"escrito a disco por petición: {written / 1024 / 1024:.2f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Tiempo hasta el primer píxel de /image/generate/stream frente a /image/generate.
+
+Uso:
+    python -m benchmarks.image_stream [--requests 10] [--latency 2.0] [--partials 2] [--payload-bytes 300000]
+
+Levanta el upstream simulado de OpenAI (con streaming: reparte `--latency`
+entre las `--partials` imágenes parciales y la final) y la app en este
+proceso. Para cada petición mide cuándo llega la primera parcial y cuándo la
+imagen final guardada, y lo compara con la respuesta completa de /image/generate.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+os.environ.setdefault("IMAGE_OUTPUT_DIR", tempfile.mkdtemp(prefix="bench_stream_"))
+os.environ.setdefault("IMAGE_INDEX_PATH", os.environ["IMAGE_OUTPUT_DIR"] + ".sqlite3")
+os.environ.setdefault("HTTP_PREWARM", "false")
+os.environ.setdefault("THUMBNAIL_EAGER", "false")
+
+import httpx
+
+from benchmarks._common import serve, summary
+from benchmarks.mock_upstreams import MockConfig, build_app, env_for
+
+
+def _stream_once(client: httpx.Client, body: dict):
+    t0 = time.perf_counter()
+    first = None
+    event = None
+    with client.stream("POST", "/image/generate/stream", json=body) as r:
+        r.raise_for_status()
+        for line in r.iter_lines():
+            if line.startswith("event: "):
+                event = line[7:]
+                if event == "partial" and first is None:
+                    first = time.perf_counter() - t0
+                elif event == "error":
+                    raise RuntimeError(line)
+    return first, time.perf_counter() - t0, event
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=2.0, help="Duración de una generación en el upstream (s)")
+    parser.add_argument("--partials", type=int, default=2)
+    parser.add_argument("--payload-bytes", type=int, default=300_000)
+    args = parser.parse_args()
+
+    mock = build_app(MockConfig(latency=args.latency, jitter=0.0, payload_bytes=args.payload_bytes))
+    with serve(mock) as up:
+        for name, value in env_for(up).items():
+            os.environ.setdefault(name, value)
+        # Después de fijar OPENAI_BASE_URL: la configuración se lee al importar
+        from app.main import app
+
+        with serve(app) as api, httpx.Client(base_url=api, timeout=120) as client:
+            first, done, blocking = [], [], []
+            for i in range(args.requests):
+                body = {"prompt": f"robot {i}", "size": "1024x1024", "quality": "low"}
+                t0 = time.perf_counter()
+                client.post("/image/generate", json=body).raise_for_status()
+                blocking.append(time.perf_counter() - t0)
+                ttfp, total, last = _stream_once(client, {**body, "prompt": f"robot stream {i}", "partial_images": args.partials})
+                if last != "done":
+                    raise RuntimeError(f"El stream terminó con {last!r} en vez de 'done'")
+                first.append(ttfp if ttfp is not None else total)
+                done.append(total)
+
+    print(f"upstream {args.latency:.1f} s por imagen, {args.partials} parciales, {args.payload_bytes} bytes")
+    print(f"/image/generate (bloqueante):     {summary(blocking)}")
+    print(f"/image/generate/stream 1ª parcial: {summary(first)}")
+    print(f"/image/generate/stream final:     {summary(done)}")
+    print(f"primer píxel: {100 * sum(first) / sum(blocking):.0f}% de la latencia bloqueante")
+
+
+if __name__ == "__main__":
+    main()
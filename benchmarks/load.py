@@ -0,0 +1,128 @@
+"""Prueba de carga de la app completa contra upstreams simulados.
+
+Uso:
+    python -m benchmarks.load [--scenarios gemini,runware,bfl,openai] [--concurrency 1,8,32,64]
+                              [--requests 200] [--latency 0.05] [--payload-bytes 1500000]
+                              [--error-rate 0.0] [--bfl-ready-after 1.0] [--env CLAVE=VALOR ...]
+
+Levanta benchmarks/mock_upstreams.py y la app (`uvicorn app.main:app`) en procesos
+separados, con GEMINI_ENDPOINT, RUNWARE_ENDPOINT, BFL_API_URL y OPENAI_BASE_URL
+apuntando al mock. Para cada escenario y nivel de concurrencia informa req/s,
+p50/p95/p99, errores y RSS (actual y pico) del proceso de la app.
+"""
+import argparse
+import asyncio
+import base64
+import itertools
+import tempfile
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Tuple
+
+import httpx
+
+from benchmarks._common import free_port, percentile, rss_mb, spawn
+from benchmarks.mock_upstreams import add_arguments, env_for
+
+_REF_IMAGE = base64.b64encode(b"\x89PNG\r\n\x1a\n" + b"\0" * 2048).decode("ascii")
+
+# Escenario -> (método, ruta, constructor del cuerpo JSON, cabeceras)
+SCENARIOS: Dict[str, Tuple[str, str, Callable[[int], dict], Dict[str, str]]] = {
+    # Sin caché: se mide el camino hasta el upstream
+    "gemini": ("POST", "/gemini/generate", lambda i: {"system_prompt": "Eres un asistente.", "user_prompt": f"hola {i}"},
+               {"cache-control": "no-cache, no-store"}),
+    "runware": ("POST", "/runware/generate", lambda i: {"prompt": f"robot {i}"}, {}),
+    "bfl": ("POST", "/bfl/flux-kontext", lambda i: {"prompt": f"edit {i}", "image_base64": _REF_IMAGE}, {}),
+    "openai": ("POST", "/image/generate", lambda i: {"prompt": f"robot {i}", "size": "1024x1024", "quality": "low"}, {}),
+    "ping": ("GET", "/ping", lambda i: None, {}),
+}
+
+
+async def _run_level(base: str, scenario: str, concurrency: int, total: int) -> Tuple[List[float], Counter, float]:
+    method, path, body, headers = SCENARIOS[scenario]
+    counter = itertools.count()
+    samples: List[float] = []
+    statuses: Counter = Counter()
+
+    async def worker(client: httpx.AsyncClient):
+        while True:
+            i = next(counter)
+            if i >= total:
+                return
+            t0 = time.perf_counter()
+            try:
+                r = await client.request(method, path, json=body(i), headers=headers)
+                statuses[r.status_code] += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+                continue
+            samples.append(time.perf_counter() - t0)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base, timeout=300, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return samples, statuses, elapsed
+
+
+def _fmt_mb(value) -> str:
+    return f"{value:7.1f}" if value is not None else "    n/a"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", default="gemini,runware,bfl,openai")
+    parser.add_argument("--concurrency", default="1,8,32,64")
+    parser.add_argument("--requests", type=int, default=200, help="Peticiones por escenario y nivel")
+    parser.add_argument("--env", action="append", default=[], metavar="CLAVE=VALOR", help="Variables extra para la app")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    mock_port, app_port = free_port(), free_port()
+    mock_args = ["-m", "benchmarks.mock_upstreams", "--port", str(mock_port),
+                 "--latency", str(args.latency), "--jitter", str(args.jitter),
+                 "--payload-bytes", str(args.payload_bytes), "--text-bytes", str(args.text_bytes),
+                 "--error-rate", str(args.error_rate), "--bfl-ready-after", str(args.bfl_ready_after)]
+    for item in args.provider_latency:
+        mock_args += ["--provider-latency", item]
+    mock_base = f"http://127.0.0.1:{mock_port}"
+
+    output_dir = tempfile.mkdtemp(prefix="bench_load_")
+    app_env = {
+        **env_for(mock_base),
+        "IMAGE_OUTPUT_DIR": output_dir,
+        "IMAGE_INDEX_PATH": output_dir + ".sqlite3",
+        # Las imágenes simuladas no son decodificables: sin miniaturas al guardar
+        "THUMBNAIL_EAGER": "false",
+        "BFL_POLL_MIN_INTERVAL": "0.2",
+    }
+    for item in args.env:
+        key, _, value = item.partition("=")
+        app_env[key.strip()] = value
+    app_base = f"http://127.0.0.1:{app_port}"
+
+    with spawn(mock_args, ready_url=f"{mock_base}/"), \
+            spawn(["-m", "uvicorn", "app.main:app", "--port", str(app_port), "--log-level", "warning"],
+                  env=app_env, ready_url=f"{app_base}/ping") as app_proc:
+        rss, peak = rss_mb(app_proc.pid)
+        print(f"app arrancada: RSS={_fmt_mb(rss)} MB")
+        print(f"{'escenario':<9} {'conc':>5} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'RSS MB':>8} {'pico MB':>8}  status")
+        for scenario in scenarios:
+            for concurrency in levels:
+                samples, statuses, elapsed = asyncio.run(_run_level(app_base, scenario, concurrency, args.requests))
+                ms = [s * 1000 for s in samples]
+                rss, peak = rss_mb(app_proc.pid)
+                codes = " ".join(f"{k}:{v}" for k, v in sorted(statuses.items(), key=str))
+                print(
+                    f"{scenario:<9} {concurrency:>5} {len(samples) / elapsed:8.1f} "
+                    f"{percentile(ms, 50):9.1f} {percentile(ms, 95):9.1f} {percentile(ms, 99):9.1f} "
+                    f"{_fmt_mb(rss):>8} {_fmt_mb(peak):>8}  {codes}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Coste de la instrumentación de métricas.
+
+Uso:
+    python -m benchmarks.metrics_overhead [--ops 200000] [--requests 2000]
+
+1. Microbenchmark de las primitivas (ns/op): Counter.inc, Histogram.observe y `phase`.
+2. La misma app FastAPI con y sin MetricsMiddleware, servida con uvicorn:
+   p50/p99 de una ruta trivial en ambos modos y el coste de un scrape de /metrics.
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from benchmarks._common import serve, summary
+from app.metrics import Counter, Histogram, MetricsMiddleware, phase
+from app.routers import metrics as metrics_router
+
+
+def _ns_per_op(fn, ops: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(ops):
+        fn()
+    return (time.perf_counter() - t0) / ops * 1e9
+
+
+def micro(ops: int) -> None:
+    counter = Counter("bench_total", "bench", ("provider",))
+    histogram = Histogram("bench_seconds", "bench", ("provider", "phase"))
+
+    def run_phase():
+        with phase("bench", "submit"):
+            pass
+
+    print(f"baseline (llamada vacía)   {_ns_per_op(lambda: None, ops):8.0f} ns/op")
+    print(f"Counter.inc                {_ns_per_op(lambda: counter.inc(provider='bfl'), ops):8.0f} ns/op")
+    print(f"Histogram.observe          {_ns_per_op(lambda: histogram.observe(0.3, provider='bfl', phase='poll'), ops):8.0f} ns/op")
+    print(f"with phase(...)            {_ns_per_op(run_phase, ops):8.0f} ns/op")
+
+
+def _app(instrumented: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"message": "pong"}
+
+    if instrumented:
+        app.add_middleware(MetricsMiddleware)
+        app.include_router(metrics_router.router)
+    return app
+
+
+async def _drive(base: str, path: str, n: int) -> list:
+    samples = []
+    async with httpx.AsyncClient(base_url=base, timeout=30) as client:
+        for _ in range(50):
+            await client.get(path)
+        for _ in range(n):
+            t0 = time.perf_counter()
+            (await client.get(path)).raise_for_status()
+            samples.append(time.perf_counter() - t0)
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ops", type=int, default=200_000)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    micro(args.ops)
+
+    for instrumented in (False, True):
+        with serve(_app(instrumented)) as base:
+            samples = asyncio.run(_drive(base, "/ping", args.requests))
+            label = "con MetricsMiddleware" if instrumented else "sin métricas        "
+            print(f"/ping {label}  {summary(samples)}")
+            if instrumented:
+                scrape = asyncio.run(_drive(base, "/metrics", 200))
+                print(f"scrape /metrics              {summary(scrape)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""Upstreams simulados de OpenAI, Gemini, Runware y BFL para medir el servicio sin pagar proveedores.
+
+Uso (normalmente lo arranca benchmarks/load.py):
+    python -m benchmarks.mock_upstreams [--port 9100] [--latency 0.05] [--provider-latency bfl=0.5]
+                                        [--payload-bytes 1500000] [--error-rate 0.01] [--bfl-ready-after 1.0]
+
+Rutas (apuntar la app con las variables de entorno indicadas):
+    POST /openai/v1/images/generations|edits          OPENAI_BASE_URL=<base>/openai/v1
+         (con "stream": true, SSE con "partial_images" parciales y la final)
+    POST /gemini/v1beta/models/<modelo>:generateContent
+         (y :streamGenerateContent?alt=sse)           GEMINI_ENDPOINT=<base>/gemini/v1beta/models/gemini-2.0-flash:generateContent
+    POST /gemini/v1beta/cachedContents (+ PATCH/DELETE /cachedContents/<id>)
+    POST /runware/v1/generate                         RUNWARE_ENDPOINT=<base>/runware/v1/generate
+    POST /bfl/v1/<modelo> + GET /bfl/v1/get_result    BFL_API_URL=<base>/bfl/v1/flux-kontext-pro
+    GET  /images/<nombre>                             (URLs de resultado de Runware y BFL)
+
+La latencia se aplica a cada petición (con jitter uniforme de ±`--jitter`); con
+probabilidad `--error-rate` se responde 503. Con `--gemini-prefill-per-kb`,
+Gemini tarda además ese tiempo por KiB de `systemInstruction` enviado en línea
+(lo que procesa un contexto cacheado no se vuelve a cobrar en latencia).
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import time
+import uuid
+from typing import Dict, Optional
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+class MockConfig:
+    def __init__(
+        self,
+        latency: float = 0.05,
+        jitter: float = 0.2,
+        provider_latency: Optional[Dict[str, float]] = None,
+        payload_bytes: int = 1_500_000,
+        text_bytes: int = 2000,
+        error_rate: float = 0.0,
+        bfl_ready_after: float = 1.0,
+        gemini_prefill_per_kb: float = 0.0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.provider_latency = provider_latency or {}
+        self.payload_bytes = payload_bytes
+        self.text_bytes = text_bytes
+        self.error_rate = error_rate
+        self.bfl_ready_after = bfl_ready_after
+        self.gemini_prefill_per_kb = gemini_prefill_per_kb
+
+
+def build_app(config: MockConfig) -> Starlette:
+    image = PNG_SIGNATURE + os.urandom(max(0, config.payload_bytes - len(PNG_SIGNATURE)))
+    image_b64 = base64.b64encode(image).decode("ascii")
+    text = ("lorem ipsum " * (config.text_bytes // 12 + 1))[: config.text_bytes]
+    bfl_jobs: Dict[str, float] = {}
+
+    async def delay(provider: str) -> Optional[Response]:
+        base = config.provider_latency.get(provider, config.latency)
+        if base > 0:
+            await asyncio.sleep(max(0.0, base * random.uniform(1 - config.jitter, 1 + config.jitter)))
+        if config.error_rate and random.random() < config.error_rate:
+            return JSONResponse({"error": "mock upstream error"}, status_code=503)
+        return None
+
+    def openai_stream(body: dict) -> StreamingResponse:
+        partials = int(body.get("partial_images") or 0)
+        base = config.provider_latency.get("openai", config.latency)
+        step = base * random.uniform(1 - config.jitter, 1 + config.jitter) / (partials + 1)
+        common = {"background": "transparent", "output_format": "png", "quality": "low", "size": body.get("size", "1024x1024")}
+
+        async def events():
+            # La latencia total se reparte entre las parciales y la final
+            for i in range(partials):
+                await asyncio.sleep(step)
+                event = {"type": "image_generation.partial_image", "partial_image_index": i, "b64_json": image_b64,
+                         "created_at": int(time.time()), **common}
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+            await asyncio.sleep(step)
+            event = {"type": "image_generation.completed", "b64_json": image_b64, "created_at": int(time.time()),
+                     "usage": {"input_tokens": 10, "output_tokens": 100, "total_tokens": 110,
+                               "input_tokens_details": {"image_tokens": 0, "text_tokens": 10}}, **common}
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def openai_images(request: Request):
+        raw = await request.body()
+        if request.headers.get("content-type", "").startswith("application/json"):
+            body = json.loads(raw)
+            if body.get("stream"):
+                if config.error_rate and random.random() < config.error_rate:
+                    return JSONResponse({"error": "mock upstream error"}, status_code=503)
+                return openai_stream(body)
+        error = await delay("openai")
+        if error is not None:
+            return error
+        return JSONResponse({"created": int(time.time()), "data": [{"b64_json": image_b64}]})
+
+    contexts: Dict[str, int] = {}
+
+    async def gemini(request: Request):
+        body = json.loads(await request.body() or b"{}")
+        action = request.path_params["target"].rsplit(":", 1)[-1]
+        if body.get("cachedContent") and body["cachedContent"] not in contexts:
+            return JSONResponse(
+                {"error": {"code": 404, "message": "CachedContent not found (or permission denied)", "status": "NOT_FOUND"}},
+                status_code=404,
+            )
+        error = await delay("gemini")
+        if error is not None:
+            return error
+        if config.gemini_prefill_per_kb and body.get("systemInstruction"):
+            await asyncio.sleep(len(json.dumps(body["systemInstruction"])) / 1024 * config.gemini_prefill_per_kb)
+        if action == "streamGenerateContent":
+            async def events():
+                step = max(1, len(text) // 10)
+                for i in range(0, len(text), step):
+                    chunk = {"candidates": [{"content": {"parts": [{"text": text[i:i + step]}]}}]}
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                    await asyncio.sleep(0)
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+        return JSONResponse({"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}}]})
+
+    async def gemini_cache_create(request: Request):
+        body = await request.json()
+        name = f"cachedContents/{uuid.uuid4().hex[:12]}"
+        contexts[name] = len(json.dumps(body.get("systemInstruction")))
+        # Crear el contexto cuesta procesar el prompt una vez
+        if config.gemini_prefill_per_kb:
+            await asyncio.sleep(contexts[name] / 1024 * config.gemini_prefill_per_kb)
+        return JSONResponse({"name": name, "model": body.get("model"), "ttl": body.get("ttl")})
+
+    async def gemini_cache_item(request: Request):
+        name = f"cachedContents/{request.path_params['id']}"
+        if name not in contexts:
+            return JSONResponse({"error": {"code": 404, "message": "CachedContent not found", "status": "NOT_FOUND"}}, status_code=404)
+        if request.method == "DELETE":
+            contexts.pop(name)
+            return JSONResponse({})
+        return JSONResponse({"name": name})
+
+    async def runware(request: Request):
+        tasks = await request.json()
+        error = await delay("runware")
+        if error is not None:
+            return error
+        base = str(request.base_url).rstrip("/")
+        data = [
+            {"taskType": t.get("taskType"), "taskUUID": t.get("taskUUID"), "imageURL": f"{base}/images/runware-{uuid.uuid4().hex}.png"}
+            for t in tasks
+        ]
+        return JSONResponse({"data": data})
+
+    async def bfl_submit(request: Request):
+        await request.body()
+        error = await delay("bfl")
+        if error is not None:
+            return error
+        job_id = uuid.uuid4().hex
+        bfl_jobs[job_id] = time.monotonic()
+        base = str(request.base_url).rstrip("/")
+        return JSONResponse({"id": job_id, "polling_url": f"{base}/bfl/v1/get_result?id={job_id}"})
+
+    async def bfl_result(request: Request):
+        error = await delay("bfl")
+        if error is not None:
+            return error
+        job_id = request.query_params.get("id", "")
+        started = bfl_jobs.get(job_id)
+        if started is None:
+            return JSONResponse({"id": job_id, "status": "Task not found"})
+        if time.monotonic() - started < config.bfl_ready_after:
+            return JSONResponse({"id": job_id, "status": "Pending", "progress": 0.5})
+        bfl_jobs.pop(job_id, None)
+        base = str(request.base_url).rstrip("/")
+        return JSONResponse({"id": job_id, "status": "Ready", "result": {"sample": f"{base}/images/bfl-{job_id}.png"}})
+
+    async def images(request: Request):
+        error = await delay("download")
+        if error is not None:
+            return error
+        return Response(image, media_type="image/png")
+
+    return Starlette(routes=[
+        Route("/openai/v1/images/generations", openai_images, methods=["POST"]),
+        Route("/openai/v1/images/edits", openai_images, methods=["POST"]),
+        Route("/gemini/v1beta/models/{target}", gemini, methods=["POST"]),
+        Route("/gemini/v1beta/cachedContents", gemini_cache_create, methods=["POST"]),
+        Route("/gemini/v1beta/cachedContents/{id}", gemini_cache_item, methods=["PATCH", "DELETE"]),
+        Route("/runware/v1/generate", runware, methods=["POST"]),
+        Route("/bfl/v1/get_result", bfl_result, methods=["GET"]),
+        Route("/bfl/v1/{model}", bfl_submit, methods=["POST"]),
+        Route("/images/{name}", images, methods=["GET"]),
+        # El precalentamiento de la app hace HEAD al origen
+        Route("/", lambda request: Response(b""), methods=["GET", "HEAD"]),
+    ])
+
+
+def env_for(base: str) -> Dict[str, str]:
+    """Variables de entorno que apuntan la app a los upstreams simulados en `base`."""
+    return {
+        "OPENAI_BASE_URL": f"{base}/openai/v1",
+        "GEMINI_ENDPOINT": f"{base}/gemini/v1beta/models/gemini-2.0-flash:generateContent",
+        "RUNWARE_ENDPOINT": f"{base}/runware/v1/generate",
+        "BFL_API_URL": f"{base}/bfl/v1/flux-kontext-pro",
+        "OPENAI_API_KEY": "mock",
+        "GEMINI_API_KEY": "mock",
+        "RUNWARE_API_KEY": "mock",
+        "BFL_API_KEY": "mock",
+    }
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency", type=float, default=0.05, help="Latencia base por petición (s)")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Jitter relativo de la latencia")
+    parser.add_argument("--provider-latency", action="append", default=[], metavar="PROVEEDOR=S",
+                        help="Latencia de un proveedor: openai, gemini, runware, bfl o download")
+    parser.add_argument("--payload-bytes", type=int, default=1_500_000, help="Tamaño de las imágenes")
+    parser.add_argument("--text-bytes", type=int, default=2000, help="Tamaño del texto de Gemini")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fracción de respuestas 503")
+    parser.add_argument("--bfl-ready-after", type=float, default=1.0, help="Segundos hasta que un trabajo BFL está listo")
+    parser.add_argument("--gemini-prefill-per-kb", type=float, default=0.0,
+                        help="Segundos extra de Gemini por KiB de systemInstruction en línea")
+
+
+def config_from_args(args: argparse.Namespace) -> MockConfig:
+    provider_latency = {}
+    for item in args.provider_latency:
+        name, _, value = item.partition("=")
+        provider_latency[name.strip()] = float(value)
+    return MockConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        provider_latency=provider_latency,
+        payload_bytes=args.payload_bytes,
+        text_bytes=args.text_bytes,
+        error_rate=args.error_rate,
+        bfl_ready_after=args.bfl_ready_after,
+        gemini_prefill_per_kb=args.gemini_prefill_per_kb,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=9100)
+    add_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(build_app(config_from_args(args)), host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
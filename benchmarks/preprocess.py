@@ -0,0 +1,106 @@
+"""Coste y ahorro del preprocesado de subidas (app/preprocess.py). Requiere Pillow.
+
+Uso:
+    python -m benchmarks.preprocess [--sizes 1024,2048,4096] [--max-edge 1536] [--format keep]
+                                    [--workers 2] [--concurrency 8]
+
+Para cada tamaño y formato de origen (JPEG, PNG, WebP) genera una imagen
+sintética y mide: leer cabeceras con `probe` frente a decodificar con Pillow,
+recodificar en el pool de procesos y los bytes antes/después. Al final lanza
+`--concurrency` recodificaciones a la vez mientras mide cuánto se retrasa el
+event loop (debería quedarse cerca de cero: el trabajo va en otros procesos).
+"""
+import argparse
+import asyncio
+import importlib.util
+import io
+import os
+import time
+from typing import List, Tuple
+
+
+def _image(size: int, fmt: str) -> bytes:
+    from PIL import Image
+
+    # Degradado con ruido: comprime como una foto, no como un color plano
+    base = Image.linear_gradient("L").resize((size, size * 3 // 4)).convert("RGB")
+    noise = Image.effect_noise(base.size, 40).convert("RGB")
+    im = Image.blend(base, noise, 0.3)
+    out = io.BytesIO()
+    im.save(out, format=fmt.upper(), **({"quality": 92} if fmt != "png" else {}))
+    return out.getvalue()
+
+
+def _per_call_us(fn, n: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+async def _loop_lag(stop: asyncio.Event) -> List[float]:
+    lags = []
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(0.005)
+        lags.append((time.perf_counter() - t0 - 0.005) * 1000)
+    return lags
+
+
+async def _run(args) -> None:
+    from PIL import Image
+
+    from app import preprocess
+
+    preprocess.routes["bench"] = preprocess.RouteConfig("resize", args.max_edge, args.format)
+    await preprocess.startup()
+
+    print(f"{'origen':<14} {'bytes in':>10} {'bytes out':>10} {'ahorro':>7} {'probe µs':>9} {'decode ms':>10} {'pool ms':>8}")
+    samples: List[Tuple[str, bytes]] = []
+    for size in args.sizes:
+        for fmt in ("jpeg", "png", "webp"):
+            data = _image(size, fmt)
+            samples.append((fmt, data))
+            probe_us = _per_call_us(lambda: preprocess.probe_bytes(data), 2000)
+            t0 = time.perf_counter()
+            Image.open(io.BytesIO(data)).load()
+            decode_ms = (time.perf_counter() - t0) * 1000
+            t0 = time.perf_counter()
+            out, info = await preprocess.process_bytes("bench", data)
+            pool_ms = (time.perf_counter() - t0) * 1000
+            saved = 100 * (1 - len(out) / len(data))
+            label = f"{fmt} {size}px"
+            print(f"{label:<14} {len(data):>10} {len(out):>10} {saved:6.1f}% {probe_us:9.1f} {decode_ms:10.1f} {pool_ms:8.1f}")
+
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(_loop_lag(stop))
+    t0 = time.perf_counter()
+    big = [data for _, data in samples[-3:]] * max(1, args.concurrency // 3)
+    await asyncio.gather(*(preprocess.process_bytes("bench", data) for data in big))
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    lags = await lag_task
+    print(f"\n{len(big)} recodificaciones concurrentes ({args.workers} procesos): {elapsed * 1000:.0f} ms, "
+          f"retraso máx. del event loop {max(lags):.1f} ms")
+    await preprocess.shutdown()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1024,2048,4096")
+    parser.add_argument("--max-edge", type=int, default=1536)
+    parser.add_argument("--format", choices=["keep", "png", "jpeg", "webp"], default="keep")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    args.sizes = [int(s) for s in args.sizes.split(",")]
+
+    if importlib.util.find_spec("PIL") is None:
+        raise SystemExit("Este benchmark necesita Pillow: pip install pillow")
+    # Antes de importar app.preprocess, que lee la variable al cargarse
+    os.environ["PREPROCESS_WORKERS"] = str(args.workers)
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Transporte WebSocket frente a REST para /runware/generate, contra stand-ins locales.
+
+Uso:
+    python -m benchmarks.runware_ws [--requests 200] [--concurrency 10] [--latency 0.02]
+
+El stand-in WebSocket imita el protocolo de Runware (autenticación, ping y
+`imageInference` emparejado por taskUUID); el REST responde en RUNWARE_ENDPOINT.
+Ambos tardan `--latency` segundos por tarea y apuntan a la misma imagen local.
+"""
+import argparse
+import asyncio
+import json
+import os
+import ssl
+import tempfile
+import threading
+import time
+import uuid
+
+from benchmarks._common import free_port, self_signed_cert, serve, summary
+
+TLS = self_signed_cert()
+WS_PORT = free_port()
+os.environ.setdefault("RUNWARE_API_KEY", "bench")
+os.environ.setdefault("IMAGE_OUTPUT_DIR", tempfile.mkdtemp(prefix="bench_runware_"))
+os.environ.setdefault("IMAGE_INDEX_PATH", os.environ["IMAGE_OUTPUT_DIR"] + ".sqlite3")
+os.environ.setdefault("HTTP_PREWARM", "false")
+os.environ["RUNWARE_WS_ENABLED"] = "true"
+os.environ["RUNWARE_WS_URL"] = f"{'wss' if TLS else 'ws'}://127.0.0.1:{WS_PORT}"
+
+import httpx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+from websockets.asyncio.server import serve as ws_serve
+
+from app.main import app
+from app.providers import runware_provider
+
+LATENCY = 0.02
+IMAGE_BASE = {"url": ""}
+
+
+def _result(task: dict) -> dict:
+    return {
+        "taskType": "imageInference",
+        "taskUUID": task["taskUUID"],
+        "imageUUID": str(uuid.uuid4()),
+        "imageURL": f"{IMAGE_BASE['url']}/img/{task['taskUUID']}.png",
+    }
+
+
+async def _rest_generate(request: Request):
+    tasks = await request.json()
+    await asyncio.sleep(LATENCY)
+    return JSONResponse({"data": [_result(t) for t in tasks]})
+
+
+async def _image(request: Request):
+    return Response(b"\x89PNG" + b"\0" * 1024, media_type="image/png")
+
+
+rest_standin = Starlette(routes=[
+    Route("/v1/generate", _rest_generate, methods=["POST", "HEAD"]),
+    Route("/img/{name}", _image),
+])
+
+
+async def _ws_handler(ws):
+    async def infer(task):
+        await asyncio.sleep(LATENCY)
+        await ws.send(json.dumps({"data": [_result(task)]}))
+
+    async for raw in ws:
+        for task in json.loads(raw):
+            kind = task.get("taskType")
+            if kind == "authentication":
+                await ws.send(json.dumps({"data": [{"taskType": "authentication", "connectionSessionUUID": str(uuid.uuid4())}]}))
+            elif kind == "ping":
+                await ws.send(json.dumps({"data": [{"taskType": "ping", "pong": True}]}))
+            elif kind == "imageInference":
+                asyncio.get_running_loop().create_task(infer(task))
+
+
+def _run_ws_standin(started: threading.Event) -> None:
+    async def main():
+        ctx = None
+        if TLS:
+            ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            ctx.load_cert_chain(*TLS)
+        async with ws_serve(_ws_handler, "127.0.0.1", WS_PORT, ssl=ctx):
+            started.set()
+            await asyncio.Future()
+
+    asyncio.run(main())
+
+
+async def _load(api: str, n: int, concurrency: int) -> list:
+    sem = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(timeout=60) as client:
+        async def one(i):
+            async with sem:
+                t0 = time.perf_counter()
+                # Prompts distintos para que no intervenga la coalescencia single-flight
+                r = await client.post(f"{api}/runware/generate", json={"prompt": f"bench {i} {uuid.uuid4()}"})
+                r.raise_for_status()
+                return time.perf_counter() - t0
+
+        return await asyncio.gather(*(one(i) for i in range(n)))
+
+
+def main() -> None:
+    global LATENCY
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=LATENCY)
+    args = parser.parse_args()
+    LATENCY = args.latency
+
+    started = threading.Event()
+    threading.Thread(target=_run_ws_standin, args=(started,), daemon=True).start()
+    started.wait()
+
+    with serve(rest_standin, tls=TLS) as rest, serve(app) as api:
+        IMAGE_BASE["url"] = rest
+        runware_provider.RUNWARE_ENDPOINT = f"{rest}/v1/generate"
+        pool = runware_provider.ws_pool
+        print(f"WebSocket listo: {bool(pool and pool.ready)}  ({os.environ['RUNWARE_WS_URL']})")
+        for mode in ("rest", "websocket"):
+            runware_provider.ws_pool = pool if mode == "websocket" else None
+            samples = asyncio.run(_load(api, args.requests, args.concurrency))
+            print(f"{mode:9s} {summary(samples)}")
+        runware_provider.ws_pool = pool
+
+
+if __name__ == "__main__":
+    main()
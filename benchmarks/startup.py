@@ -0,0 +1,110 @@
+"""Arranque en frío y coste de crear el cliente de OpenAI.
+
+Uso:
+    python -m benchmarks.startup [--runs 5] [--budget-ms 800] [--clients 200]
+
+1. `python -X importtime -c "import app.main"` (mediana de `--runs`) y los paquetes
+   de primer nivel más caros. Sale con código 1 si la mediana supera `--budget-ms`.
+2. Tiempo desde lanzar uvicorn hasta el primer `/ping` con 200.
+3. Crear un `OpenAI(...)` por petición frente al cliente cacheado por API key.
+"""
+import argparse
+import re
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+import httpx
+
+from benchmarks._common import free_port, spawn
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def _importtime() -> Tuple[float, Dict[str, float]]:
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.main"], capture_output=True, text=True, check=True)
+    total = 0.0
+    packages: Dict[str, float] = {}
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if not m:
+            continue
+        cumulative_ms = int(m.group(2)) / 1000
+        name = m.group(4)
+        if name == "app.main":
+            total = cumulative_ms
+        elif "." not in name:
+            packages[name] = max(packages.get(name, 0.0), cumulative_ms)
+    return total, packages
+
+
+def _cold_start() -> float:
+    port = free_port()
+    t0 = time.perf_counter()
+    with spawn(["-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+               env={"HTTP_PREWARM": "false"}):
+        while True:
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/ping", timeout=1.0).status_code == 200:
+                    return (time.perf_counter() - t0) * 1000
+            except httpx.HTTPError:
+                time.sleep(0.01)
+
+
+def _clients(n: int) -> List[str]:
+    t0 = time.perf_counter()
+    from openai import OpenAI
+    sdk_import = (time.perf_counter() - t0) * 1000
+
+    from app.providers.openai_provider import _client_for
+
+    t0 = time.perf_counter()
+    for _ in range(n):
+        OpenAI(api_key="bench", timeout=120)
+    per_request = (time.perf_counter() - t0) / n * 1e6
+
+    _client_for("bench", None, 120.0)
+    t0 = time.perf_counter()
+    for _ in range(n):
+        _client_for("bench", None, 120.0)
+    cached = (time.perf_counter() - t0) / n * 1e6
+    return [
+        f"import del SDK (primera llamada): {sdk_import:8.1f} ms",
+        f"OpenAI(...) por petición:         {per_request:8.1f} µs",
+        f"cliente cacheado por API key:     {cached:8.1f} µs",
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=800.0)
+    parser.add_argument("--clients", type=int, default=200)
+    args = parser.parse_args()
+
+    totals = []
+    packages: Dict[str, float] = {}
+    for _ in range(args.runs):
+        total, packages = _importtime()
+        totals.append(total)
+    median = statistics.median(totals)
+    print(f"import app.main: mediana={median:7.1f} ms  (min={min(totals):.1f}  max={max(totals):.1f}, n={args.runs})")
+    for name, ms in sorted(packages.items(), key=lambda kv: -kv[1])[:8]:
+        print(f"  {name:<20} {ms:7.1f} ms")
+    print(f"  openai cargado al arrancar: {'sí' if 'openai' in packages else 'no'}")
+
+    starts = [_cold_start() for _ in range(min(args.runs, 3))]
+    print(f"uvicorn hasta el primer /ping: mediana={statistics.median(starts):7.1f} ms")
+
+    for line in _clients(args.clients):
+        print(line)
+
+    if median > args.budget_ms:
+        print(f"FUERA DE PRESUPUESTO: {median:.1f} ms > {args.budget_ms:.1f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
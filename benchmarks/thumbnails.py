@@ -0,0 +1,85 @@
+"""Miniaturas (app/thumbnails.py): bytes por página de galería y coste de generarlas. Requiere Pillow.
+
+Uso:
+    python -m benchmarks.thumbnails [--images 24] [--size 1024] [--width 256] [--formats webp,avif]
+
+Guarda `--images` imágenes sintéticas en un almacén temporal y compara lo que
+pesa una página de galería sirviendo los originales frente a las miniaturas
+de cada formato. Después mide por vista: miniatura en frío (decodificar y
+recodificar en el pool) frente a en caliente (solo buscar en la caché LRU).
+"""
+import argparse
+import asyncio
+import importlib.util
+import io
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+
+def _image(size: int, seed: int) -> bytes:
+    from PIL import Image
+
+    # Degradado con ruido: comprime como una foto, no como un color plano
+    base = Image.linear_gradient("L").rotate(seed * 15).resize((size, size)).convert("RGB")
+    noise = Image.effect_noise(base.size, 20 + seed % 10).convert("RGB")
+    out = io.BytesIO()
+    Image.blend(base, noise, 0.25).save(out, format="PNG")
+    return out.getvalue()
+
+
+async def _run(args) -> None:
+    from app import thumbnails
+    from app.storage import ImageMeta, store
+
+    formats = await thumbnails.ensure_ready()
+    stored = [store.put_bytes(_image(args.size, i), ImageMeta("bench", f"imagen {i}")) for i in range(args.images)]
+    originals = sum(s.bytes for s in stored)
+    print(f"página de {args.images} imágenes {args.size}px, miniatura {args.width}px")
+    print(f"  originales (PNG): {originals / 1024:10.0f} KiB")
+
+    for fmt in formats:
+        cold = []
+        for s in stored:
+            t0 = time.perf_counter()
+            await thumbnails.get(s.sha256, s.path, args.width, fmt)
+            cold.append((time.perf_counter() - t0) * 1000)
+        warm = []
+        for s in stored:
+            t0 = time.perf_counter()
+            _, hit = await thumbnails.get(s.sha256, s.path, args.width, fmt)
+            warm.append((time.perf_counter() - t0) * 1000)
+            assert hit
+        total = sum(thumbnails.thumb_path(s.sha256, args.width, fmt).stat().st_size for s in stored)
+        print(f"  miniaturas {fmt:<5}: {total / 1024:10.0f} KiB ({100 * total / originals:.1f}% del original), "
+              f"frío p50 {statistics.median(cold):.1f} ms, caliente p50 {statistics.median(warm) * 1000:.0f} µs")
+    await thumbnails.shutdown()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=24)
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--width", type=int, default=256)
+    parser.add_argument("--formats", default="webp,avif")
+    args = parser.parse_args()
+
+    if importlib.util.find_spec("PIL") is None:
+        raise SystemExit("Este benchmark necesita Pillow: pip install pillow")
+    # Antes de importar app.*, que leen las variables al cargarse
+    tmp = Path(tempfile.mkdtemp(prefix="bench_thumbnails_"))
+    os.environ.update(
+        IMAGE_OUTPUT_DIR=str(tmp / "generated"),
+        IMAGE_INDEX_PATH=str(tmp / "generated.sqlite3"),
+        THUMBNAIL_DIR=str(tmp / "thumbnails"),
+        THUMBNAIL_WIDTHS=str(args.width),
+        THUMBNAIL_FORMATS=args.formats,
+        THUMBNAIL_EAGER="false",
+    )
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
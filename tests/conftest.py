@@ -0,0 +1,13 @@
+import os
+import tempfile
+
+# La configuración se lee al importar los módulos: el entorno de pruebas va antes que `app`
+_tmp = tempfile.mkdtemp(prefix="fastapi-rest-tests-")
+os.environ.update(
+    {
+        "IMAGE_OUTPUT_DIR": os.path.join(_tmp, "generated"),
+        "IMAGE_INDEX_PATH": os.path.join(_tmp, "generated.sqlite3"),
+        "THUMBNAIL_DIR": os.path.join(_tmp, "thumbnails"),
+        "THUMBNAIL_EAGER": "false",
+    }
+)
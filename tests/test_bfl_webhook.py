@@ -0,0 +1,162 @@
+import asyncio
+import hashlib
+import hmac
+import json
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app import http_clients
+from app.bfl_jobs import READY, JobManager
+from app.providers import bfl_provider
+from app.routers import bfl as bfl_routes
+
+POLLING_URL = "https://bfl.test/v1/get_result?id=req-1"
+
+
+class FakeBFL:
+    """Polling de BFL simulado: responde `statuses` en orden y repite el último."""
+
+    def __init__(self, *statuses: str):
+        self.statuses = list(statuses)
+        self.polls = 0
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        status = self.statuses[min(self.polls, len(self.statuses) - 1)]
+        self.polls += 1
+        body = {"id": "req-1", "status": status}
+        if status == "Ready":
+            body["result"] = {"sample": "https://bfl.test/polled.png"}
+        return httpx.Response(200, json=body)
+
+
+@pytest.fixture(autouse=True)
+def webhook_secret(monkeypatch):
+    monkeypatch.setattr(bfl_provider, "BFL_WEBHOOK_SECRET", "secreto-compartido")
+
+
+@pytest.fixture
+def bfl(monkeypatch):
+    fake = FakeBFL("Pending")
+    monkeypatch.setitem(http_clients._clients, "bfl", httpx.AsyncClient(transport=httpx.MockTransport(fake.handler)))
+    return fake
+
+
+def _run(coro):
+    return asyncio.run(asyncio.wait_for(coro, timeout=10))
+
+
+async def _start(manager: JobManager, webhook: bool):
+    finalized = []
+
+    async def submit():
+        return POLLING_URL, "req-1"
+
+    async def finalize(url: str):
+        finalized.append(url)
+        return {"url": url}
+
+    job = manager.create(submit=submit, poll_headers={}, finalize=finalize, webhook=webhook)
+    # Hasta que el submit devuelve el request_id el webhook no puede asociarse
+    while job.request_id is None:
+        await asyncio.sleep(0)
+    return job, finalized
+
+
+def _signed(body: dict, secret: str = None):
+    raw = json.dumps(body).encode()
+    digest = hmac.new((secret or bfl_provider.BFL_WEBHOOK_SECRET).encode(), raw, hashlib.sha256).hexdigest()
+    return raw, {"Content-Type": "application/json", "X-Webhook-Signature": f"sha256={digest}"}
+
+
+def _client(manager: JobManager, monkeypatch) -> httpx.AsyncClient:
+    monkeypatch.setattr(bfl_routes, "jobs", manager)
+    app = FastAPI()
+    app.include_router(bfl_routes.router)
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+def test_webhook_with_valid_hmac_completes_job_without_polling(bfl, monkeypatch):
+    async def scenario():
+        manager = JobManager(min_interval=0.01, webhook_fallback=30)
+        job, finalized = await _start(manager, webhook=True)
+        raw, headers = _signed({"id": "req-1", "status": "Ready", "result": {"sample": "https://bfl.test/hook.png"}})
+        async with _client(manager, monkeypatch) as client:
+            r = await client.post("/bfl/webhook", content=raw, headers=headers)
+        assert r.status_code == 200
+        assert r.json() == {"received": True, "matched": True}
+        assert await job.wait() == {"url": "https://bfl.test/hook.png"}
+        await manager.shutdown()
+        return finalized
+
+    assert _run(scenario()) == ["https://bfl.test/hook.png"]
+    assert bfl.polls == 0
+
+
+@pytest.mark.parametrize("headers", [{}, {"X-Webhook-Signature": "sha256=" + "0" * 64}, {"X-Webhook-Secret": "nope"}])
+def test_webhook_with_bad_signature_is_rejected(headers, monkeypatch):
+    async def scenario():
+        manager = JobManager()
+        async with _client(manager, monkeypatch) as client:
+            r = await client.post("/bfl/webhook", json={"id": "req-1", "status": "Ready"}, headers=headers)
+        return r, manager
+
+    r, manager = _run(scenario())
+    assert r.status_code == 401
+    assert not manager._early
+
+
+def test_webhook_signed_with_other_secret_is_rejected(monkeypatch):
+    async def scenario():
+        raw, headers = _signed({"id": "req-1", "status": "Ready"}, secret="otro-secreto")
+        async with _client(JobManager(), monkeypatch) as client:
+            return await client.post("/bfl/webhook", content=raw, headers=headers)
+
+    assert _run(scenario()).status_code == 401
+
+
+def test_webhook_after_polling_finished_is_ignored(bfl):
+    bfl.statuses = ["Pending", "Ready"]
+
+    async def scenario():
+        manager = JobManager(min_interval=0.01)
+        job, finalized = await _start(manager, webhook=False)
+        result = await job.wait()
+        # Llega tarde y con otro resultado: el polling ya ganó
+        matched = manager.handle_webhook("req-1", {"id": "req-1", "status": "Failed"})
+        await asyncio.sleep(0.05)
+        await manager.shutdown()
+        return job, result, matched, finalized
+
+    job, result, matched, finalized = _run(scenario())
+    assert matched is True
+    assert job.status == READY and job.error is None
+    assert result == {"url": "https://bfl.test/polled.png"}
+    assert finalized == ["https://bfl.test/polled.png"]
+
+
+def test_polling_fallback_when_webhook_never_arrives(bfl):
+    bfl.statuses = ["Ready"]
+
+    async def scenario():
+        manager = JobManager(min_interval=0.01, webhook_fallback=0.05)
+        job, _ = await _start(manager, webhook=True)
+        result = await job.wait()
+        await manager.shutdown()
+        return result
+
+    assert _run(scenario()) == {"url": "https://bfl.test/polled.png"}
+    assert bfl.polls == 1
+
+
+def test_webhook_without_configured_secret_is_rejected(monkeypatch):
+    raw, headers = _signed({"id": "req-1", "status": "Ready"})
+    monkeypatch.setattr(bfl_provider, "BFL_WEBHOOK_SECRET", None)
+
+    async def scenario():
+        async with _client(JobManager(), monkeypatch) as client:
+            return await client.post("/bfl/webhook", content=raw, headers={**headers, "X-Webhook-Secret": ""})
+
+    assert _run(scenario()).status_code == 401
+
@@ -0,0 +1,127 @@
+import base64
+import json
+from typing import List, Tuple
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.providers import openai_provider
+from app.routers import openai_image
+from app.settings import settings
+from app.storage import store
+
+IMAGE_B64 = base64.b64encode(b"\x89PNG\r\n\x1a\nfinal").decode()
+PARTIAL_B64 = base64.b64encode(b"\x89PNG\r\n\x1a\npartial").decode()
+BODY = {"prompt": "un gato", "size": "1024x1024", "quality": "low"}
+
+
+def _upstream_event(kind: str, **fields) -> str:
+    event = {"type": f"image_generation.{kind}", "created_at": 0, "background": "transparent",
+             "output_format": "png", "quality": "low", "size": "1024x1024", **fields}
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+def _parse_sse(text: str) -> List[Tuple[str, dict]]:
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """gpt-image-1 simulado: devuelve en SSE los eventos que se pongan en `upstream.events`."""
+
+    class Upstream:
+        events: List[str] = []
+        requests: List[dict] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content)
+        Upstream.requests.append(payload)
+        if not payload.get("stream"):
+            return httpx.Response(200, json={"created": 0, "data": [{"b64_json": IMAGE_B64}]})
+        body = "".join(Upstream.events).encode()
+        return httpx.Response(200, content=body, headers={"content-type": "text/event-stream"})
+
+    def client_for(api_key, base_url, timeout):
+        from openai import OpenAI
+
+        return OpenAI(api_key=api_key, base_url="http://openai.test/v1", max_retries=0,
+                      http_client=httpx.Client(transport=httpx.MockTransport(handler)))
+
+    monkeypatch.setattr(settings, "openai_api_key", "sk-test")
+    monkeypatch.setattr(openai_provider, "_client_for", client_for)
+    return Upstream
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(openai_image.router)
+    return TestClient(app)
+
+
+def test_stream_relays_partials_then_done(upstream, client):
+    upstream.events = [
+        _upstream_event("partial_image", partial_image_index=0, b64_json=PARTIAL_B64),
+        _upstream_event("partial_image", partial_image_index=1, b64_json=PARTIAL_B64),
+        _upstream_event("completed", b64_json=IMAGE_B64,
+                        usage={"input_tokens": 1, "output_tokens": 1, "total_tokens": 2,
+                               "input_tokens_details": {"image_tokens": 0, "text_tokens": 1}}),
+    ]
+    r = client.post("/image/generate/stream", json={**BODY, "partial_images": 2})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/event-stream")
+    assert r.headers["cache-control"] == "no-cache"
+    assert r.text.endswith("\n\n")
+
+    events = _parse_sse(r.text)
+    assert [kind for kind, _ in events] == ["partial", "partial", "done"]
+    assert [data["index"] for _, data in events[:2]] == [0, 1]
+    assert events[0][1] == {"index": 0, "image_b64": PARTIAL_B64, "content_type": "image/png"}
+
+    done = events[-1][1]
+    assert done["image_b64"] == IMAGE_B64
+    item = store.get(done["generation_id"])
+    assert item["status"] == "ready"
+    assert done["url"] == item["url"]
+    assert upstream.requests[0]["stream"] is True
+    assert upstream.requests[0]["partial_images"] == 2
+
+
+def test_stream_without_final_image_ends_with_error_event(upstream, client):
+    upstream.events = [_upstream_event("partial_image", partial_image_index=0, b64_json=PARTIAL_B64)]
+    r = client.post("/image/generate/stream", json={**BODY, "partial_images": 1})
+    assert r.status_code == 200
+
+    events = _parse_sse(r.text)
+    assert [kind for kind, _ in events] == ["partial", "error"]
+    assert "sin enviar la imagen final" in events[-1][1]["error"]
+
+
+def test_stream_with_undecodable_final_image_ends_with_error_event(upstream, client):
+    upstream.events = [_upstream_event("completed", b64_json="%%% no es base64 %%%",
+                                       usage={"input_tokens": 1, "output_tokens": 1, "total_tokens": 2,
+                                              "input_tokens_details": {"image_tokens": 0, "text_tokens": 1}})]
+    r = client.post("/image/generate/stream", json={**BODY, "partial_images": 0})
+
+    assert _parse_sse(r.text) == [("error", {"error": "Error al decodificar la imagen base64"})]
+
+
+def test_stream_requires_api_key(monkeypatch, client):
+    monkeypatch.setattr(settings, "openai_api_key", None)
+    r = client.post("/image/generate/stream", json=BODY)
+    assert r.status_code == 500
+
+
+def test_generate_download_uses_readable_filename(upstream, client):
+    r = client.post("/image/generate?download=true", json={**BODY, "prompt": "un gato con sombrero"})
+    assert r.status_code == 200
+    disposition = r.headers["content-disposition"]
+    assert disposition.startswith("attachment;")
+    assert 'filename="image_un-gato-con-sombrero_' in disposition
+    assert disposition.endswith('.png"')
@@ -0,0 +1,22 @@
+import pytest
+
+from app.metrics import Counter, Histogram, Metric
+
+
+def test_metric_is_abstract():
+    with pytest.raises(TypeError):
+        Metric("m", "sin muestras")
+
+
+def test_counter_and_histogram_render():
+    counter = Counter("test_requests_total", "Peticiones", ("route",))
+    counter.inc(route="/a")
+    counter.inc(2, route="/a")
+    assert "# TYPE test_requests_total counter" in counter.render()
+    assert 'test_requests_total{route="/a"} 3' in counter.render()
+
+    histogram = Histogram("test_duration_seconds", "Duración")
+    histogram.observe(0.2)
+    out = histogram.render()
+    assert "test_duration_seconds_count 1" in out
+    assert 'test_duration_seconds_bucket{le="+Inf"} 1' in out
@@ -0,0 +1,53 @@
+import asyncio
+import io
+import tempfile
+
+import pytest
+from fastapi import HTTPException
+
+from app import preprocess
+from app.preprocess import RouteConfig
+
+
+def _png(width: int, height: int) -> bytes:
+    from PIL import Image
+
+    buf = io.BytesIO()
+    Image.new("RGB", (width, height), (10, 120, 200)).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _upload(data: bytes) -> tempfile.SpooledTemporaryFile:
+    # Como los UploadFile grandes de FastAPI: volcado a disco
+    f = tempfile.SpooledTemporaryFile(max_size=16)
+    f.write(data)
+    f.seek(0)
+    return f
+
+
+@pytest.fixture
+def route(monkeypatch):
+    def configure(mode: str, max_edge: int = 256):
+        monkeypatch.setitem(preprocess.routes, "openai", RouteConfig(mode, max_edge, "keep"))
+
+    yield configure
+    asyncio.run(preprocess.shutdown())
+
+
+@pytest.mark.skipif(not preprocess.HAS_PILLOW, reason="requiere Pillow")
+def test_process_upload_passthrough_and_resize(route):
+    route("resize", max_edge=256)
+    small = _upload(_png(200, 100))
+    assert asyncio.run(preprocess.process_upload("openai", small)) is None
+    assert small.tell() == 0
+
+    data, info = asyncio.run(preprocess.process_upload("openai", _upload(_png(1024, 512))))
+    assert (info.format, info.width, info.height) == ("png", 256, 128)
+    assert preprocess.probe_bytes(data) == info
+
+
+def test_process_upload_rejects_unknown_format(route):
+    route("validate")
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(preprocess.process_upload("openai", _upload(b"definitely not an image" * 4)))
+    assert exc.value.status_code == 400
@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.providers.base import ImageProvider, ImageResult
+
+
+class FakeProvider(ImageProvider):
+    name = "fake"
+
+    def __init__(self, error=None):
+        super().__init__()
+        self.error = error
+
+    async def _generate(self, prompt, width, height, quality, model, background_save):
+        if self.error is not None:
+            raise self.error
+        return ImageResult(self.name, None, remote_url="https://example.test/x.png")
+
+
+def test_image_provider_is_abstract():
+    with pytest.raises(TypeError):
+        ImageProvider()
+
+    class Incomplete(ImageProvider):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_generate_feeds_stats_only_with_provider_failures():
+    provider = FakeProvider()
+    asyncio.run(provider.generate("x", 64, 64))
+    assert provider.stats.successes == 1
+
+    provider.error = HTTPException(status_code=400, detail="prompt vacío")
+    with pytest.raises(HTTPException):
+        asyncio.run(provider.generate("x", 64, 64))
+    assert provider.stats.failures == 0
+
+    provider.error = HTTPException(status_code=503, detail="caído")
+    with pytest.raises(HTTPException):
+        asyncio.run(provider.generate("x", 64, 64))
+    assert provider.stats.failures == 1
+    assert provider.stats.last_error == "caído"
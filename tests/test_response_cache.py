@@ -0,0 +1,47 @@
+import asyncio
+import time
+
+import pytest
+
+from app.response_cache import CacheTier, MemoryTier, ResponseCache, SqliteTier
+
+
+def test_sqlite_tier_expires_and_purges_periodically(tmp_path):
+    tier = SqliteTier(str(tmp_path / "cache.sqlite3"), ttl=0.05, purge_interval=3600)
+    tier.set("a", b"1")
+    assert tier.get("a") == b"1"
+
+    time.sleep(0.1)
+    assert tier.get("a") is None
+    # Dentro del intervalo no se purga: la caducada sigue en la tabla
+    tier.set("b", b"2")
+    assert tier.stats()["entries"] == 2
+
+    tier._next_purge = 0.0
+    tier.set("c", b"3")
+    assert tier.stats()["purged"] == 1
+
+
+def test_sqlite_tier_indexes_expires_at(tmp_path):
+    tier = SqliteTier(str(tmp_path / "cache.sqlite3"), ttl=60)
+    plan = tier._conn.execute("EXPLAIN QUERY PLAN DELETE FROM cache WHERE expires_at < 0").fetchall()
+    assert any("cache_expires_at" in row[-1] for row in plan)
+
+
+def test_cache_tier_is_abstract():
+    class GetOnly(CacheTier):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        GetOnly()
+
+
+def test_response_cache_promotes_hits_to_upper_tiers(tmp_path):
+    memory = MemoryTier(max_bytes=1024, ttl=60)
+    cache = ResponseCache([memory, SqliteTier(str(tmp_path / "cache.sqlite3"), ttl=60)])
+    cache.tiers[1].set("k", b"v")
+
+    assert asyncio.run(cache.get("k")) == b"v"
+    assert memory.get("k") == b"v"
+    assert cache.stats()["tiers"]["sqlite"]["hits"] == 1
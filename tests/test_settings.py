@@ -0,0 +1,13 @@
+from app.settings import env_bool, env_float, env_int, env_str
+
+
+def test_env_helpers(monkeypatch):
+    monkeypatch.setenv("T_BOOL", " On ")
+    monkeypatch.setenv("T_INT", "nope")
+    monkeypatch.setenv("T_FLOAT", "2.5")
+    monkeypatch.setenv("T_STR", "")
+    assert env_bool("T_BOOL", False) is True
+    assert env_bool("T_MISSING", True) is True
+    assert env_int("T_INT", 7) == 7
+    assert env_float("T_FLOAT", 0.0) == 2.5
+    assert env_str("T_STR", "default") == "default"
@@ -0,0 +1,31 @@
+import inspect
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.routers import gemini, images, stats
+
+# Handlers de estadísticas: async para no ocupar (ni esperar) el threadpool
+STATS_PATHS = ["/images/providers", "/gemini/cache/stats", "/gemini/cache/context"]
+
+
+@pytest.fixture
+def app():
+    app = FastAPI()
+    for module in (stats, images, gemini):
+        app.include_router(module.router)
+    return app
+
+
+def test_stats_handlers_are_async():
+    endpoints = {route.path: route.endpoint for module in (stats, images, gemini) for route in module.router.routes}
+    paths = STATS_PATHS + [path for path in endpoints if path.startswith("/stats/")]
+    for path in paths:
+        assert inspect.iscoroutinefunction(endpoints[path]), path
+
+
+def test_stats_handlers_respond(app):
+    client = TestClient(app)
+    for path in STATS_PATHS:
+        assert client.get(path).status_code == 200, path
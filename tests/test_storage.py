@@ -0,0 +1,19 @@
+from app.storage import ImageMeta, download_name, store
+
+
+def test_download_name_comes_from_metadata_not_hash():
+    stored = store.put_bytes(b"\x89PNG\r\n\x1a\ndownload", ImageMeta("openai", "Un gato astronauta, óleo", label="edit"))
+    item = store.get(stored.id)
+    assert download_name(item) == f"edit_Un-gato-astronauta-leo_{stored.id}.png"
+    assert stored.sha256 not in download_name(item)
+
+
+def test_download_name_without_prompt_or_label():
+    stored = store.put_bytes(b"\x89PNG\r\n\x1a\nno-prompt", ImageMeta("runware"))
+    assert download_name(store.get(stored.id)) == f"runware_{stored.id}.png"
+
+
+def test_temp_files_live_outside_the_served_directory():
+    tmp = store.temp_path()
+    assert store.root.resolve() not in tmp.parents
+    assert tmp.parent.parent == store.root.resolve().parent
@@ -0,0 +1,57 @@
+import io
+from contextlib import asynccontextmanager
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import thumbnails
+from app.routers import thumbnails as thumbnail_routes
+from app.storage import ImageMeta, store
+
+pytestmark = pytest.mark.skipif(not thumbnails.HAS_PILLOW, reason="requiere Pillow")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    await thumbnails.shutdown()
+
+
+@pytest.fixture
+def client():
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(thumbnail_routes.router)
+    with TestClient(app, follow_redirects=False) as c:
+        yield c
+
+
+def _png() -> bytes:
+    from PIL import Image
+
+    buf = io.BytesIO()
+    Image.new("RGB", (600, 400), (200, 30, 30)).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_thumbnail_rendered_and_cached(client):
+    stored = store.put_bytes(_png(), ImageMeta(provider="test"))
+    r = client.get(f"/generated/{stored.id}/thumb?w=200", headers={"Accept": "image/webp"})
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "image/webp"
+    assert "immutable" in r.headers["cache-control"]
+
+    r = client.get(f"/generated/{stored.id}/thumb?w=200", headers={"If-None-Match": r.headers["etag"]})
+    assert r.status_code == 304
+
+
+def test_undecodable_original_redirects(client):
+    # PNG truncado: el índice lo da por imagen, pero Pillow no puede decodificarlo
+    stored = store.put_bytes(_png()[:64], ImageMeta(provider="test"))
+    r = client.get(f"/generated/{stored.id}/thumb")
+    assert r.status_code == 307
+    assert r.headers["location"] == store.get(stored.id)["url"]
+
+
+def test_missing_generation(client):
+    assert client.get("/generated/999999/thumb").status_code == 404